@@ -10,7 +10,7 @@ from lib import sc2
 from main.battle_net import LAST_AVAILABLE_SEASON
 from main.models import RankingData, Cache, Ranking, Team, Player, Ladder, Season, Version, Region, League, \
     Mode, Race, Enums
-from main.models import RankingStats
+from main.models import RankingStats, ClanTeam, PlayerTeam
 
 logger = getLogger('django')
 sc2.set_logger(logger)
@@ -163,6 +163,16 @@ class Db(object):
 
         self.team = Team(**kwargs)
         self.team.save()
+
+        # Keep player teams and clan roster like the c++ code does.
+        for member in (self.team.member0, self.team.member1, self.team.member2, self.team.member3):
+            if member:
+                PlayerTeam.objects.create(player=member, team=self.team)
+
+        member0 = self.team.member0
+        if self.team.mode == Mode.TEAM_1V1 and member0 and member0.tag and self.team.season_id:
+            ClanTeam.objects.create(team=self.team, season_id=self.team.season_id, tag=member0.tag, clan=member0.clan)
+
         return self.team
 
     def create_teams(self, count=1, **kwargs):
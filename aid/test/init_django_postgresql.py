@@ -15,5 +15,6 @@ if not settings.configured:
 
     test_settings = site_settings()
     test_settings['DATABASES']['default']['NAME'] = 'rankedftw-' + uniqueid(6)
+    test_settings['CACHES']['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
     settings.configure(**test_settings)
     setup()
@@ -12,5 +12,6 @@ from common.settings import site_settings
 
 test_settings = site_settings()
 test_settings['DATABASES']['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+test_settings['CACHES']['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
 settings.configure(**test_settings)
 setup()
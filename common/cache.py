@@ -1,6 +1,34 @@
+import hashlib
+import os
 from functools import wraps
+from os.path import join
+from time import time, sleep, monotonic
 from django.conf import settings
 from django.core.cache import cache
+from django.db.models import F
+
+
+# Expired values are kept this many seconds in the cache to be served while a new value is created.
+STALE_TIMEOUT = 3600
+
+# Max seconds a value creation is expected to take, the creation lock expires after this.
+LOCK_TIMEOUT = 30
+
+# Seconds between checks when waiting for another process to create a value.
+LOCK_POLL = 0.05
+
+# Add is not atomic for this backend (it checks then sets), lock files are used instead, see _add_lock.
+FILE_BASED_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+
+# Ranking data is saved (and the ranking generation bumped) about once a minute, ranking values are not used after that
+# so they expire soon after to not fill the cache with values of old generations.
+RANKING_VALUE_TIMEOUT = 120
+
+# Seconds the ranking generation is kept in the process before it is read from the database again.
+GENERATION_TIMEOUT = 1.0
+
+# Ranking generation kept in the process, (expires, generation).
+_generation = (0.0, None)
 
 
 def caching(func):
@@ -32,15 +60,121 @@ def cache_control(cache_control):
     return decorator
 
 
-def cache_value(key, timeout, value_creator, *args, **kwargs):
-    """ Returns value if cache, othevise use value_creator with args and
-    kwargs callable to create a new value. """
-    
-    value = cache.get(key)
-    if value is not None:
-        return value
-
+def _create_value(key, timeout, stale_timeout, value_creator, args, kwargs):
     value = value_creator(*args, **kwargs)
-    cache.set(key, value, timeout)
+    cache.set(key, (time() + timeout, value), timeout + stale_timeout)
     return value
-    
+
+
+def _lock_filename(lock_key):
+    location = settings.CACHES['default']['LOCATION']
+    return join(location, hashlib.md5(lock_key.encode('utf-8')).hexdigest() + '.lock')
+
+
+def _add_lock(lock_key):
+    """ Take the creation lock, returns True if taken. For the file based cache the lock is a file created with O_EXCL
+    in the cache dir holding its expire time, an expired lock file is removed so it can be taken on next try. """
+    if settings.CACHES['default']['BACKEND'] != FILE_BASED_BACKEND:
+        return cache.add(lock_key, 1, LOCK_TIMEOUT)
+
+    filename = _lock_filename(lock_key)
+    os.makedirs(settings.CACHES['default']['LOCATION'], exist_ok=True)
+    try:
+        fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            with open(filename) as f:
+                expires = f.read()
+            # Empty if the owner did not write it yet.
+            if expires and float(expires) < time():
+                os.remove(filename)
+        except (FileNotFoundError, ValueError):
+            pass
+        return False
+
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(time() + LOCK_TIMEOUT))
+    return True
+
+
+def _delete_lock(lock_key):
+    if settings.CACHES['default']['BACKEND'] != FILE_BASED_BACKEND:
+        cache.delete(lock_key)
+        return
+
+    try:
+        os.remove(_lock_filename(lock_key))
+    except FileNotFoundError:
+        pass
+
+
+def _cache_value(key, timeout, stale_timeout, value_creator, args, kwargs):
+    lock_key = key + '__lock__'
+    deadline = time() + LOCK_TIMEOUT
+
+    while True:
+        entry = cache.get(key)
+        if entry is not None and entry[0] > time():
+            return entry[1]
+
+        if _add_lock(lock_key):
+            try:
+                # The value may have been created by someone else between get and add.
+                entry = cache.get(key)
+                if entry is not None and entry[0] > time():
+                    return entry[1]
+                return _create_value(key, timeout, stale_timeout, value_creator, args, kwargs)
+            finally:
+                _delete_lock(lock_key)
+
+        if entry is not None:
+            return entry[1]
+
+        if time() > deadline:
+            return _create_value(key, timeout, stale_timeout, value_creator, args, kwargs)
+
+        sleep(LOCK_POLL)
+
+
+def cache_value(key, timeout, value_creator, *args, **kwargs):
+    """ Returns value if cached, othevise use value_creator with args and kwargs callable to create a new value.
+
+    Creation is coalesced over all processes sharing the cache, only the one getting the lock creates the value. While
+    it does that the others get the expired value if there is one, otherwise they wait for the new value (at most
+    LOCK_TIMEOUT, then they create it themselves). """
+    return _cache_value(key, timeout, STALE_TIMEOUT, value_creator, args, kwargs)
+
+
+def ranking_generation():
+    """ Return the ranking generation, it is bumped when the server has reloaded saved ranking data, see
+    bump_ranking_generation. It is stored in the database so it only moves forward and can not be lost when the cache
+    is culled, but it is kept in the process for GENERATION_TIMEOUT to not query for every value. """
+    global _generation
+    expires, generation = _generation
+    if monotonic() < expires:
+        return generation
+
+    # Imported here since main.models uses this module.
+    from main.models import RankingGeneration
+    generation = RankingGeneration.objects.values_list('generation', flat=True).first() or 0
+    _generation = (monotonic() + GENERATION_TIMEOUT, generation)
+    return generation
+
+
+def bump_ranking_generation():
+    """ Bump the ranking generation making values cached with cache_ranking_value be created again (other processes
+    see it within GENERATION_TIMEOUT). Call when the server has reloaded saved ranking data, values created before
+    that may be from the old data. Returns the new generation. """
+    global _generation
+    from main.models import RankingGeneration
+    if not RankingGeneration.objects.update(generation=F('generation') + 1):
+        RankingGeneration.objects.create(generation=1)
+    _generation = (0.0, None)
+    return ranking_generation()
+
+
+def cache_ranking_value(key, value_creator, *args, **kwargs):
+    """ Like cache_value but for values based on ranking data, the key includes the ranking generation so the value
+    is created again when the ranking generation is bumped. Values of old generations are never used so they are not
+    kept stale and they expire after RANKING_VALUE_TIMEOUT. """
+    return _cache_value("%s@%d" % (key, ranking_generation()), RANKING_VALUE_TIMEOUT, 0, value_creator, args, kwargs)
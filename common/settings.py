@@ -28,6 +28,9 @@ def common_settings():
     config.get('DATA_DIR', default=join(config.INSTALL_DIR, 'data'))
     config.get('CONF_DIR', default=join(config.INSTALL_DIR, 'etc'))
     config.get('PID_DIR', default=join(config.INSTALL_DIR, 'run'))
+    config.get('CACHE_DIR', default=join(config.INSTALL_DIR, 'cache'))
+    config.get('EXPORT_DIR', default=join(config.DATA_DIR, 'export'))
+    config.get('PRERENDER_DIR', default=join(config.DATA_DIR, 'prerender'))
 
     config.get('DEBUG', env, local_py, default=not config.PROD)
     config.get('DB_DEBUG', default=False)
@@ -38,6 +41,16 @@ def common_settings():
     
     config.get('KEEP_API_DATA_DAYS', env, default="14")
 
+    # Cache shared between all processes (site workers and tasks) so values are only created once, in development a
+    # process local cache is enough.
+    if config.PROD:
+        default_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                         'LOCATION': config.CACHE_DIR,
+                         'OPTIONS': {'MAX_ENTRIES': 10000}}
+    else:
+        default_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    config.get('DEFAULT_CACHE', local_py, config_py, default=default_cache)
+
     #
     # Django settings.
     #
@@ -55,6 +68,7 @@ def common_settings():
                                                           'NAME': 'rankedftw',
                                                           'USER': environ.get('USER'),
                                                           'HOST': ''}))},
+        'CACHES': {'default': copy(config.DEFAULT_CACHE)},
     }
 
     if config.PROD and config.SECRET_KEY == DEV_SECRET_KEY:
@@ -185,3 +199,15 @@ def site_settings():
     )
 
     return settings
+
+
+def site_tasks_settings():
+    """ Site settings for tasks that render site pages, logging as tasks. """
+
+    settings = site_settings()
+
+    settings['LOGGING'] = \
+        logging_settings(log_filename=join(config.LOG_DIR, basename(sys.argv[0]).replace('.py', '.log')),
+                         log_stderr=True)
+
+    return settings
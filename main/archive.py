@@ -1,14 +1,16 @@
 import os
 import json
 import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from django.db import transaction
 from logging import getLogger
 from datetime import timedelta, date
 
 from common.settings import config
-from common.utils import utcnow, to_unix, iterate_query_chunked
-from main.battle_net import LAST_AVAILABLE_SEASON
+from common.utils import utcnow, to_unix
+from main.battle_net import LAST_AVAILABLE_SEASON, to_json_text
 from main.models import Cache, Ranking
 from common.logging import log_context
 
@@ -20,7 +22,197 @@ class BreakRun(Exception):
     pass
 
 
+def index_filename(filename):
+    """ The index file of an archive is stored next to it. """
+    if filename.endswith('.gz'):
+        filename = filename[:-3]
+    return filename + '.idx.gz'
+
+
+class ArchiveWriter(object):
+    """
+    Write an archive file, one json struct per line. The file is a gzip file with one gzip member per chunk of lines
+    that are compressed in parallel (zlib releases the GIL). If index_filename is set an index of the members (offset
+    and size in the file) and the caches (id, region, bid, type) in each member is written there on close, making
+    it possible to read a single cache without decompressing the whole file.
+    """
+
+    CHUNK_ROWS = 256
+    THREADS = 4
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, filename, index_filename=None):
+        self.file = open(filename, 'wb')
+        self.index_filename = index_filename
+        self.executor = ThreadPoolExecutor(max_workers=self.THREADS)
+        self.pending = deque()
+        self.lines = []
+        self.keys = []
+        self.offset = 0
+        self.members = []
+        self.caches = []
+        self.header = None
+
+    def write_header(self, struct):
+        """ Header is written as a separate member first in the file. """
+        self.header = struct
+        self.lines.append(json.dumps(struct, allow_nan=False).encode('utf-8'))
+        self.flush_chunk()
+
+    def write_cache(self, line, id, region, bid, type):
+        self.lines.append(line)
+        self.keys.append((id, region, bid, type))
+        if len(self.lines) >= self.CHUNK_ROWS:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        if not self.lines:
+            return
+        raw = b'\n'.join(self.lines) + b'\n'
+        self.pending.append((self.executor.submit(gzip.compress, raw, self.COMPRESS_LEVEL), self.keys))
+        self.lines = []
+        self.keys = []
+        # Limit memory by writing finished members when too many are in flight.
+        while len(self.pending) > self.THREADS * 2:
+            self.write_member()
+
+    def write_member(self):
+        future, keys = self.pending.popleft()
+        data = future.result()
+        self.file.write(data)
+        member = len(self.members)
+        self.members.append((self.offset, len(data)))
+        self.caches.extend((id, region, bid, type, member) for id, region, bid, type in keys)
+        self.offset += len(data)
+
+    def close(self):
+        try:
+            self.flush_chunk()
+            while self.pending:
+                self.write_member()
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+
+        if self.index_filename:
+            with gzip.open(self.index_filename, mode='wb') as file:
+                file.write(json.dumps(dict(version=1,
+                                           header=self.header,
+                                           members=self.members,
+                                           caches=self.caches)).encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown()
+            self.file.close()
+
+
+class ArchiveReader(object):
+    """
+    Read caches from an archive file. If there is an index next to the archive single caches can be read by id or by
+    region/bid without decompressing the whole file, otherwise the whole file is scanned. Caches are returned as
+    dicts usable for creating Cache objects (with ranking_id set to None).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = None
+        self.members = None
+        self.by_id = {}
+        self.by_region_bid = {}
+
+        try:
+            with gzip.open(index_filename(filename), mode='rb') as file:
+                index = json.loads(file.read().decode('utf-8'))
+            self.header = index['header']
+            self.members = index['members']
+            for id, region, bid, type, member in index['caches']:
+                self.by_id[id] = member
+                self.by_region_bid.setdefault((region, bid), []).append((id, member))
+        except FileNotFoundError:
+            pass
+
+    def has_index(self):
+        return self.members is not None
+
+    def read_member(self, member):
+        offset, size = self.members[member]
+        with open(self.filename, 'rb') as file:
+            file.seek(offset)
+            return gzip.decompress(file.read(size)).splitlines()
+
+    def __iter__(self):
+        """ Iterate all caches in the archive, the header is skipped. """
+        with gzip.open(self.filename, mode='rb') as file:
+            for row in file:
+                struct = json.loads(row.decode('utf-8'))
+                if 'url' not in struct:
+                    # Ranking archive header.
+                    continue
+                yield self.to_cache_struct(struct)
+
+    @staticmethod
+    def to_cache_struct(struct):
+        struct['data'] = None if struct.get('data') is None else to_json_text(struct['data'])
+        struct['ranking_id'] = None
+        return struct
+
+    def read_ids(self, members, ids):
+        res = []
+        for member in sorted(members):
+            for row in self.read_member(member):
+                struct = json.loads(row.decode('utf-8'))
+                if struct.get('id') in ids:
+                    res.append(self.to_cache_struct(struct))
+        return res
+
+    def get(self, id):
+        """ Get cache with id or None if not in archive. """
+        if not self.has_index():
+            return next((c for c in self if c['id'] == id), None)
+
+        member = self.by_id.get(id)
+        if member is None:
+            return None
+        return next(iter(self.read_ids({member}, {id})), None)
+
+    def find(self, region, bid=None):
+        """ Get all caches for region (and bid if set). """
+        if not self.has_index():
+            return [c for c in self if c['region'] == region and (bid is None or c['bid'] == bid)]
+
+        matches = [id_member for (r, b), id_members in self.by_region_bid.items()
+                   if r == region and (bid is None or b == bid)
+                   for id_member in id_members]
+        return self.read_ids({member for id, member in matches}, {id for id, member in matches})
+
+
+def cache_line(id, url, region, bid, type, status, created, updated, data, ladder_id):
+    """ Encode a cache row as an archive line, data is already json and is inserted as it is. """
+    head = json.dumps(dict(id=id,
+                           url=url,
+                           region=region,
+                           bid=bid,
+                           type=type,
+                           status=status,
+                           created=created.isoformat(),
+                           updated=updated.isoformat(),
+                           ladder_id=ladder_id), allow_nan=False)
+    if data is None:
+        data = 'null'
+    elif '\n' in data:
+        data = to_json_text(json.loads(data))
+    return ('%s, "data": %s}' % (head[:-1], data)).encode('utf-8')
+
+
 class DataArchiver(object):
+
+    RESTORE_BATCH_SIZE = 1000
     
     def __init__(self, now, dir=None, remove=False):
         self._stop = False
@@ -34,31 +226,26 @@ class DataArchiver(object):
     def stop(self):
         self._stop = True
 
-    def write_caches(self, file, caches, check_stop=lambda: None):
-        for obj in iterate_query_chunked(caches):
-            check_stop()
-    
-            struct = dict(
-                id=obj.id,
-                url=obj.url,
-                region=obj.region,
-                bid=obj.bid,
-                type=obj.type,
-                status=obj.status,
-                created=obj.created.isoformat(),
-                updated=obj.updated.isoformat(),
-                data=None if obj.data is None else json.loads(obj.data),
-                ladder_id=obj.ladder_id,
-            )
-            s = json.dumps(struct, allow_nan=False)
-            file.write(s.encode('utf-8'))
-            file.write(b'\n')
-
-    def read_cache_obj(self, raw, ranking_id=None):
-        struct = json.loads(raw.decode('utf-8'))
-        struct['data'] = None if struct.get('data') is None else json.dumps(struct['data'], indent=4)
-        struct['ranking_id'] = ranking_id
-        return struct
+    def write_caches(self, writer, caches, check_stop=lambda: None):
+        """ Stream caches to writer (using a server side cursor if supported by the db). """
+        rows = caches.order_by('id').values_list('id', 'url', 'region', 'bid', 'type', 'status', 'created', 'updated',
+                                                 'data', 'ladder_id')
+        for i, row in enumerate(rows.iterator(chunk_size=ArchiveWriter.CHUNK_ROWS)):
+            if i % ArchiveWriter.CHUNK_ROWS == 0:
+                check_stop()
+            writer.write_cache(cache_line(*row), row[0], row[2], row[3], row[4])
+
+    def restore_caches(self, caches, ranking_id=None):
+        """ Create caches (dicts from ArchiveReader) in the database in batches. """
+        batch = []
+        for struct in caches:
+            struct['ranking_id'] = ranking_id
+            batch.append(Cache(**struct))
+            if len(batch) >= self.RESTORE_BATCH_SIZE:
+                Cache.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Cache.objects.bulk_create(batch)
 
     def archive_ranking(self, ranking, check_stop=lambda: None):
         """ Archive ranking. """
@@ -66,10 +253,12 @@ class DataArchiver(object):
     
             if self.remove:
                 filename = "/dev/null"
+                index = None
             else:
                 filename = "%s/archive-ranking-%d.gz" % (self.dir, ranking.id)
+                index = index_filename(filename)
     
-            with gzip.open(filename, mode='wb') as file:
+            with ArchiveWriter(filename, index) as writer:
         
                 caches = ranking.sources
         
@@ -78,7 +267,7 @@ class DataArchiver(object):
                 check_stop()
         
                 # Store metadata json on first line.
-                struct = dict(
+                writer.write_header(dict(
                     version=1,
                     ranking_id=ranking.id,
                     season_id=ranking.season_id,
@@ -86,12 +275,9 @@ class DataArchiver(object):
                     data_time=ranking.data_time.isoformat(),
                     min_data_time=ranking.min_data_time.isoformat(),
                     max_data_time=ranking.max_data_time.isoformat(),
-                )
-                s = json.dumps(struct, allow_nan=False)
-                file.write(s.encode('utf-8'))
-                file.write(b'\n')
+                ))
 
-                self.write_caches(file, caches.all(), check_stop)
+                self.write_caches(writer, caches.all(), check_stop)
         
                 # Do the actual removes.
         
@@ -118,19 +304,17 @@ class DataArchiver(object):
         """ This method is mostly for testing, it will read the caches in the files into database. """
 
         with gzip.open(filename, mode='rb') as file:
-
-            # Skip header row.
             header = json.loads(next(file).decode('utf-8'))
 
-            ranking_id = header['ranking_id']
+        ranking_id = header['ranking_id']
 
-            try:
-                Ranking.objects.get(id=ranking_id)
-            except Ranking.DoesNotExist:
-                ranking_id = None
+        try:
+            Ranking.objects.get(id=ranking_id)
+        except Ranking.DoesNotExist:
+            ranking_id = None
 
-            for row in file:
-                Cache.objects.create(**(self.read_cache_obj(row, ranking_id)))
+        with transaction.atomic():
+            self.restore_caches(ArchiveReader(filename), ranking_id)
 
     @log_context(feature='arch')
     def archive_unused_caches(self, check_stop=lambda: None):
@@ -141,9 +325,9 @@ class DataArchiver(object):
 
             logger.info(f"archiving unused caches to {filename}")
             
-            with gzip.open(filename, mode='wb') as file:
+            with ArchiveWriter(filename, index_filename(filename)) as writer:
                 def move_to_file(caches):
-                    self.write_caches(file, caches, check_stop)
+                    self.write_caches(writer, caches, check_stop)
                     caches.delete()
 
                 move_to_file(Cache.objects.filter(type=Cache.PLAYER_LADDERS))
@@ -158,8 +342,5 @@ class DataArchiver(object):
         """ This method is mostly for testing, it will read the caches in the file into the database, it will never
         overwrite existing data. """
     
-        with gzip.open(filename, mode='rb') as file:
-        
-            for row in file:
-                struct = self.read_cache_obj(row)
-                Cache.objects.create(**struct)
+        with transaction.atomic():
+            self.restore_caches(ArchiveReader(filename))
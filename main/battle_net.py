@@ -14,6 +14,7 @@ from common.settings import config
 from common.timer import Timer
 from common.utils import utcnow, from_unix
 from main.models import Region, Race, Mode, Version, League, Ladder
+from main.rate_limit import parse_retry_after
 
 
 logger = getLogger('django')
@@ -30,6 +31,10 @@ LAST_AVAILABLE_SEASON = 28
 NO_MMR = -32768
 
 
+# Response status when fetching with an etag and the data is unchanged.
+NOT_MODIFIED = 304
+
+
 class LocalStatus(object):
     SOCKET_TIMEOUT = 600
     CONNECTION_REFUSED = 601
@@ -40,7 +45,15 @@ class LocalStatus(object):
     DB_INCONSISTENCY = 606
 
 
-LadderResponse = namedtuple("LadderResponse", ['status', 'api_ladder', 'fetch_time', 'fetch_duration'])
+def to_json_text(data):
+    """ Serialize api data for storage in cache, minified to keep cache rows (and wal) small. Stored data with other
+    formatting is still readable with json.loads. """
+    return json.dumps(data, separators=(',', ':'))
+
+
+LadderResponse = namedtuple("LadderResponse", ['status', 'api_ladder', 'fetch_time', 'fetch_duration', 'retry_after',
+                                               'etag'])
+LadderResponse.__new__.__defaults__ = (None, None)
 SeasonResponse = namedtuple("SeasonResponse", ['status', 'api_season', 'fetch_time', 'fetch_duration'])
 LeagueResponse = namedtuple("LeagueResponse", ['status', 'api_league', 'fetch_time', 'fetch_duration'])
 
@@ -135,26 +148,30 @@ class BnetClient(object):
         Mode.ARCHON:     0,
     }
 
-    def raw_get(self, url, timeout):
-        return urllib.request.urlopen(url, timeout=timeout)
+    def raw_get(self, url, timeout, headers=None):
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=timeout)
 
-    def http_get(self, url, timeout, auth):
+    def http_get(self, url, timeout, auth, headers=None, response_headers=None):
         """
         Get from url.
 
         :param url: url to get
         :param timeout: timeout in seconds
+        :param headers: extra request headers
+        :param response_headers: if a dict, it will be updated with the response headers (lower case names)
         :returns: <status code, raw data>, >= 600 are local client codes
         """
         url = urllib.parse.quote(url, safe='/:') + "?" + auth
         try:
             try:
-                response = self.raw_get(url, timeout)
+                response = self.raw_get(url, timeout, headers)
+                self._copy_headers(response, response_headers)
                 try:
                     return response.getcode(), response.readall()
                 except AttributeError:
                     return response.getcode(), response.read()
             except urllib.error.HTTPError as e:
+                self._copy_headers(e, response_headers)
                 return e.getcode(), e.read()
             except urllib.error.URLError as e:
                 if "timed out" in str(e):
@@ -172,9 +189,16 @@ class BnetClient(object):
         except OSError as e:
             return LocalStatus.OS_ERROR, None
 
-    def http_get_json(self, url, timeout, auth):
+    @staticmethod
+    def _copy_headers(response, response_headers):
+        headers = getattr(response, 'headers', None)
+        if response_headers is not None and headers:
+            response_headers.update((k.lower(), v) for k, v in headers.items())
+
+    def http_get_json(self, url, timeout, auth, headers=None, response_headers=None):
         """
         Get and return json.
+        If 304 (not modified) it will return <304, {}>.
         If 200 and status code in json, code in json will be returned as status.
         If 200 and unparsable json, it will return <605, {'unparsable': '<content decoded as utf-8>'}>
         If non 200 and unparsable json, it will return <status, {'unparsable': '<content decoded as utf-8>'}>
@@ -182,7 +206,10 @@ class BnetClient(object):
 
         :returns: <status code, json data>
         """
-        status, raw = self.http_get(url, timeout, auth)
+        status, raw = self.http_get(url, timeout, auth, headers=headers, response_headers=response_headers)
+        if status == NOT_MODIFIED:
+            return status, {}
+
         if raw is None:
             return status, {'unparsable': ''}
 
@@ -234,20 +261,25 @@ class BnetClient(object):
         status, data = self.http_get_json(url, timeout, ACCESS_TOKEN_AUTH)
         return LeagueResponse(status, ApiLeague(data, url, bid), utcnow(), timer.end())
 
-    def fetch_ladder(self, region, bid, timeout=60):
+    def fetch_ladder(self, region, bid, timeout=60, etag=None):
         """
-        Fetch ladder from blizzard api.
+        Fetch ladder from blizzard api. If etag is given the fetch is conditional and status will be 304 with an empty
+        ApiLadder if the ladder is unchanged.
 
-        :return: <status code, ApiLadder or None, fetch time, fetch duration>
+        :return: <status code, ApiLadder or None, fetch time, fetch duration, retry after seconds or None, etag or None>
         """
 
         url_prefix = self.REGION_URL_PREFIXES[region]
         
         url = f"{url_prefix}/data/sc2/ladder/{bid}"
         timer = Timer()
-        status, data = self.http_get_json(url, timeout, ACCESS_TOKEN_AUTH)
+        headers = {}
+        status, data = self.http_get_json(url, timeout, ACCESS_TOKEN_AUTH,
+                                          headers={'If-None-Match': etag} if etag else None,
+                                          response_headers=headers)
         al = ApiLadder(data, url)
-        return LadderResponse(status, al, utcnow(), timer.end())
+        return LadderResponse(status, al, utcnow(), timer.end(), parse_retry_after(headers.get('retry-after')),
+                              headers.get('etag'))
 
 
 class ApiSeason(object):
@@ -267,7 +299,7 @@ class ApiSeason(object):
 
     def to_text(self):
         if self.data:
-            return json.dumps(self.data, indent=4)
+            return to_json_text(self.data)
         return None
 
     def __repr__(self):
@@ -295,7 +327,7 @@ class ApiLeague(object):
 
     def to_text(self):
         if self.data:
-            return json.dumps(self.data, indent=4)
+            return to_json_text(self.data)
         return None
 
     def __repr__(self):
@@ -316,7 +348,7 @@ class ApiLadder(object):
 
     def to_text(self):
         if self.data:
-            return json.dumps(self.data, indent=4)
+            return to_json_text(self.data)
         return None
 
     def is_empty(self):
@@ -338,6 +370,10 @@ class ApiLadder(object):
         else:
             return len(self.get())
 
+    def games_played(self):
+        """ Return total number of games played (wins + losses) for the teams in the ladder. """
+        return sum(t.get('wins', 0) + t.get('losses', 0) for t in self.get())
+
     def members_for_ranking(self, team_size):
         """ Return a list of ladder members enhanced for ranking by c++ code. Each ladder member is a dict. """
         members = []
@@ -567,7 +603,7 @@ class ApiPlayerLadders(object):
 
     def to_text(self):
         if self.data:
-            return json.dumps(self.data, indent=4)
+            return to_json_text(self.data)
         return None
 
     def curr(self):
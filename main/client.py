@@ -1,7 +1,7 @@
 import socket
 import json
 
-from main.models import Version, Mode
+from main.models import Version, Mode, Region, League, Race
 
 
 class ClientError(Exception):
@@ -11,9 +11,9 @@ class ClientError(Exception):
 class Client(object):
     """ Client for the server. :) """
 
-    def request_server(self, data):
+    def request_server(self, data, timeout=5.0):
         try:
-            raw = request_tcp('localhost', 4747, json.dumps(data).encode('utf-8'))
+            raw = request_tcp('localhost', 4747, json.dumps(data).encode('utf-8'), timeout=timeout)
         except OSError as e:
             raise ClientError('Error in server communication.') from e
 
@@ -73,6 +73,27 @@ class Client(object):
             raise ClientError("{'code': '%s', 'message': '%s'}" % (code, data.get('message', '')))
         return data
 
+    def export_ladder(self, format, key, version, mode, reverse=False, region=None, race=None, league=None,
+                      timeout=300.0):
+        """ Make the server write the whole ladder in format (csv or ndjson) to its export dir, the file name is
+        decided by the server (see main.export.export_filename) and returned as filename. """
+
+        data = self.fill_data(key, reverse, region, race, league)
+
+        data['cmd'] = 'export'
+        data['version'] = version
+        data['mode'] = mode
+        data['format'] = format
+        data['keys'] = {name: {str(id_): k for id_, k in enum.key_by_ids.items()}
+                        for name, enum in (('region', Region), ('league', League), ('race', Race))}
+
+        data = self.request_server(data, timeout=timeout)
+
+        code = data.get('code', 'empty')
+        if code != 'ok':
+            raise ClientError("{'code': '%s', 'message': '%s'}" % (code, data.get('message', '')))
+        return data
+
 
 def request_tcp(host, port, message, timeout=5.0):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
@@ -3,6 +3,7 @@ import sys
 from django.db import transaction, connection
 from logging import getLogger
 from datetime import timedelta, datetime
+from time import sleep
 
 from django.db.models import Q
 
@@ -20,6 +21,11 @@ class BreakRun(Exception):
 
 
 class DataDeleter(object):
+
+    # Deletes of many rows are done in chunks of ids, each in its own transaction with a pause in between, to keep lock
+    # times and wal spikes down while the updater is running.
+    CHUNK_SIZE = 5000
+    CHUNK_PAUSE = 0.2
     
     def __init__(self, dry_run=True):
         self.do_delete = not dry_run
@@ -27,6 +33,34 @@ class DataDeleter(object):
 
     def stop(self):
         pass
+
+    def delete_chunked(self, query, what, check_stop=lambda: None):
+        """ Delete objects in query chunk by chunk in id order, every chunk is committed so a stopped or failed delete
+        is resumed by running it again. The query is applied again when deleting each chunk. Returns number of deleted
+        objects. """
+
+        total = query.count()
+        logger.info("%sremoving %d %s" % (self.prefix, total, what))
+        if not self.do_delete:
+            return 0
+
+        deleted = 0
+        last_id = 0
+        while True:
+            check_stop()
+            ids = list(query.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:self.CHUNK_SIZE])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                count, _ = query.filter(id__in=ids).delete()
+
+            deleted += count
+            last_id = ids[-1]
+            logger.info("removed %d/%d %s, last id %d" % (deleted, total, what, last_id))
+            sleep(self.CHUNK_PAUSE)
+
+        return deleted
         
     @log_context(feature='del')
     def delete_old_rankings(self, keep_last=7):
@@ -102,50 +136,45 @@ class DataDeleter(object):
                     logger.info("keeping ranking %d beacuse %s" % (rr[0].id, rr[2]))
 
     @log_context(feature='del')
-    def delete_old_cache_data(self, keep_days=30):
+    def delete_old_cache_data(self, keep_days=30, check_stop=lambda: None):
         """ Delete all cache data that is no longer linked from rankings or ladders but only if older than 30 days. """
 
-        with transaction.atomic():
-            objects = Cache.objects.filter(ladder__isnull=True, ranking__isnull=True, status=200,
-                                           type__in=(Cache.LADDER, Cache.PLAYER, Cache.PLAYER_LADDERS, Cache.SEASON),
-                                           updated__lt=utcnow() - timedelta(days=keep_days))
+        objects = Cache.objects.filter(ladder__isnull=True, ranking__isnull=True, status=200,
+                                       type__in=(Cache.LADDER, Cache.PLAYER, Cache.PLAYER_LADDERS, Cache.SEASON),
+                                       updated__lt=utcnow() - timedelta(days=keep_days))
 
-            count = objects.count()
-            logger.info("%sremoving unreferenced %d cache objects" % (self.prefix, count))
-            if self.do_delete:
-                objects.delete()
+        return self.delete_chunked(objects, "unreferenced cache objects", check_stop)
 
     @log_context(feature='del')
-    def agressive_delete_cache_data(self):
+    def agressive_delete_cache_data(self, check_stop=lambda: None):
         """ Delete all cache data that is no longer linked from rankings or ladders or if it older than
          keep_days. """
     
-        with transaction.atomic():
-            query = Cache.objects.filter(
-                Q(updated__lt=api_data_purge_date())
-                | Q(ladder__isnull=True, ranking__isnull=True, type=Cache.LADDER)
-                | Q(type__in=(Cache.PLAYER, Cache.PLAYER_LADDERS))
-            )
-        
-            count = query.count()
-            logger.info("%sremoving %d unreferenced cache objects" % (self.prefix, count))
-            if self.do_delete:
-                query.delete()
+        query = Cache.objects.filter(
+            Q(updated__lt=api_data_purge_date())
+            | Q(ladder__isnull=True, ranking__isnull=True, type=Cache.LADDER)
+            | Q(type__in=(Cache.PLAYER, Cache.PLAYER_LADDERS))
+        )
+
+        return self.delete_chunked(query, "unreferenced cache objects", check_stop)
 
     @log_context(feature='del')
-    def delete_ranking(self, pk):
-        """ Delete ranking with pk, including ranking_data, ranking_stats and cache. """
-        
-        with transaction.atomic():
-            ranking = Ranking.objects.get(pk=pk)
+    def delete_ranking(self, pk, check_stop=lambda: None):
+        """ Delete ranking with pk, including ranking_data, ranking_stats and cache. The caches are deleted in chunks
+        before the rest. """
+
+        ranking = Ranking.objects.get(pk=pk)
             
-            # checking for linked ladder to rankings cache objects (should never happend)
-            cache_ids = [c.id for c in
-                         Cache.objects.raw("SELECT c.id FROM cache c WHERE ranking_id = %s AND ladder_id is not NULL",
-                                           [ranking.id])]
-            if cache_ids:
-                raise Exception("rankings cache objects are tied to ladders: %s" % cache_ids)
-    
+        # checking for linked ladder to rankings cache objects (should never happend)
+        cache_ids = [c.id for c in
+                     Cache.objects.raw("SELECT c.id FROM cache c WHERE ranking_id = %s AND ladder_id is not NULL",
+                                       [ranking.id])]
+        if cache_ids:
+            raise Exception("rankings cache objects are tied to ladders: %s" % cache_ids)
+
+        self.delete_chunked(Cache.objects.filter(ranking=ranking), "caches", check_stop)
+
+        with transaction.atomic():
             logger.info("%sdeleting %d ranking data" %
                         (self.prefix, RankingData.objects.filter(ranking=ranking).count()))
             if self.do_delete:
@@ -155,11 +184,6 @@ class DataDeleter(object):
             if self.do_delete:
                 RankingStats.objects.filter(ranking=ranking).delete()
     
-            logger.info("%sdeleting %d caches" % (self.prefix, ranking.sources.count()))
-            if self.do_delete:
-                for c in ranking.sources.all():
-                    c.delete()
-    
             logger.info("%sdeleteing ranking %d" % (self.prefix, ranking.id))
             if self.do_delete:
                 ranking.delete()
@@ -0,0 +1,39 @@
+import os
+from os.path import join
+
+from common.settings import config
+from main.client import client
+from main.models import Version, Mode
+
+
+#
+# Full ladder export, the ladder server writes the files to its export dir where they are served by the ladder export
+# view. The server should be started with --export-dir (or EXPORT_DIR in the environment) set to EXPORT_DIR, make run
+# and make run-server do that.
+#
+
+
+# Export formats with content type.
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# The exported ladder is LotV 1v1 sorted on mmr.
+EXPORT_SORT_KEY = 5
+
+
+# Name of the downloaded file.
+EXPORT_DOWNLOAD_NAME = 'ladder-lotv-1v1.%s'
+
+
+def export_filename(format):
+    """ Return the file the server writes the export in format to, named as export_filename in ladder_handler.cpp. """
+    return join(config.EXPORT_DIR, 'ladder-%d-%d.%s' % (Version.LOTV, Mode.TEAM_1V1, format))
+
+
+def export_ladder(format):
+    """ Export the ladder in format, returns number of exported teams. """
+    os.makedirs(config.EXPORT_DIR, exist_ok=True)
+    data = client.export_ladder(format, EXPORT_SORT_KEY, Version.LOTV, Mode.TEAM_1V1)
+    return data['count']
@@ -1,9 +1,11 @@
-from datetime import datetime, timezone
+import hashlib
+from datetime import datetime, timezone, timedelta
 
 from logging import getLogger, INFO, WARNING
 
 from django.db import transaction
 
+from main.battle_net import ApiLadder, NOT_MODIFIED
 from main.models import Cache, Ladder, Mode, League, Version, Region
 from common.utils import to_unix
 from lib import sc2
@@ -13,11 +15,34 @@ logger = getLogger('django')
 sc2.set_logger(logger)
 
 
-def update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time):
+# Max age of last merge into ranking for an unchanged ladder to be skipped, the merge needs to be done now and then
+# anyway to update last seen for players and teams.
+UNCHANGED_MAX_AGE = timedelta(hours=24)
+
+
+class MissingCache(Exception):
+    """ Raised when a ladder was not modified but there is no cache for it in the ranking, the etag used for the fetch
+    is from a fetch that was never saved. """
+    pass
+
+
+def data_hash(data):
+    """ Content hash of cache data. """
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def save_ladder_cache(ranking, ladder, status, api_ladder, fetch_time):
     """
-    Update cache and link/unlink. The fetch is done for a specific ranking and ladder, both provided. Since this is a
-    refetch of a present GOOD ladder (or it is becoming GOOD) only 200 responses are allowed. Transaction should be
-    spanning call to make transaction abortion possible.
+    Update cache and ladder. The fetch is done for a specific ranking and ladder, both provided. Since this is a
+    refetch of a present GOOD ladder (or it is becoming GOOD) only 200 (or 304 if fetched with etag) responses are
+    allowed, MissingCache is raised for 304 if the ladder has no cache. Transaction should be spanning call to make
+    transaction abortion possible.
+
+    If the ladder is unchanged since last time it was added to the ranking only ladder updated is set and None is
+    returned, otherwise the saved cache is returned and needs to be added to the ranking with add_cache_to_ranking.
+    The cache is saved without data_hash, it is set by set_merged when ranking data including the cache has been
+    saved so a cache that was never merged (failed or stopped merge) or only merged into ranking data lost in a crash
+    is not skipped as unchanged on next fetch.
     """
 
     try:
@@ -26,12 +51,30 @@ def update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time):
     except Cache.DoesNotExist:
         lc = None
 
+    if status == NOT_MODIFIED:
+        if lc is None:
+            raise MissingCache("got %d for ladder %d but there is no cache for it in ranking %d" %
+                               (status, ladder.id, ranking.id))
+        data = lc.data
+        api_ladder = ApiLadder(data, lc.url)
+        status = 200
+    else:
+        data = api_ladder.to_text()
+
+    digest = data_hash(data)
+
+    if lc and lc.data_hash == digest and lc.updated > fetch_time - UNCHANGED_MAX_AGE:
+        Ladder.objects.filter(id=ladder.id).update(updated=fetch_time)
+        ladder.updated = fetch_time
+        return None
+
     lc = lc or Cache(region=ladder.region,
                      bid=ladder.bid,
                      type=Cache.LADDER,
                      created=fetch_time)
     lc.ranking = ranking
-    lc.data = api_ladder.to_text()
+    lc.data = data
+    lc.data_hash = None
     lc.url = api_ladder.url
     lc.updated = fetch_time
     lc.status = status
@@ -44,19 +87,52 @@ def update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time):
     ladder.strangeness = Ladder.GOOD
     ladder.save()
 
+    return lc
+
+
+def add_cache_to_ranking(cpp, ladder, lc):
+    """ Merge a saved ladder cache into the ranking data, returns the stats from the ranking update. The merge is done
+    without holding the GIL and inserts or updates player, team, clan_team and player_team rows using the ranking data
+    db connection. """
     team_size = Mode.team_size(ladder.mode)
-    return cpp.update_with_ladder(ladder.id,
-                                  lc.id,
-                                  ladder.region,
-                                  ladder.mode,
-                                  ladder.league,
-                                  ladder.tier,
-                                  ladder.version,
-                                  ladder.season_id,
-                                  to_unix(lc.updated),
-                                  lc.updated.date().isoformat(),
-                                  team_size,
-                                  api_ladder.members_for_ranking(team_size))
+    return cpp.update_with_ladder_json(ladder.id,
+                                       lc.id,
+                                       ladder.region,
+                                       ladder.mode,
+                                       ladder.league,
+                                       ladder.tier,
+                                       ladder.version,
+                                       ladder.season_id,
+                                       to_unix(lc.updated),
+                                       lc.updated.date().isoformat(),
+                                       team_size,
+                                       lc.data)
+
+
+def merged_cache(lc):
+    """ Return what set_merged needs of a cache added to the ranking data, without keeping the cache data. """
+    return lc.id, lc.updated, data_hash(lc.data)
+
+
+def set_merged(merged):
+    """ Set data_hash of caches added to the ranking data (list of merged_cache), this should be done when ranking data
+    including them has been saved, see save_ladder_cache. Caches saved again since are not updated. """
+    for cache_id, updated, digest in merged:
+        Cache.objects.filter(id=cache_id, updated=updated).update(data_hash=digest)
+
+
+def update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time):
+    """
+    Update cache and add it to the ranking, see save_ladder_cache. Returns None if the ladder was unchanged,
+    otherwise the stats from the ranking update. The data_hash is set right away, only use where the ranking is saved
+    or repaired from the caches after a failure.
+    """
+    lc = save_ladder_cache(ranking, ladder, status, api_ladder, fetch_time)
+    if lc is None:
+        return None
+    stats = add_cache_to_ranking(cpp, ladder, lc)
+    set_merged([merged_cache(lc)])
+    return stats
 
 
 S22_END_TIME = datetime(2015, 6, 29, 23, 59, 59, 999, timezone.utc)
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_added_last_seen_on_team_and_player_for_blizzard_api_terms_update'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cache',
+            name='data_hash',
+            field=models.CharField(default=None, max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+class RunSqlPostgreOnly(migrations.RunSQL):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # Indices are created concurrently to not lock the player table, that can not be done in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('main', '0017_added_data_hash_on_cache'),
+    ]
+
+    operations = [
+        # Player search, prefix match on name and all columns needed for filter and order (see main.search) to make
+        # it possible to select ids using an index only scan.
+        RunSqlPostgreOnly("CREATE INDEX CONCURRENTLY IF NOT EXISTS player_search ON player"
+                          " ((upper(name)) varchar_pattern_ops, season_id DESC, mode, name, region, bid, id, last_seen);",
+                          "DROP INDEX IF EXISTS player_search;"),
+
+        # Clan search, only 1v1 players with tags are searched.
+        RunSqlPostgreOnly("CREATE INDEX CONCURRENTLY IF NOT EXISTS player_clan_search ON player"
+                          " ((upper(clan)) varchar_pattern_ops, season_id) WHERE mode = 11 AND tag > '';",
+                          "DROP INDEX IF EXISTS player_clan_search;"),
+        RunSqlPostgreOnly("CREATE INDEX CONCURRENTLY IF NOT EXISTS player_tag_search ON player"
+                          " ((upper(tag)) varchar_pattern_ops, season_id) WHERE mode = 11 AND tag > '';",
+                          "DROP INDEX IF EXISTS player_tag_search;"),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.28 on 2026-10-19 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class RunSqlPostgreOnly(migrations.RunSQL):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClanTeam',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='main.Team')),
+                ('tag', models.CharField(max_length=6)),
+                ('clan', models.CharField(max_length=32)),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.Season')),
+            ],
+            options={
+                'db_table': 'clan_team',
+                'index_together': {('season', 'tag', 'clan')},
+            },
+        ),
+        RunSqlPostgreOnly("CREATE INDEX clan_team_clan_upper_like ON clan_team"
+                          " (season_id, (upper(clan)) varchar_pattern_ops);",
+                          "DROP INDEX clan_team_clan_upper_like;"),
+        RunSqlPostgreOnly("CREATE INDEX clan_team_tag_upper_like ON clan_team"
+                          " (season_id, (upper(tag)) varchar_pattern_ops);",
+                          "DROP INDEX clan_team_tag_upper_like;"),
+        RunSqlPostgreOnly("INSERT INTO clan_team (team_id, season_id, tag, clan)"
+                          " SELECT t.id, t.season_id, p.tag, p.clan FROM team t JOIN player p ON p.id = t.member0_id"
+                          " WHERE t.mode = 11 AND t.season_id IS NOT NULL AND p.tag <> '';",
+                          migrations.RunSQL.noop),
+
+        # Clan search uses clan_team instead.
+        RunSqlPostgreOnly("DROP INDEX IF EXISTS player_clan_search;",
+                          "CREATE INDEX player_clan_search ON player"
+                          " ((upper(clan)) varchar_pattern_ops, season_id) WHERE mode = 11 AND tag > '';"),
+        RunSqlPostgreOnly("DROP INDEX IF EXISTS player_tag_search;",
+                          "CREATE INDEX player_tag_search ON player"
+                          " ((upper(tag)) varchar_pattern_ops, season_id) WHERE mode = 11 AND tag > '';"),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-19 12:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class RunSqlPostgreOnly(migrations.RunSQL):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_clan_team'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerTeam',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('player', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.Player')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.Team')),
+            ],
+            options={
+                'db_table': 'player_team',
+                'unique_together': {('player', 'team')},
+            },
+        ),
+        RunSqlPostgreOnly("INSERT INTO player_team (player_id, team_id)"
+                          " SELECT m.player_id, t.id FROM team t,"
+                          " LATERAL (VALUES (t.member0_id), (t.member1_id), (t.member2_id), (t.member3_id)) m (player_id)"
+                          " WHERE m.player_id IS NOT NULL ON CONFLICT DO NOTHING;",
+                          migrations.RunSQL.noop),
+    ]
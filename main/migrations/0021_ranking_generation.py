@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_player_team'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingGeneration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'ranking_generation',
+            },
+        ),
+    ]
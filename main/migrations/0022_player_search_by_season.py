@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+class RunSqlPostgreOnly(migrations.RunSQL):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # Indices are created concurrently to not lock the player table, that can not be done in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('main', '0021_ranking_generation'),
+    ]
+
+    operations = [
+        # Player search is done season by season (see main.search), the index has the columns in the order of the
+        # search so pages are read in order from the index. The upper case name is in C collation to make prefix
+        # matching possible using the same index. The rest of the columns needed for filter make it possible to select
+        # ids using an index only scan.
+        RunSqlPostgreOnly("CREATE INDEX CONCURRENTLY IF NOT EXISTS player_search_by_season ON player"
+                          " (season_id, (upper(name) COLLATE \"C\"), mode, name, region, bid, id, last_seen);",
+                          "DROP INDEX IF EXISTS player_search_by_season;"),
+
+        # Replaced by player_search_by_season.
+        RunSqlPostgreOnly("DROP INDEX CONCURRENTLY IF EXISTS player_search;",
+                          "CREATE INDEX CONCURRENTLY IF NOT EXISTS player_search ON player"
+                          " ((upper(name)) varchar_pattern_ops, season_id DESC, mode, name, region, bid, id,"
+                          " last_seen);"),
+    ]
@@ -322,6 +322,9 @@ class Cache(models.Model):
     # The "raw" data (the response body decoded as utf-8).
     data = models.TextField(null=True, default=None)
 
+    # Hash of data, used to detect unchanged ladders, only set for ladder caches that are added to the ranking.
+    data_hash = models.CharField(max_length=40, null=True, default=None)
+
     # Number of retries for non 200 responses.
     retry_count = models.IntegerField(default=0)
 
@@ -558,7 +561,39 @@ class Team(models.Model):
         return "<mode: %s, m0: %s, m1: %s, m2: %s, m3: %s>" % (self.mode, self.member0_id, self.member1_id,
                                                                self.member2_id, self.member3_id)
 
-        
+
+class ClanTeam(models.Model):
+    """ Precomputed clan roster, the 1v1 team of every player with a clan tag. Maintained by the c++ code when teams
+    and players are updated (see db::update_clan_teams). """
+
+    class Meta:
+        db_table = 'clan_team'
+        index_together = ('season', 'tag', 'clan')
+
+    team = models.OneToOneField(Team, primary_key=True, related_name='+', on_delete=models.CASCADE)
+
+    # The last season of the team.
+    season = models.ForeignKey(Season, related_name='+', on_delete=models.DO_NOTHING)
+
+    # The latest known clan tag and clan of the player of the team.
+    tag = models.CharField(max_length=6)
+    clan = models.CharField(max_length=32)
+
+
+class PlayerTeam(models.Model):
+    """ The teams of every player, one row per member of a team. Members of a team never change so rows are only
+    inserted when teams are created by the c++ code (see db::get_or_insert_teams). """
+
+    class Meta:
+        db_table = 'player_team'
+        unique_together = ('player', 'team')
+
+    # Indexed by the unique index.
+    player = models.ForeignKey(Player, related_name='+', db_index=False, on_delete=models.CASCADE)
+
+    team = models.ForeignKey(Team, related_name='+', on_delete=models.CASCADE)
+
+
 class Ranking(models.Model):
     """ Represents a full ranking of teams globally. """
 
@@ -618,6 +653,16 @@ class RankingData(models.Model):
 
     ranking = models.OneToOneField('Ranking', related_name='ranking_data', null=True, on_delete=models.CASCADE)
 
+
+class RankingGeneration(models.Model):
+    """ Generation of the values cached with cache_ranking_value, bumped when the server has reloaded saved ranking
+    data. There is at most one row. """
+
+    class Meta:
+        db_table = 'ranking_generation'
+
+    generation = models.IntegerField(default=0)
+
     
 class RankingStats(models.Model):
     """ Ranking statistics. """
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import json
+import os
+from logging import getLogger
+from os.path import join, dirname
+
+from django.test import RequestFactory
+from django.urls import reverse, resolve
+
+import main.views.ladder
+from common.settings import config
+from main.client import ClientError
+from main.models import Mode, Version, Season
+from main.views.base import SORT_KEYS, last_updated_info
+from main.views.ladder import LadderView
+
+
+logger = getLogger('django')
+
+
+#
+# Pre-rendered ladder pages, the first pages of the ladders in the sitemap are rendered to PRERENDER_DIR (together with
+# a gzipped copy) when a new ranking is saved. The front web server serves them without asking the site, the page at
+# offset o of the ladder at path p is in p/index.html for offset 0 and p/offset-o.html otherwise. Pages that does not
+# exist in the ladder are removed so requests for them falls through to the site.
+#
+# Only ladders of the version of the current season are rendered (older versions never change), every ladder is
+# fetched once from the ladder server for all its pages and the pages are only rendered again if the ladder changed.
+#
+
+
+# Number of pages to render for every ladder.
+PRERENDER_PAGES = 3
+
+
+def ladder_paths(versions=None):
+    """ Return the ladder paths in the sitemap (see sitemap_view), only for version ids in versions if set. """
+    return [reverse('ladder', kwargs={'version': version, 'mode': mode, 'reverse': reverse_, 'sort_key': sort_key})
+            for version in Version.keys if version != Version.UNKNOWN_KEY
+            if versions is None or Version.id_by_keys[version] in versions
+            for mode in Mode.keys if mode != Mode.UNKNOWN_KEY
+            for reverse_ in ('', '-')
+            for sort_key in SORT_KEYS.keys()]
+
+
+def page_filename(path, offset):
+    return join(config.PRERENDER_DIR, path.strip('/'), 'index.html' if offset == 0 else 'offset-%d.html' % offset)
+
+
+def write_page(filename, content):
+    """ Write content and a gzipped copy, files are replaced atomically to never serve half written pages. """
+    os.makedirs(dirname(filename), exist_ok=True)
+    for name, data in ((filename, content), (filename + '.gz', gzip.compress(content, mtime=0))):
+        with open(name + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(name + '.tmp', name)
+
+
+def remove_page(filename):
+    for name in (filename, filename + '.gz'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+class PrerenderLadderView(LadderView):
+    """ Ladder view that takes the teams of the page from a ladder fetched once for all pages by prerender_ladder
+    instead of requesting the server. """
+
+    ladder = None
+
+    def fetch_data(self, sort_key_id, version_id, mode_id, offset=None, **kwargs):
+        offset = min(offset or 0, self.ladder['count'])
+        return dict(self.ladder, teams=self.ladder['teams'][offset:offset + main.views.ladder.PAGE_SIZE], offset=offset,
+                    limit=main.views.ladder.PAGE_SIZE)
+
+
+def fetch_ladder(path, pages):
+    """ Fetch the teams of the first pages of the ladder at path from the server, as the ladder view does for one
+    page. """
+    kwargs = resolve(path).kwargs
+    return LadderView.fetch_data(SORT_KEYS[kwargs['sort_key']],
+                                 Version.id_by_keys[kwargs['version']],
+                                 Mode.id_by_keys[kwargs['mode']],
+                                 is_reverse=kwargs['reverse'] == '-',
+                                 offset=0,
+                                 limit=pages * main.views.ladder.PAGE_SIZE)
+
+
+def render_page(path, offset, ladder):
+    """ Render the ladder page at path and offset from ladder (see fetch_ladder), returns the content or None if
+    rendering failed. """
+    request = RequestFactory().get(path, {'offset': offset} if offset else {})
+    request.resolver_match = match = resolve(path)
+    view = PrerenderLadderView.as_view(ladder=ladder, **match.func.view_initkwargs)
+    response = view(request, *match.args, **match.kwargs)
+
+    if response.status_code != 200 or 'error' in response.context_data:
+        return None
+
+    return response.render().content
+
+
+def ladder_digest(ladder):
+    """ Return digest of everything in ladder (see fetch_ladder) and the rest of the page data that can change. """
+    return hashlib.md5(json.dumps([ladder, last_updated_info()], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def prerender_ladder(path, pages=PRERENDER_PAGES, digests=None):
+    """ Render the first pages of the ladder at path, returns number of rendered pages. If digests (path -> ladder
+    digest of the rendered pages) is given the pages are not rendered if the ladder is unchanged, it is updated when
+    pages are rendered. """
+    try:
+        ladder = fetch_ladder(path, pages)
+    except ClientError as e:
+        # Keep the old pages, they are better than nothing.
+        logger.warning("failed to fetch %s: %s" % (path, e))
+        return 0
+
+    digest = ladder_digest(ladder)
+    if digests is not None:
+        if digests.get(path) == digest:
+            return 0
+        # Render again next time if rendering fails.
+        digests.pop(path, None)
+
+    rendered = 0
+    for page in range(pages):
+        offset = page * main.views.ladder.PAGE_SIZE
+        filename = page_filename(path, offset)
+
+        if offset >= ladder['count'] and offset > 0:
+            remove_page(filename)
+            continue
+
+        content = render_page(path, offset, ladder)
+        if content is None:
+            logger.warning("failed to render %s at offset %d" % (path, offset))
+            return rendered
+
+        write_page(filename, content)
+        rendered += 1
+
+    if digests is not None:
+        digests[path] = digest
+
+    return rendered
+
+
+def prerender_ladders(pages=PRERENDER_PAGES, check_stop=lambda: None, digests=None):
+    """ Render the first pages of the ladders in the sitemap for the version of the current season, see
+    prerender_ladder for digests. """
+    version = Season.get_current_season().version
+    rendered = 0
+    for path in ladder_paths(versions=[version]):
+        check_stop()
+        rendered += prerender_ladder(path, pages, digests)
+    logger.info("rendered %d ladder pages for version %s to %s" %
+                (rendered, Version.key_by_ids[version], config.PRERENDER_DIR))
+    return rendered
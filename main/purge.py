@@ -8,20 +8,32 @@ logger = getLogger('django')
 sc2.set_logger(logger)
 
 
-def purge_player_data(check_stop=lambda: None):
-    rankings = list(
-        Ranking.objects.filter(status__in=(Ranking.COMPLETE_WITH_DATA, Ranking.COMPLETE_WITOUT_DATA)).order_by('id')
-    )
+# Number of rankings purged in parallel, each worker uses a db connection and holds one ranking in memory.
+PURGE_THREADS = 4
+
+
+def purge_player_data(check_stop=lambda: None, threads=PURGE_THREADS):
+    ranking_ids = list(
+        Ranking.objects.filter(status__in=(Ranking.COMPLETE_WITH_DATA, Ranking.COMPLETE_WITOUT_DATA))
+        .order_by('id').values_list('id', flat=True)
+    )[:-1]
     
     cpp_purger = sc2.Purger(get_db_name())
-    
-    for ranking in rankings[:-1]:
+
+    # Purge in batches to be able to stop in between.
+    batch_size = threads * 4
+    for i in range(0, len(ranking_ids), batch_size):
         if check_stop():
             return
-        
-        logger.info(f"Purge teams from ranking {ranking.id}.")
-        
-        cpp_purger.purge_removed_teams_from_ranking(ranking.id, to_unix(utcnow()), api_data_purge_date().isoformat())
+
+        batch = ranking_ids[i:i + batch_size]
+
+        logger.info(f"Purge teams from rankings {batch[0]} to {batch[-1]} ({i + len(batch)}/{len(ranking_ids)}).")
+
+        saved = cpp_purger.purge_removed_teams_from_rankings(batch, to_unix(utcnow()),
+                                                             api_data_purge_date().isoformat(), threads)
+
+        logger.info(f"Purged teams from {saved} of {len(batch)} rankings.")
     
     # Maybe would be better to null here instead of delete, we will see what happens.
     Team.all_objects.filter(last_seen__lt=api_data_purge_date()).delete()
@@ -0,0 +1,176 @@
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep
+
+from common.utils import utcnow, to_unix
+
+
+# Statuses that means the api wants us to slow down.
+THROTTLE_STATUSES = {429, 503}
+
+# Statuses from 600 are generated locally by BnetClient (timeouts, connection errors, unparsable json...).
+LOCAL_STATUS_MIN = 600
+
+
+def parse_retry_after(value):
+    """ Parse a Retry-After header value (delta seconds or http date) into seconds from now, returns None if not
+    parsable. """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, to_unix(parsedate_to_datetime(value)) - to_unix(utcnow()))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """ Token bucket with an adjustable rate (tokens/s), burst defaults to one second worth of tokens. The bucket can
+    also be held, blocking all tokens until a certain time. """
+
+    def __init__(self, rate, burst=None, clock=monotonic):
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.last = clock()
+        self.hold_until = 0.0
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        return now
+
+    def wait_time(self):
+        """ Return seconds until a token is available, 0 if it is available now. """
+        now = self.refill()
+        if now < self.hold_until:
+            return self.hold_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def hold(self, seconds):
+        self.hold_until = max(self.hold_until, self.clock() + seconds)
+
+
+class RegionLimit(object):
+    """ Adaptive rate for one region, additive increase on good responses, multiplicative decrease on throttling and
+    api errors. """
+
+    def __init__(self, rate, clock):
+        self.bucket = TokenBucket(rate, clock=clock)
+        self.fetch_count = 0
+        self.throttle_count = 0
+        self.error_count = 0
+        self.local_error_count = 0
+        self.queue_depth = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def adjust(self, factor, increase, min_rate, max_rate):
+        self.bucket.rate = max(min_rate, min(max_rate, self.bucket.rate * factor + increase))
+        self.bucket.burst = max(1.0, self.bucket.rate)
+
+
+class RateLimiter(object):
+    """
+    Rate limiter shared between fetcher threads. There is one global token bucket for the api quota and one adaptive
+    bucket per region. A region backs off when the api returns 429/503 (honoring Retry-After) or other 5xx errors and
+    slowly ramps up again on successful responses. Local failures (600+ statuses) does not change the rate. Consumer
+    backpressure is not handled here, that is up to the fetcher.
+    """
+
+    GLOBAL_RATE = 10.0
+    START_RATE = 2.0
+    MIN_RATE = 0.1
+    MAX_RATE = 10.0
+
+    RATE_INCREASE = 0.02
+    THROTTLE_DECREASE = 0.5
+    ERROR_DECREASE = 0.8
+
+    DEFAULT_RETRY_AFTER = 10.0
+    MAX_RETRY_AFTER = 300.0
+
+    def __init__(self, regions, clock=monotonic, sleep=sleep):
+        self.lock = Lock()
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = TokenBucket(self.GLOBAL_RATE, clock=clock)
+        self.regions = {region: RegionLimit(self.START_RATE, clock) for region in regions}
+
+    def try_acquire(self, region):
+        """ Try to take a token for region, returns 0 if taken or the number of seconds to wait before trying
+        again. """
+        with self.lock:
+            limit = self.regions[region]
+            wait = max(self.bucket.wait_time(), limit.bucket.wait_time())
+            if wait == 0:
+                self.bucket.take()
+                limit.bucket.take()
+            return wait
+
+    def acquire(self, region, check_stop=None):
+        """ Block until a token for region is available, check_stop will be called about once per second while
+        waiting. """
+        while True:
+            wait = self.try_acquire(region)
+            if wait == 0:
+                return
+            if check_stop:
+                check_stop()
+            self.sleep(min(wait, 1.0))
+
+    def report(self, region, status, retry_after=None):
+        """ Report status of a request to adjust the rate of region. """
+        with self.lock:
+            limit = self.regions[region]
+            limit.fetch_count += 1
+            if status in THROTTLE_STATUSES:
+                limit.throttle_count += 1
+                limit.adjust(self.THROTTLE_DECREASE, 0, self.MIN_RATE, self.MAX_RATE)
+                hold = min(self.MAX_RETRY_AFTER, self.DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+                limit.bucket.hold(hold)
+                if status == 429:
+                    # The quota is per client and not per region, so everyone needs to hold.
+                    self.bucket.hold(hold)
+            elif status >= LOCAL_STATUS_MIN:
+                # Local failures says nothing about the api capacity, keep the rate.
+                limit.local_error_count += 1
+            elif status >= 500:
+                limit.error_count += 1
+                limit.adjust(self.ERROR_DECREASE, 0, self.MIN_RATE, self.MAX_RATE)
+            else:
+                limit.adjust(1, self.RATE_INCREASE, self.MIN_RATE, self.MAX_RATE)
+
+    def rate(self, region):
+        return self.regions[region].rate
+
+    def set_queue_depth(self, region, depth):
+        self.regions[region].queue_depth = depth
+
+    def stats(self):
+        """ Return current rates, queue depths and counters per region. """
+        with self.lock:
+            return {
+                region: {
+                    'rate': limit.rate,
+                    'queue_depth': limit.queue_depth,
+                    'fetch_count': limit.fetch_count,
+                    'throttle_count': limit.throttle_count,
+                    'error_count': limit.error_count,
+                    'local_error_count': limit.local_error_count,
+                } for region, limit in self.regions.items()
+            }
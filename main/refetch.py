@@ -1,15 +1,19 @@
 from datetime import timedelta
+from queue import Queue, Empty
 from time import perf_counter
 
-from django.db import transaction
+from django.db import transaction, connection
 from logging import getLogger
 
 from django.db.models import Min
 
 from main.fetch import update_ladder_cache, fetch_new_in_region
-from main.models import Season, Cache, Ladder, Ranking, Enums, get_db_name, Region
+from main.models import Season, Cache, Ladder, Ranking, RankingData, Enums, get_db_name, Region
 from main.battle_net import BnetClient, LAST_AVAILABLE_SEASON
-from common.utils import utcnow, to_unix, human_i_split
+from main.rate_limit import RateLimiter
+from main.repair import repair_ranking_incremental
+from main.update import put_queue
+from common.utils import utcnow, to_unix, human_i_split, StoppableThread, Stop
 from common.logging import log_context, LogContext
 from lib import sc2
 
@@ -18,6 +22,14 @@ logger = getLogger('django')
 sc2.set_logger(logger)
 
 
+# Max number of fetched ladders waiting to be merged before the region threads pause.
+REFETCH_PAST_QUEUE_MAX = 20
+
+# Save ranking (checkpoint) after this many merged ladders or seconds, whatever comes first.
+REFETCH_PAST_CHECKPOINT_LADDERS = 500
+REFETCH_PAST_CHECKPOINT_SECONDS = 600
+
+
 @log_context(feature='missing')
 def refetch_missing(region=None, max_retries=None, min_age=None, check_stop=lambda: None, bnet_client=None):
     """ Refetch missing ladders. Note that these ladders will not be added to any ranking if passed current season. """
@@ -81,8 +93,73 @@ def refetch_missing(region=None, max_retries=None, min_age=None, check_stop=lamb
                 logger.info("status is %d, updated cache, retry_count %d" % (cache.status, cache.retry_count))
 
 
+class RefetchPastThread(StoppableThread):
+    """ Refetch the ladders of one region and put them on fetched_queue for the merge consumer. A 503 stops the
+    region only, each region has its own api quota. Errors are kept in error for the consumer to raise. """
+
+    def __init__(self, region, ladders, fetched_queue, bnet_client, rate_limiter):
+        super(RefetchPastThread, self).__init__()
+        self.region = region
+        self.ladders = ladders
+        self.fetched_queue = fetched_queue
+        self.bnet_client = bnet_client
+        self.rate_limiter = rate_limiter
+        self.error = None
+
+    @log_context(feature='past')
+    def do_run(self):
+        try:
+            for i, ladder in enumerate(self.ladders, start=1):
+                self.check_stop()
+                self.rate_limiter.acquire(self.region, self.check_stop)
+
+                res = self.bnet_client.fetch_ladder(ladder.region, ladder.bid, timeout=20)
+                self.rate_limiter.report(self.region, res.status, res.retry_after)
+
+                logger.info("fetched %s got %d in %.2fs, %s (%d/%d)" %
+                            (res.api_ladder.url, res.status, res.fetch_duration, ladder.info(), i, len(self.ladders)))
+
+                if res.status == 503:
+                    logger.warning("got 503, skipping refetch past for rest of this region")
+                    return
+
+                if res.status != 200:
+                    logger.info("refetching %d returned %d, skipping ladder" % (ladder.id, res.status))
+                    continue
+
+                put_queue(self.fetched_queue, (ladder, res.status, res.api_ladder, res.fetch_time), self.check_stop)
+        except Stop:
+            raise
+        except Exception as e:
+            logger.exception("refetch past failed")
+            self.error = e
+        finally:
+            connection.close()
+
+
+def save_refetch_checkpoint(cpp, ranking, season):
+    """ Save ranking data and stats. Ladders are marked as refetched when their cache is saved so a later run will
+    only fetch the rest, see resume_refetch_past. """
+    logger.info("saving ranking data and ranking stats for ranking %d" % ranking.id)
+    cpp.save_data(ranking.id, ranking.season_id, to_unix(utcnow()))
+    cpp.save_stats(ranking.id, to_unix(utcnow()))
+    ranking.set_data_time(season, cpp)
+    ranking.save()
+
+
+def resume_refetch_past(cpp, ranking, season):
+    """ If an earlier refetch was interrupted after the last checkpoint there are ladders refetched after the ranking
+    data was saved, replay their caches to make the ranking complete again before continuing. """
+    saved = RankingData.objects.filter(ranking=ranking).values_list('updated', flat=True).first()
+    if saved and Ladder.objects.filter(season=season, updated__gt=saved).exists():
+        logger.info("resuming interrupted refetch of season %d, repairing ranking %d" % (season.id, ranking.id))
+        if repair_ranking_incremental(cpp, ranking):
+            save_refetch_checkpoint(cpp, ranking, season)
+
+
 def refetch_past_season(season, now, check_stop, bnet_client, force=False):
-    """ Refetch ladders for past seasons. """
+    """ Refetch ladders for past seasons, with one fetch thread per region and merging into the ranking in this
+    thread. Progress is checkpointed by saving the ranking regularly. """
 
     start = perf_counter()
 
@@ -106,63 +183,78 @@ def refetch_past_season(season, now, check_stop, bnet_client, force=False):
         if not force:
             ladders_query = ladders_query.filter(updated__lt=need_refetch_limit)
 
-        ladders = list(ladders_query)
+        ladders = list(ladders_query.select_related('season').order_by('id'))
         ladders_count = ladders_query.count()
 
         logger.info(f"{len(ladders)} (of {ladders_count}) to refetch for season {season.id}")
 
-    # if not ladders:
-    #     return
+    # Since c++ works in it's own db connection we can't fetch ladders and update ranking in same transaction, if the
+    # code fails the ranking is repaired from the saved caches on next run.
 
-    # This is kind of bad but since c++ works in it's own db connection we can't fetch ladders and update
-    # ranking in same transaction, which in turn means that if the code fails here ranking needs to be repaired.
-    
     cpp = sc2.RankingData(get_db_name(), Enums.INFO)
     cpp.load(ranking.id)
 
-    fetch_time = 0
+    resume_refetch_past(cpp, ranking, season)
 
-    try:
-        for i, ladder in enumerate(ladders, start=1):
-            check_stop()
+    regions = sorted({ladder.region for ladder in ladders})
+    fetched_queue = Queue(maxsize=REFETCH_PAST_QUEUE_MAX)
+    rate_limiter = RateLimiter(regions)
+    threads = [RefetchPastThread(region, [ladder for ladder in ladders if ladder.region == region],
+                                 fetched_queue, bnet_client, rate_limiter)
+               for region in regions]
+    for thread in threads:
+        thread.start()
 
-            with transaction.atomic(), LogContext(region=Region.key_by_ids[ladder.region]):
+    merged = 0
+    last_checkpoint = (0, perf_counter())
 
-                status, api_ladder, fetch_time, fetch_duration = \
-                    bnet_client.fetch_ladder(ladder.region, ladder.bid, timeout=20)
-
-                logger.info("fetched %s got %d in %.2fs, %s (%d/%d)" %
-                            (api_ladder.url, status, fetch_duration, ladder.info(), i, len(ladders)))
+    try:
+        while True:
+            check_stop()
 
-                if status == 503:
-                    logger.warning("got 503, skipping refetch past for rest of this season")
-                    raise SystemExit()
+            for thread in threads:
+                if thread.error:
+                    raise thread.error
 
-                if status != 200:
-                    logger.info("refetching %d returned %d, skipping ladder" % (ladder.id, status))
-                    continue
+            try:
+                ladder, status, api_ladder, fetch_time = fetched_queue.get(timeout=0.1)
+            except Empty:
+                if not any(thread.is_alive() for thread in threads) and fetched_queue.empty():
+                    break
+                continue
 
+            with transaction.atomic(), LogContext(region=Region.key_by_ids[ladder.region]):
                 update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time)
-
                 logger.info("saved updated ladder %d and added data to ranking %d" % (ladder.id, ranking.id))
+            merged += 1
+
+            if merged - last_checkpoint[0] >= REFETCH_PAST_CHECKPOINT_LADDERS \
+                    or perf_counter() - last_checkpoint[1] > REFETCH_PAST_CHECKPOINT_SECONDS:
+                save_refetch_checkpoint(cpp, ranking, season)
+                last_checkpoint = (merged, perf_counter())
 
     except SystemExit:
+        # Stop requested, everything merged is consistent so it is saved below.
         pass
 
     except Exception as e:
-        raise Exception("failure while refetching past, you will need to repair ranking %d:" % ranking.id) from e
-
-    if fetch_time:
-        logger.info("saving ranking data and ranking stats for ranking %d" % ranking.id)
-        cpp.save_data(ranking.id, ranking.season_id, to_unix(utcnow()))
-        cpp.save_stats(ranking.id, to_unix(utcnow()))
-        ranking.set_data_time(season, cpp)
-        ranking.save()
-    else:
+        raise Exception("failure while refetching past, ranking %d will be repaired on next run" % ranking.id) from e
+
+    finally:
+        for thread in threads:
+            thread.stop()
+        for thread in threads:
+            thread.join()
+
+    if merged > last_checkpoint[0]:
+        save_refetch_checkpoint(cpp, ranking, season)
+    elif not merged:
         logger.info("skipping save of ranking data and ranking stats for ranking %d, nothing changed" % ranking.id)
-        
+
+    cpp.release()
+
     logger.info(f"completed refetch of season {season.id} in {human_i_split(int(perf_counter() - start))} seconds")
-    
+
 
 @log_context(feature='past', region='ALL')
 def refetch_past_seasons(check_stop=lambda: None, bnet_client=None, now=None, skip_fetch_new=False, season_id=None):
@@ -0,0 +1,85 @@
+from logging import getLogger
+
+from common.utils import to_unix
+from lib import sc2
+from main.fetch import add_cache_to_ranking
+from main.models import Cache, Ladder, RankingData
+
+
+logger = getLogger('django')
+sc2.set_logger(logger)
+
+
+# Number of caches (and their ladders) fetched from the db at the time when replaying.
+REPLAY_BATCH_SIZE = 200
+
+
+def replay_caches(cpp, ranking, cache_ids, check_stop=lambda: None):
+    """ Add caches to the ranking data in the order of cache_ids. Caches not linked to anything will be linked to the
+    ranking, caches linked to something else will be copied. Caches and ladders are fetched in batches. """
+
+    count = len(cache_ids)
+    for start in range(0, count, REPLAY_BATCH_SIZE):
+        check_stop()
+
+        batch = cache_ids[start:start + REPLAY_BATCH_SIZE]
+        caches = Cache.objects.in_bulk(batch)
+        ladders = {(ladder.region, ladder.bid): ladder
+                   for ladder in Ladder.objects.filter(season=ranking.season,
+                                                       bid__in={cache.bid for cache in caches.values()})}
+
+        for i, id_ in enumerate(batch, start=start + 1):
+            cache = caches[id_]
+            ladder = ladders.get((cache.region, cache.bid))
+            if ladder is None:
+                raise Exception("ladder region %s, bid %s missing in ladder table" % (cache.region, cache.bid))
+
+            if cache.ranking_id is None and cache.ladder_id is None:
+                cache.ranking = ranking
+                cache.save()
+            elif cache.ranking_id != ranking.id:
+                logger.info("cache %s was not included in ranking copying" % cache.id)
+                cache.id = None
+                cache.ladder = None
+                cache.ranking = ranking
+                cache.save()
+
+            logger.info("adding cache %s, ladder %s, %d/%d" % (cache.id, ladder.id, i, count))
+
+            add_cache_to_ranking(cpp, ladder, cache)
+
+
+def stale_cache_ids(cpp, ranking):
+    """
+    Compare the ranking data in cpp (loaded from ranking) with the caches of the ranking and return ids of the caches
+    that needs to be replayed in replay order. A cache is stale if it is newer than the data of its teams in the
+    ranking or if no team in the ranking has it as source and it was updated after the ranking data was saved. Since
+    the latest added ladder wins when a team is in several ladders every cache updated after the first stale one is
+    replayed.
+    """
+
+    source_data_times = cpp.source_data_times()
+
+    saved = RankingData.objects.filter(ranking=ranking).values_list('updated', flat=True).first()
+    saved = to_unix(saved) if saved else 0
+
+    caches = list(ranking.sources.filter(type=Cache.LADDER).order_by('updated', 'id').values_list('id', 'updated'))
+
+    for i, (id_, updated) in enumerate(caches):
+        data_time = source_data_times.get(id_)
+        updated = to_unix(updated)
+        if (data_time is None and updated > saved) or (data_time is not None and data_time + 1e-3 < updated):
+            return [id_ for id_, _ in caches[i:]]
+
+    return []
+
+
+def repair_ranking_incremental(cpp, ranking, check_stop=lambda: None):
+    """ Replay the stale caches of the ranking, cpp should have the ranking loaded. Returns number of replayed
+    caches. """
+
+    cache_ids = stale_cache_ids(cpp, ranking)
+    logger.info("%d of %d caches needs to be replayed to repair ranking %d" %
+                (len(cache_ids), ranking.sources.count(), ranking.id))
+    replay_caches(cpp, ranking, cache_ids, check_stop)
+    return len(cache_ids)
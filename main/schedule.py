@@ -0,0 +1,147 @@
+import heapq
+from itertools import count
+from threading import Lock
+
+from common.utils import to_unix, utcnow
+from main.battle_net import NOT_MODIFIED
+from main.models import League, Mode
+
+
+class LadderScheduler(object):
+    """
+    Priority queue of ladders to refresh for one region. Each ladder gets a target refresh interval based on league,
+    member count and how much it changed at the last fetch, the ladder that is most overdue (last fetch + interval)
+    is handed out next. Ladders that are not yet due are not handed out.
+    """
+
+    # Base refresh interval in seconds.
+    GM_INTERVAL = 60
+    PLAT_1V1_INTERVAL = 600
+    REST_INTERVAL = 3600
+
+    # Games played since last fetch for a ladder to be considered very active.
+    ACTIVE_GAMES = 20
+
+    # Members in a full ladder.
+    FULL_LADDER = 100
+
+    class Entry(object):
+
+        def __init__(self, ladder, due):
+            self.ladder = ladder
+            self.due = due
+            self.games = None
+            self.etag = None
+            self.activity = 1.0
+            self.version = 0
+
+    def __init__(self, clock=lambda: to_unix(utcnow())):
+        self.clock = clock
+        self.lock = Lock()
+        self.entries = {}
+        self.in_flight = set()
+        self.heap = []
+        self.seq = count()
+
+    def base_interval(self, ladder):
+        if ladder.league == League.GRANDMASTER:
+            return self.GM_INTERVAL
+        if ladder.mode == Mode.TEAM_1V1 and ladder.league >= League.PLATINUM:
+            return self.PLAT_1V1_INTERVAL
+        return self.REST_INTERVAL
+
+    def interval(self, entry):
+        """ Target interval, quiet and small ladders are refreshed less often, very active ladders more often. """
+        member_count = min(self.FULL_LADDER, entry.ladder.member_count or 0)
+        size_factor = 2 - member_count / self.FULL_LADDER
+        return self.base_interval(entry.ladder) * size_factor * entry.activity
+
+    def _push(self, entry):
+        entry.version += 1
+        heapq.heappush(self.heap, (entry.due, next(self.seq), entry.ladder.id, entry.version))
+
+    def update(self, ladders):
+        """ Set the ladders to schedule, new ladders are added (due according to their updated time), ladders not in
+        ladders are removed, existing ladders keep their state. """
+        with self.lock:
+            entries = {}
+            for ladder in ladders:
+                entry = self.entries.get(ladder.id)
+                if entry:
+                    entry.ladder = ladder
+                else:
+                    entry = self.Entry(ladder, 0)
+                    entry.due = to_unix(ladder.updated) + self.interval(entry)
+                    if ladder.id not in self.in_flight:
+                        self._push(entry)
+                entries[ladder.id] = entry
+            self.entries = entries
+
+    def pop(self):
+        """ Return the most overdue ladder or None if no ladder is due. The ladder needs to be handed back with
+        fetched. """
+        with self.lock:
+            now = self.clock()
+            while self.heap:
+                due, _, ladder_id, version = self.heap[0]
+                entry = self.entries.get(ladder_id)
+                if entry is None or entry.version != version:
+                    heapq.heappop(self.heap)
+                    continue
+                if due > now:
+                    return None
+                heapq.heappop(self.heap)
+                self.in_flight.add(ladder_id)
+                return entry.ladder
+            return None
+
+    def etag(self, ladder):
+        """ Return etag of the last fetch of ladder or None. """
+        with self.lock:
+            entry = self.entries.get(ladder.id)
+            return entry and entry.etag
+
+    def forget_etag(self, ladder):
+        """ Forget the etag of ladder and make it due now, the next fetch will get the whole ladder. """
+        with self.lock:
+            entry = self.entries.get(ladder.id)
+            if entry is None:
+                return
+            entry.etag = None
+            if ladder.id not in self.in_flight:
+                entry.due = self.clock()
+                self._push(entry)
+
+    def fetched(self, ladder, status, api_ladder=None, etag=None):
+        """ Reschedule ladder after fetch, activity is based on games played since last fetch. """
+        with self.lock:
+            self.in_flight.discard(ladder.id)
+            entry = self.entries.get(ladder.id)
+            if entry is None:
+                return
+
+            if status == NOT_MODIFIED:
+                entry.activity = 2.0
+            elif status == 200 and api_ladder is not None:
+                entry.etag = etag
+                games = api_ladder.games_played()
+                if entry.games is not None:
+                    delta = games - entry.games
+                    if delta <= 0:
+                        entry.activity = 2.0
+                    else:
+                        entry.activity = max(0.5, min(1.0, self.ACTIVE_GAMES / delta))
+                entry.games = games
+
+            entry.due = self.clock() + self.interval(entry)
+            self._push(entry)
+
+    def overdue_count(self):
+        """ Number of ladders due for refresh. """
+        with self.lock:
+            now = self.clock()
+            return sum(1 for ladder_id, entry in self.entries.items()
+                       if entry.due <= now and ladder_id not in self.in_flight)
+
+    def __len__(self):
+        return len(self.entries)
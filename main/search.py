@@ -0,0 +1,144 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as Base64Error
+
+from django.db.models import Count, Q, Func, Value, CharField, Field
+from django.db.models.functions import Upper
+
+from main.models import Player, ClanTeam, Season
+
+
+#
+# Player and clan search. Both are case insensitive prefix searches backed by the expression indexes created in
+# migrations 0018_search_indexes, 0019_clan_team and 0022_player_search_by_season (postgres only).
+#
+
+
+class SearchName(Func):
+    """ Upper case name compared byte by byte (C collation in postgres) as in the player_search_by_season index, so
+    prefix matching and ordering on it can use the index. """
+    function = 'UPPER'
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection):
+        sql, params = self.as_sql(compiler, connection)
+        return '%s COLLATE "C"' % sql, params
+
+
+class Row(Func):
+    """ Row value, rows are compared column by column. """
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+# Order of players in search. Seasons are searched one at a time in descending order and within a season players are
+# ordered on the columns after season_id in the player_search_by_season index, so every page is read in order from the
+# index. Players are always saved with season and mode (see c++ db), the few without are not included.
+SEASON_PLAYER_ORDER = (SearchName('name'), 'mode', 'name', 'region', 'bid', 'id')
+SEASON_PLAYER_REVERSE_ORDER = (SearchName('name').desc(), '-mode', '-name', '-region', '-bid', '-id')
+
+
+def player_key(player):
+    """ Return the keyset pagination key of player. """
+    return [player.season_id, player.mode, player.name, player.region, player.bid, player.id]
+
+
+def encode_key(key):
+    """ Encode a key to a string usable in urls. """
+    return urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_key(value):
+    """ Decode a key encoded with encode_key, returns None if value is not a valid player key. """
+    try:
+        key = json.loads(urlsafe_b64decode(value.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError, Base64Error):
+        return None
+
+    if not isinstance(key, list) or len(key) != 6 or not isinstance(key[2], str) \
+            or not all(isinstance(v, int) for i, v in enumerate(key) if i != 2):
+        return None
+
+    return key
+
+
+def filter_key(query, key, forward):
+    """ Filter query to players after key (or before if not forward) in the season of key, a row comparison on the
+    index columns so the index can be used to find the start. """
+    _, mode, name, region, bid, id_ = key
+    key_row = Row(SearchName(Value(name)), Value(mode), Value(name), Value(region), Value(bid), Value(id_))
+    return query.annotate(row=Row(*SEASON_PLAYER_ORDER)).filter(**{'row__gt' if forward else 'row__lt': key_row})
+
+
+def player_search_query(prefix, season_id):
+    return Player.objects \
+        .annotate(search_name=SearchName('name')) \
+        .filter(season_id=season_id, mode__isnull=False, search_name__startswith=Upper(Value(prefix)))
+
+
+def search_seasons(key=None, forward=True):
+    """ Return ids of the seasons to search in order, starting with the season of key if given. """
+    seasons = Season.objects.order_by('-id' if forward else 'id')
+    if key is not None:
+        seasons = seasons.filter(id__lte=key[0]) if forward else seasons.filter(id__gte=key[0])
+    return list(seasons.values_list('id', flat=True))
+
+
+def search_players(prefix, after=None, before=None, limit=32):
+    """
+    Return (players, prev_key, next_key) with at most limit players with name starting with prefix (case
+    insensitive) directly after key after, or directly before key before. The prev_key and next_key are keys to use
+    for the pages before and after, they are None if there are no players there.
+
+    The ids are selected season by season using only columns in the player_search_by_season index (so it can be an
+    index only scan), then only the players of the page are fetched.
+    """
+
+    forward = before is None
+    key = after if forward else before
+    order = SEASON_PLAYER_ORDER if forward else SEASON_PLAYER_REVERSE_ORDER
+
+    ids = []
+    for season_id in search_seasons(key, forward):
+        query = player_search_query(prefix, season_id)
+        if key is not None and season_id == key[0]:
+            query = filter_key(query, key, forward)
+        ids += query.order_by(*order).values_list('id', flat=True)[:limit + 1 - len(ids)]
+        if len(ids) > limit:
+            break
+
+    more = len(ids) > limit
+    ids = ids[:limit]
+    if not forward:
+        ids.reverse()
+
+    players = Player.objects.in_bulk(ids)
+    players = [players[id_] for id_ in ids]
+
+    if not players:
+        return players, None, None
+
+    if not forward:
+        return players, player_key(players[0]) if more else None, player_key(players[-1])
+
+    return players, player_key(players[0]) if after is not None else None, player_key(players[-1]) if more else None
+
+
+def count_players(prefix, limit):
+    """ Return number of players with name starting with prefix (case insensitive), but at most limit. """
+    count = 0
+    for season_id in search_seasons():
+        count += player_search_query(prefix, season_id).values('id')[:limit - count].count()
+        if count >= limit:
+            break
+    return count
+
+
+def search_clans(prefix, season, limit=32):
+    """ Return list of clans (clan, tag, count) where the clan name or the tag starts with prefix (case insensitive).
+    Count is number of 1v1 teams in season, the limit clans with most teams are returned. """
+
+    return list(ClanTeam.objects
+                .filter(season=season)
+                .filter(Q(clan__istartswith=prefix) | Q(tag__istartswith=prefix))
+                .values('clan', 'tag').annotate(count=Count('tag')).order_by('-count')[:limit])
@@ -1,15 +1,19 @@
 import json
 import socket
-from collections import deque
 from datetime import timedelta
 from logging import getLogger, INFO, WARNING
-from time import sleep
-from django.db import transaction
-from common.utils import utcnow, to_unix, StoppableThread
-from main.battle_net import BnetClient, ApiLadder
+from queue import Queue, Empty, Full
+from threading import Lock
+from time import sleep, monotonic
+from django.db import connection, transaction
+from common.cache import bump_ranking_generation
+from common.utils import utcnow, to_unix, StoppableThread, Stop, iterate_query_chunked
+from main.battle_net import BnetClient, NOT_MODIFIED
 from main.client import request_udp, request_tcp
-from main.fetch import update_ladder_cache
-from main.models import Enums, Ladder, League, Mode, Version, Season, Ranking, get_db_name, Region
+from main.fetch import save_ladder_cache, add_cache_to_ranking, merged_cache, set_merged, MissingCache
+from main.models import Cache, Enums, Ladder, League, Mode, Version, Season, Ranking, get_db_name, Region
+from main.rate_limit import RateLimiter, THROTTLE_STATUSES
+from main.schedule import LadderScheduler
 from common.logging import log_context, LogContext
 from lib import sc2
 
@@ -18,144 +22,103 @@ logger = getLogger('django')
 sc2.set_logger(logger)
 
 
-def interleave(*queues):
-    while any(queues):
-        for q in queues:
-            try:
-                batch = q[-1]
-                try:
-                    yield batch.pop()
-                except IndexError:
-                    q.pop()
-            except IndexError:
-                pass
+def put_queue(queue, item, check_stop):
+    """ Put item on a bounded queue, blocking while it is full (backpressure), check_stop is called while waiting. """
+    while True:
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Full:
+            check_stop()
 
 
 class FetcherThread(StoppableThread):
 
-    DELAY_MAX = 256
-
-    def __init__(self, season, region, fetched_queue, bnet_client):
+    def __init__(self, season, region, fetched_queue, bnet_client, rate_limiter):
         super(FetcherThread, self).__init__()
         self.bnet_client = bnet_client
+        self.rate_limiter = rate_limiter
         self.season = season
         self.region = region
         self.fetched_queue = fetched_queue
-        self.gm_batches = deque()
-        self.plat_batches = deque()
-        self.rest_batches = deque()
+        self.scheduler = LadderScheduler()
 
-    @log_context(feature='queue')
-    def add(self, queue, what, batch):
-        queues_len = sum((len(q) for q in queue))
-        if len(queue) > 1:
-            logger.info("%s queue has batch backlog (%d ladders), not adding" % (what, queues_len))
-        else:
-            logger.info("%s queue got new batch of length %d, length before was %d" % (what, len(batch), queues_len))
-            queue.appendleft(batch)
+    @log_context(feature='fetch')
+    def do_run(self):
+
+        while not self.check_stop(throw=False):
+            self.rate_limiter.set_queue_depth(self.region, self.scheduler.overdue_count())
 
-    def add_gm(self, batch):
-        self.add(self.gm_batches, 'gm', batch)
+            ladder = self.scheduler.pop()
+            if ladder is None:
+                sleep(0.5)
+                continue
 
-    def add_plat(self, batch):
-        self.add(self.plat_batches, 'plat', batch)
+            try:
+                self.rate_limiter.acquire(self.region, self.check_stop)
 
-    def add_rest(self, batch):
-        self.add(self.rest_batches, 'rest', batch)
+                res = self.bnet_client.fetch_ladder(ladder.region, ladder.bid, timeout=60,
+                                                    etag=self.scheduler.etag(ladder))
+            except Exception:
+                self.scheduler.fetched(ladder, None)
+                raise
 
-    def __iter__(self):
-        return interleave(self.gm_batches, self.plat_batches, self.rest_batches)
+            self.rate_limiter.report(self.region, res.status, res.retry_after)
+            self.scheduler.fetched(ladder, res.status, res.api_ladder, res.etag)
 
-    @log_context(feature='fetch')
-    def do_run(self):
+            logger.info("fetched %s got %d in %.2fs, ladder %d, %s, %s, %s" %
+                        (res.api_ladder.url, res.status, res.fetch_duration, ladder.bid, Mode.key_by_ids[ladder.mode],
+                         Version.key_by_ids[ladder.version], League.key_by_ids[ladder.league]))
 
-        delay = 1
-        while not self.check_stop(throw=False):
-            for ladder in self:
-                self.check_stop()
-
-                status, api_ladder, fetch_time, fetch_duration = \
-                    self.bnet_client.fetch_ladder(ladder.region, ladder.bid, timeout=60)
-
-                logger.info("fetched %s got %d in %.2fs, ladder %d, %s, %s, %s" %
-                            (api_ladder.url, status, fetch_duration, ladder.bid, Mode.key_by_ids[ladder.mode],
-                             Version.key_by_ids[ladder.version], League.key_by_ids[ladder.league]))
-
-                if status == 200:
-                    self.fetched_queue.appendleft((ladder, status, api_ladder, fetch_time))
-
-                # Simple fetch throttle, 10 requests/s allowed -> 2/s/thread -> 0,5s min time.
-                if fetch_duration < 0.5:
-                    sleep(0.5 - fetch_duration + 0.1)
-                elif fetch_duration < 1:
-                    sleep(0.2)
-
-                if status != 200 or len(self.fetched_queue) > 20:
-                    delay = min(self.DELAY_MAX + 1, delay * 2)
-                    if delay == self.DELAY_MAX:
-
-                        level = INFO if self.region == Region.CN else WARNING
-                        logger.log(level, "delay hit %ds, got many bad statuses (status now %d) or queue is too big "
-                                          "(now %d)" % (self.DELAY_MAX, status, len(self.fetched_queue)))
-                    for i in range(min(self.DELAY_MAX, delay)):
-                        self.check_stop()
-                        sleep(1)
-                else:
-                    delay = 1
+            if res.status in THROTTLE_STATUSES:
+                level = INFO if self.region == Region.CN else WARNING
+                logger.log(level, "got %d, backing off, retry after %s, rate is now %.2f/s" %
+                           (res.status, res.retry_after, self.rate_limiter.rate(self.region)))
 
-            sleep(0.04)
+            if res.status in (200, NOT_MODIFIED):
+                # Blocks when the pipeline is behind, this does not affect the api rate.
+                put_queue(self.fetched_queue, (ladder, res.status, res.api_ladder, res.fetch_time), self.check_stop)
 
 
 class FetchManager(object):
 
+    # Max number of fetched ladders waiting to be saved before the fetchers pause.
+    FETCHED_QUEUE_MAX = 20
+
     def __init__(self, ranking, regions, bnet_client):
-        self.fetched_queue = deque()
+        self.fetched_queue = Queue(maxsize=self.FETCHED_QUEUE_MAX)
         self.ranking = ranking
         self.regions = regions
+        self.rate_limiter = RateLimiter(regions)
         self.threads = {}
         for region in self.regions:
-            thread = FetcherThread(ranking.season, region, self.fetched_queue, bnet_client)
+            thread = FetcherThread(ranking.season, region, self.fetched_queue, bnet_client, self.rate_limiter)
             thread.start()
             self.threads[region] = thread
 
-    def start_gm(self):
-        for region, thread in sorted(self.threads.items()):
-            ladders = deque(Ladder.objects
-                            .filter(region=region,
-                                    strangeness=Ladder.GOOD,
-                                    season=self.ranking.season,
-                                    league=League.GRANDMASTER)
-                            .order_by('updated')
-                            .all())
-            thread.add_gm(ladders)
-
-    def start_plat(self):
-        for region, thread in sorted(self.threads.items()):
-            ladders = deque(Ladder.objects
-                            .filter(region=region,
-                                    strangeness=Ladder.GOOD,
-                                    season=self.ranking.season,
-                                    league__gte=League.PLATINUM,
-                                    mode=Mode.TEAM_1V1)
-                            .exclude(league=League.GRANDMASTER)
-                            .order_by('updated')
-                            .all())
-            thread.add_plat(ladders)
-
-    def start_rest(self):
+    @log_context(feature='queue')
+    def refresh_ladders(self):
+        """ Hand all ladders of the season to the schedulers, new ladders will be added and the state of already
+        scheduled ladders is kept. """
         for region, thread in sorted(self.threads.items()):
-            ladders = deque(Ladder.objects
-                            .filter(region=region,
-                                    strangeness=Ladder.GOOD,
-                                    season=self.ranking.season)
-                            .exclude(mode=Mode.TEAM_1V1, league__gte=League.PLATINUM)
-                            .exclude(league=League.GRANDMASTER)
-                            .order_by('updated')
-                            .all())
-            thread.add_rest(ladders)
-
-    def pop(self):
-        return self.fetched_queue.pop()
+            ladders = list(Ladder.objects.filter(region=region, strangeness=Ladder.GOOD, season=self.ranking.season))
+            thread.scheduler.update(ladders)
+            with LogContext(region=region):
+                logger.info("scheduling %d ladders, %d due for refresh" %
+                            (len(ladders), thread.scheduler.overdue_count()))
+
+    @log_context(feature='fetch')
+    def log_stats(self):
+        for region, stats in sorted(self.rate_limiter.stats().items()):
+            with LogContext(region=region):
+                logger.info("fetch rate %.2f/s, queue depth %d, fetched %d, throttled %d, errors %d, local errors %d" %
+                            (stats['rate'], stats['queue_depth'], stats['fetch_count'], stats['throttle_count'],
+                             stats['error_count'], stats['local_error_count']))
+
+    def forget_etag(self, ladder):
+        thread = self.threads.get(ladder.region)
+        if thread:
+            thread.scheduler.forget_etag(ladder)
 
     def stop(self):
         for thread in self.threads.values():
@@ -166,6 +129,150 @@ class FetchManager(object):
             thread.join()
 
 
+class PipelineStage(StoppableThread):
+    """ Stage of the update pipeline, runs process on every item of in_queue and puts results that are not None on
+    out_queue (blocking when it is full). If process raises the stage stops and the exception is kept in error for the
+    update loop to raise. """
+
+    def __init__(self, what, process, in_queue, out_queue=None):
+        super(PipelineStage, self).__init__()
+        self.what = what
+        self.process = process
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.count = 0
+        self.error = None
+
+    @log_context(feature='update')
+    def do_run(self):
+        try:
+            while not self.check_stop(throw=False):
+                try:
+                    item = self.in_queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                try:
+                    result = self.process(item)
+                    self.count += 1
+                    if result is not None and self.out_queue is not None:
+                        put_queue(self.out_queue, result, self.check_stop)
+                finally:
+                    self.in_queue.task_done()
+        except Stop:
+            raise
+        except Exception as e:
+            logger.exception("%s stage failed" % self.what)
+            self.error = e
+        finally:
+            connection.close()
+
+    def idle(self):
+        return self.in_queue.unfinished_tasks == 0
+
+
+class UpdatePipeline(object):
+    """
+    The stages after fetch, each running in its own thread connected by bounded queues:
+
+    fetched_queue -> persist (parse and save cache/ladder to db) -> merge_queue -> merge (add to ranking data in c++)
+
+    The periodic snapshot (save_ranking) is done by the update loop, it only holds the ranking data lock while copying
+    so merging can continue during a slow blob save. Full queues blocks the previous stage and finally the fetchers.
+    """
+
+    # Max number of saved caches waiting to be merged.
+    MERGE_QUEUE_MAX = 20
+
+    def __init__(self, cpp, ranking, fetched_queue, forget_etag=lambda ladder: None):
+        self.cpp = cpp
+        self.ranking = ranking
+        self.fetched_queue = fetched_queue
+        self.forget_etag = forget_etag
+        self.merge_queue = Queue(maxsize=self.MERGE_QUEUE_MAX)
+        self.merged = []
+        self.merged_lock = Lock()
+        self.persist_stage = PipelineStage('persist', self.persist, fetched_queue, self.merge_queue)
+        self.merge_stage = PipelineStage('merge', self.merge, self.merge_queue)
+        self.stages = [self.persist_stage, self.merge_stage]
+        self.last_counts = [0 for _ in self.stages]
+        self.last_time = monotonic()
+
+    def persist(self, item):
+        ladder, status, api_ladder, fetch_time = item
+        try:
+            with transaction.atomic():
+                lc = save_ladder_cache(self.ranking, ladder, status, api_ladder, fetch_time)
+        except MissingCache as e:
+            with LogContext(region=ladder.region):
+                logger.warning("%s, fetching it again without etag" % e)
+            self.forget_etag(ladder)
+            return None
+        if lc is None:
+            with LogContext(region=ladder.region):
+                logger.info("ladder %d unchanged, skipped update of ranking %d" % (ladder.id, self.ranking.id))
+            return None
+        return ladder, lc
+
+    def merge(self, item):
+        ladder, lc = item
+        stats = add_cache_to_ranking(self.cpp, ladder, lc)
+        with self.merged_lock:
+            self.merged.append(merged_cache(lc))
+        with LogContext(region=ladder.region):
+            logger.info("saved updated ladder %d and added data to ranking %d, "
+                        "updated %d players %d teams, inserted %d players %d teams, "
+                        "cache sizes %d players %d teams" %
+                        (ladder.id,
+                         self.ranking.id,
+                         stats["updated_player_count"],
+                         stats["updated_team_count"],
+                         stats["inserted_player_count"],
+                         stats["inserted_team_count"],
+                         stats["player_cache_size"],
+                         stats["team_cache_size"],
+                         ))
+
+    def take_merged(self):
+        """ Return caches merged since last call (see set_merged), take them before saving the ranking data. """
+        with self.merged_lock:
+            merged, self.merged = self.merged, []
+        return merged
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def check(self):
+        """ Raise the error of a failed stage. """
+        for stage in self.stages:
+            if stage.error:
+                raise stage.error
+
+    def queue_length(self):
+        return self.fetched_queue.qsize() + self.merge_queue.qsize()
+
+    def stop(self):
+        """ Stop and join the stages. Caches already saved are merged before the merge stage stops. A saved cache that
+        is dropped anyway (persist stopped while blocked on a full merge queue) has no data_hash and will be merged on
+        next fetch, see save_ladder_cache. """
+        self.persist_stage.stop()
+        self.persist_stage.join()
+        while self.merge_stage.is_alive() and not self.merge_stage.idle():
+            sleep(0.04)
+        self.merge_stage.stop()
+        self.merge_stage.join()
+
+    def log_stats(self):
+        now = monotonic()
+        elapsed = max(now - self.last_time, 1e-3)
+        for i, stage in enumerate(self.stages):
+            count = stage.count
+            logger.info("%s stage processed %d (%.2f/s), %d waiting" %
+                        (stage.what, count, (count - self.last_counts[i]) / elapsed, stage.in_queue.qsize()))
+            self.last_counts[i] = count
+        self.last_time = now
+
+
 class UpdateManager(object):
     """
     Handle how updates are managed. Holds the fetch manager and decides when ranking should be saved and when we
@@ -175,7 +282,9 @@ class UpdateManager(object):
     server_ping_timeout = 10.0
     
     @classmethod
-    def save_ranking(self, cpp, ranking, queue_length):
+    def save_ranking(self, cpp, ranking, queue_length, merged=()):
+        """ Save ranking data and stats, merged are the caches added to the ranking data before the save, see
+        set_merged. """
         ranking.set_data_time(ranking.season.reload(), cpp)
 
         logger.info("saving ranking %d, %d updates left in queue not included, new data_time is %s" %
@@ -186,6 +295,9 @@ class UpdateManager(object):
         ranking.status = Ranking.COMPLETE_WITH_DATA
         ranking.save()
 
+        # The saved ranking data includes these caches, unchanged refetches of them can be skipped from now on.
+        set_merged(merged)
+
         # Ping server to reload ranking.
         try:
             raw = request_tcp('localhost', 4747,
@@ -194,7 +306,8 @@ class UpdateManager(object):
             response = json.loads(raw.decode('utf-8'))
             code = response.get('code')
             if code == 'ok':
-                logger.info("refresh ping returned ok")
+                # The server has reloaded the saved data, values cached before this may be from the old data.
+                logger.info("refresh ping returned ok, ranking generation is now %d" % bump_ranking_generation())
             else:
                 logger.warning("refresh ping returned %s" % code)
 
@@ -209,6 +322,8 @@ class UpdateManager(object):
 
         bnet_client = bnet_client or BnetClient()
         fetch_manager = fetch_manager or FetchManager(ranking, regions, bnet_client)
+        pipeline = UpdatePipeline(cpp, ranking, fetch_manager.fetched_queue, fetch_manager.forget_etag)
+        pipeline.start()
 
         try:
 
@@ -217,12 +332,12 @@ class UpdateManager(object):
 
             last_save = utcnow()
             last_season_check = utcnow()
-            last_gm = utcnow(days=-20)
-            last_plat = utcnow(days=-20)
-            last_rest = utcnow(days=-20)
+            last_refresh = utcnow(days=-20)
 
             while not check_stop(throw=False):
 
+                pipeline.check()
+
                 now = utcnow()
 
                 if now > until:
@@ -237,51 +352,73 @@ class UpdateManager(object):
                         break
 
                 if now - last_save > timedelta(seconds=60):
-                    self.save_ranking(cpp, ranking, len(fetch_manager.fetched_queue))
+                    self.save_ranking(cpp, ranking, pipeline.queue_length(), pipeline.take_merged())
+                    fetch_manager.log_stats()
+                    pipeline.log_stats()
                     last_save = utcnow()  # This can take a long time, so get new now again.
 
-                if now - last_gm > timedelta(seconds=60):
-                    last_gm = now
-                    fetch_manager.start_gm()
+                if now - last_refresh > timedelta(minutes=10):
+                    last_refresh = now
+                    fetch_manager.refresh_ladders()
 
-                if now - last_plat > timedelta(minutes=10):
-                    last_plat = now
-                    fetch_manager.start_plat()
-
-                if now - last_rest > timedelta(minutes=60):
-                    last_rest = now
-                    fetch_manager.start_rest()
-
-                try:
-                    ladder, status, api_ladder, fetch_time = fetch_manager.pop()
-
-                    with transaction.atomic():
-                        stats = update_ladder_cache(cpp, ranking, ladder, status, api_ladder, fetch_time)
-                        with LogContext(region=ladder.region):
-                            logger.info("saved updated ladder %d and added data to ranking %d, "
-                                        "updated %d players %d teams, inserted %d players %d teams, "
-                                        "cache sizes %d players %d teams" %
-                                        (ladder.id,
-                                         ranking.id,
-                                         stats["updated_player_count"],
-                                         stats["updated_team_count"],
-                                         stats["inserted_player_count"],
-                                         stats["inserted_team_count"],
-                                         stats["player_cache_size"],
-                                         stats["team_cache_size"],
-                                         ))
-
-                except IndexError:
-                    sleep(0.04)
+                sleep(0.1)
 
             logger.info("stopped fetching, saving")
             fetch_manager.stop()
+            pipeline.stop()
             fetch_manager.join()
-            self.save_ranking(cpp, ranking, len(fetch_manager.fetched_queue))
+            pipeline.check()
+            self.save_ranking(cpp, ranking, pipeline.queue_length(), pipeline.take_merged())
         except Exception:
             fetch_manager.stop()
+            pipeline.stop()
             raise
-        cpp.release()
+
+
+# Players and teams seen this number of days back are preloaded into the ranking data caches at start and season switch.
+PRELOAD_DAYS = 14
+
+
+def copy_sources(ranking, new_ranking, created):
+    """ Copy all caches of ranking to new ranking using one statement, returns list of (old cache id, new cache id,
+    updated). """
+    with connection.cursor() as cursor:
+        cursor.execute("WITH new AS ("
+                       "  INSERT INTO cache"
+                       "    (url, bid, type, region, status, created, updated, data, data_hash, retry_count,"
+                       "     ranking_id)"
+                       "  SELECT url, bid, type, region, status, %s, updated, data, data_hash, retry_count, %s"
+                       "    FROM cache WHERE ranking_id = %s"
+                       "  RETURNING id, region, bid, type)"
+                       " SELECT o.id, n.id, o.updated FROM new n JOIN cache o"
+                       "   ON o.ranking_id = %s AND o.region = n.region AND o.bid = n.bid AND o.type = n.type",
+                       [created, new_ranking.id, ranking.id, ranking.id])
+        return cursor.fetchall()
+
+
+def replay_sources(cpp, ranking, unmerged_only=False):
+    """ Add all caches of ranking (only the ones without data_hash if unmerged_only) to the ranking data. Returns the
+    added caches without data_hash for save_ranking, see set_merged. """
+    caches = ranking.sources.filter(type=Cache.LADDER)
+    if unmerged_only:
+        caches = caches.filter(data_hash__isnull=True)
+    count = caches.count()
+    logger.info("adding %d cached ladders to ranking %d" % (count, ranking.id))
+
+    ladders = {(ladder.region, ladder.bid): ladder
+               for ladder in Ladder.objects.filter(bid__in=caches.values('bid'))}
+
+    merged = []
+    for i, lc in enumerate(iterate_query_chunked(caches, chunk_size=256), start=1):
+        stats = add_cache_to_ranking(cpp, ladders[(lc.region, lc.bid)], lc)
+        if lc.data_hash is None:
+            merged.append(merged_cache(lc))
+
+        if i % 100 == 0:
+            logger.info("added cache %d/%d, player cache size %d, team cache size %d" %
+                        (i, count, stats['player_cache_size'], stats['team_cache_size']))
+
+    return merged
 
 
 @log_context(region='ALL', feature='update')
@@ -297,6 +434,10 @@ def countinously_update(regions=None, check_stop=None, update_manager=None, swit
     season = ranking.season
 
     cpp = sc2.RankingData(get_db_name(), Enums.INFO)
+    cpp.preload(utcnow(days=-PRELOAD_DAYS).date().isoformat())
+
+    # Id of the ranking that the ranking data in cpp is up to date with.
+    loaded_ranking_id = None
 
     while not check_stop(throw=False):
 
@@ -328,6 +469,7 @@ def countinously_update(regions=None, check_stop=None, update_manager=None, swit
 
             cpp.clear_team_ranks()
             cpp.reconnect_db()
+            cpp.preload(utcnow(days=-PRELOAD_DAYS).date().isoformat())
             update_manager.save_ranking(cpp, ranking, 0)
 
         elif ((ranking.created + timedelta(hours=48) < now
@@ -335,7 +477,6 @@ def countinously_update(regions=None, check_stop=None, update_manager=None, swit
               and not ranking.season.near_start(now, days=4)):
             # Create a new ranking within the season.
 
-            cpp.clear_team_ranks()
             cpp.reconnect_db()
 
             with transaction.atomic():
@@ -345,50 +486,38 @@ def countinously_update(regions=None, check_stop=None, update_manager=None, swit
                                                      min_data_time=ranking.min_data_time,
                                                      max_data_time=ranking.max_data_time,
                                                      status=Ranking.CREATED)
-                # Copy all caches of old ranking to new ranking. Also remake the full ranking while doing so to get
-                # rid of leave leaguers.
 
                 logger.info("created new ranking %d basing it on copy of ranking %d, seaons %d" %
                             (new_ranking.id, ranking.id, season.id))
 
-                count = ranking.sources.count()
-                logger.info("copying %d cached ladders from ranking %d to ranking %d and adding them to ranking" %
-                            (count, ranking.id, new_ranking.id))
-
-                for i, lc in enumerate(ranking.sources.all(), start=1):
-                    lc.pk = None
-                    lc.created = utcnow()
-                    lc.ladder = None
-                    lc.ranking = ranking
-                    lc.save()
-
-                    new_ranking.sources.add(lc)
-
-                    ladder = Ladder.objects.get(region=lc.region, bid=lc.bid)
-                    team_size = Mode.team_size(ladder.mode)
-                    stats = cpp.update_with_ladder(ladder.id,
-                                                   lc.id,
-                                                   ladder.region,
-                                                   ladder.mode,
-                                                   ladder.league,
-                                                   ladder.tier,
-                                                   ladder.version,
-                                                   ladder.season_id,
-                                                   to_unix(lc.updated),
-                                                   lc.updated.date().isoformat(),
-                                                   team_size,
-                                                   ApiLadder(lc.data, lc.url).members_for_ranking(team_size))
-
-                    if i % 100 == 0:
-                        logger.info("copied and added cache %d/%d, player cache size %d, team cache size %d" %
-                                    (i, count, stats['player_cache_size'], stats['team_cache_size']))
+                sources = copy_sources(ranking, new_ranking, now)
+
+                logger.info("copied %d cached ladders from ranking %d to ranking %d" %
+                            (len(sources), ranking.id, new_ranking.id))
+
+                if loaded_ranking_id == ranking.id:
+                    # The ranking data in memory is up to date with the old ranking, derive the new ranking from it.
+                    # Teams not in their source ladder any more are leave leaguers and are removed.
+                    removed = cpp.rollover({old_id: (new_id, to_unix(updated))
+                                            for old_id, new_id, updated in sources})
+                    logger.info("rolled over ranking data to ranking %d, removed %d leave leaguer team ranks" %
+                                (new_ranking.id, removed))
+
+                    # Caches without data_hash may not be merged (see UpdatePipeline.stop), the teams of their ladders
+                    # were removed by the rollover, add them again.
+                    merged = replay_sources(cpp, new_ranking, unmerged_only=True)
+                else:
+                    # Remake the full ranking from the copied caches to get rid of leave leaguers.
+                    cpp.clear_team_ranks()
+                    merged = replay_sources(cpp, new_ranking)
 
             ranking = new_ranking
-            update_manager.save_ranking(cpp, ranking, 0)
+            update_manager.save_ranking(cpp, ranking, 0, merged)
         else:
             logger.info("continuing with ranking %d, season %d" % (ranking.id, season.id))
             cpp.reconnect_db()
-            cpp.load(ranking.id)
+            if loaded_ranking_id != ranking.id:
+                cpp.load(ranking.id)
 
         now = utcnow()
         until = now.replace(hour=switch_hour, minute=0, second=0)
@@ -397,3 +526,6 @@ def countinously_update(regions=None, check_stop=None, update_manager=None, swit
 
         update_manager.update_until(ranking=ranking, cpp=cpp, regions=regions,
                                     until=until, check_stop=check_stop)
+        loaded_ranking_id = ranking.id
+
+    cpp.release()
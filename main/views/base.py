@@ -7,7 +7,7 @@ import gc
 from django.urls import reverse
 
 from lib import sc2
-from common.cache import cache_control, cache_value
+from common.cache import cache_control, cache_value, cache_ranking_value
 from common.utils import to_unix, utcnow
 from django.db.models import Max
 
@@ -48,7 +48,7 @@ def _last_updated_info():
     
 def last_updated_info():
     """ Return the date (data, season_id) was last updated. """
-    return cache_value("last_updated_info", 600, _last_updated_info)
+    return cache_ranking_value("last_updated_info", _last_updated_info)
     
 
 class BadRequestException(Exception):
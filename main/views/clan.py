@@ -3,7 +3,6 @@ from copy import copy
 from logging import getLogger
 
 from django.db.models import Count
-from django.db.models import Q
 from django.http import Http404, HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
@@ -11,10 +10,11 @@ from django.views.generic.base import TemplateView
 
 from common.cache import cache_control, cache_value
 from main.client import client, ClientError
-from main.models import Season, Player, Mode, Team, Region, League, Race
+from main.models import Season, Region, League, Race, ClanTeam
+from main.search import search_clans
 from main.views.base import MainNavMixin, DEFAULT_SORT_KEY
 from main.views.ladder import LadderCommon
-from main.views.search import get_bnet_url
+from main.views.search import bnet_url
 
 logger = getLogger('django')
 
@@ -40,8 +40,8 @@ def clan_url(request, paths=None, args=None, name=None, key=None, tag=None):
 
 def get_top_clans():
     current_season = Season.get_current_season()
-    return list(Player.objects
-                .filter(season=current_season, mode=Mode.TEAM_1V1, tag__gt='')
+    return list(ClanTeam.objects
+                .filter(season=current_season)
                 .values('clan', 'tag').annotate(count=Count('tag')).order_by('-count')[:32])
 
 
@@ -60,12 +60,7 @@ class ClanOverviewView(MainNavMixin, TemplateView):
             clan = clan.strip()
             context['search'] = True
 
-            clans = list(Player.objects
-                         .filter(season=current_season,
-                                 mode=Mode.TEAM_1V1,
-                                 tag__gt='')
-                         .filter(Q(clan__istartswith=clan) | Q(tag__istartswith=clan))
-                         .values('clan', 'tag').annotate(count=Count('tag')).order_by('-count')[:33])
+            clans = search_clans(clan, current_season, limit=33)
 
             if len(clans) == 33:
                 clans = clans[:32]
@@ -86,30 +81,25 @@ class ClanView(MainNavMixin, TemplateView, LadderCommon):
     @staticmethod
     def fetch_data(tag, sort_key_id, is_reverse=None, league_id=None, region_id=None, race_id=None):
 
-        # Get ids from db.
+        # Get ids from precomputed clan roster.
 
-        teams = {t.id: t for t in
-                 Team.objects
-                 .filter(member0__tag=tag, mode=Mode.TEAM_1V1, season=Season.get_current_season())
-                 .all()
-                 .select_related('member0')}
+        team_ids = list(ClanTeam.objects
+                        .filter(tag=tag, season=Season.get_current_season())
+                        .values_list('team_id', flat=True))
 
         # Fetch data from server.
 
-        data = client.get_clan(team_ids=list(teams.keys()), key=sort_key_id, reverse=is_reverse,
+        data = client.get_clan(team_ids=team_ids, key=sort_key_id, reverse=is_reverse,
                                region=region_id, race=race_id, league=league_id)
 
-        # Fetch information about teams from database.
+        # Member data is included by the server, teams without it are removed from the database.
 
-        team_ranks = data['teams']
+        team_ranks = data['teams'] = [tr for tr in data['teams'] if 'm0_id' in tr]
 
         for tr in team_ranks:
-            t = teams[tr["team_id"]]
             tr['rank'] += 1
             tr['tier'] += 1
-            tr["m0_id"] = t.member0.id
-            tr["m0_name"] = t.member0.name
-            tr["m0_bnet_url"] = get_bnet_url(t.member0)
+            tr["m0_bnet_url"] = bnet_url(tr['region'], tr['m0_realm'], tr['m0_bid'])
             tr['played'] = tr['wins'] + tr['losses']
 
         return data
@@ -130,12 +120,13 @@ class ClanView(MainNavMixin, TemplateView, LadderCommon):
         region_id, race_id, league_id = self.extract_filters(request)
         is_reverse, sort_key_id = self.extract_common(reverse, sort_key)
 
-        player = Player.objects.filter(tag=tag, mode=Mode.TEAM_1V1, season=Season.get_current_season()).first()
-        if not player:
+        clan = ClanTeam.objects.filter(tag=tag, season=Season.get_current_season()).values_list('clan', flat=True)\
+            .first()
+        if clan is None:
             raise Http404()
 
         context['tag'] = tag
-        context['clan'] = player.clan
+        context['clan'] = clan
 
         try:
             data = self.fetch_data(tag, sort_key_id, is_reverse=is_reverse,
@@ -196,6 +187,9 @@ class ClanView(MainNavMixin, TemplateView, LadderCommon):
             team['league'] = League.key_by_ids[team['league']]
             team['region'] = Region.key_by_ids[team['region']]
             del team['m0_id']
+            del team['m0_realm']
+            del team['m0_bid']
+            del team['m0_tag']
             del team['m1_race']
             del team['m2_race']
             del team['m3_race']
@@ -1,14 +1,16 @@
 import math
 from logging import getLogger
 
+from django.http import FileResponse
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.views.generic.base import TemplateView
 
 from common.utils import to_unix, utcnow
-from main.models import Team, Region, League, Race, Version, Mode
+from main.models import Region, League, Race, Version, Mode
 from main.client import ClientError, client
-from common.cache import cache_value, cache_control
+from common.cache import cache_ranking_value, cache_control
+from main.export import EXPORT_FORMATS, EXPORT_DOWNLOAD_NAME, export_filename
 from main.views.base import MainNavMixin, SORT_KEYS
 from django.http import Http404
 from copy import copy
@@ -216,49 +218,18 @@ class LadderView(MainNavMixin, TemplateView, LadderCommon):
 
         data = client.get_ladder(sort_key_id, version_id, mode_id, reverse=is_reverse, league=league_id,
                                  region=region_id, race=race_id, offset=offset, team_id=team_id,
-                                 limit=PAGE_SIZE)
+                                 limit=limit)
 
-        # Fetch information about teams from database.
+        # Member data is included by the server, teams without it are removed from the database.
 
-        teams = data['teams']
-
-        team_ids = {team["team_id"] for team in teams}
-        team_mapping = {team.id: team
-                        for team in
-                        Team.objects
-                        .filter(id__in=team_ids)
-                        .all()
-                        .select_related('member0', 'member1', 'member2', 'member3')}
-
-        for tr in teams:
-            t = team_mapping.get(tr["team_id"])
-            
+        for tr in data['teams']:
             tr['rank'] += 1
             tr['tier'] = tr['tier'] + 1
 
-            if t:
+            if 'm0_id' in tr:
                 tr['mmr'] = '-' if tr['mmr'] < 0 else tr['mmr']
                 
                 tr['played'] = tr['wins'] + tr['losses']
-      
-                tr["m0_id"] = t.member0.id
-                tr["m0_name"] = t.member0.name
-                tr["m0_tag"] = t.member0.tag
-    
-                if t.member1:
-                    tr["m1_id"] = t.member1.id
-                    tr["m1_name"] = t.member1.name
-                    tr["m1_tag"] = t.member1.tag
-    
-                if t.member2:
-                    tr["m2_id"] = t.member2.id
-                    tr["m2_name"] = t.member2.name
-                    tr["m2_tag"] = t.member2.tag
-    
-                if t.member3:
-                    tr["m3_id"] = t.member3.id
-                    tr["m3_name"] = t.member3.name
-                    tr["m3_tag"] = t.member3.tag
             else:
                 tr['league'] = None
                 tr['team_id'] = None
@@ -305,9 +276,9 @@ class LadderView(MainNavMixin, TemplateView, LadderCommon):
                 key = "%s-%s-%s-%s-%s-%s-%s" % (sort_key_id, version_id, mode_id, is_reverse,
                                                 league_id, region_id, filter_race)
 
-                data = cache_value(key, 40, self.fetch_data, sort_key_id, version_id, mode_id,
-                                   is_reverse=is_reverse, league_id=league_id, region_id=region_id,
-                                   race_id=filter_race, limit=PAGE_SIZE)
+                data = cache_ranking_value(key, self.fetch_data, sort_key_id, version_id, mode_id,
+                                           is_reverse=is_reverse, league_id=league_id, region_id=region_id,
+                                           race_id=filter_race, limit=PAGE_SIZE)
             else:
                 data = self.fetch_data(sort_key_id, version_id, mode_id,
                                        is_reverse=is_reverse, league_id=league_id, region_id=region_id,
@@ -434,3 +405,13 @@ class LadderView(MainNavMixin, TemplateView, LadderCommon):
 
         return self.render_to_response(context)
 
+
+@cache_control("max-age=3600")
+def ladder_export_view(request, format=None):
+    """ Download the ladder exported by tasks/export_ladder.py. """
+    filename = export_filename(format)
+    try:
+        return FileResponse(open(filename, 'rb'), as_attachment=True, filename=EXPORT_DOWNLOAD_NAME % format,
+                            content_type=EXPORT_FORMATS[format])
+    except (KeyError, FileNotFoundError):
+        raise Http404()
@@ -1,5 +1,7 @@
 import json
 import re
+from functools import lru_cache
+from hashlib import md5
 from logging import getLogger
 
 from django.http import Http404, HttpResponse
@@ -10,22 +12,38 @@ from django.views.generic.base import TemplateView
 from main.battle_net import get_bnet_profile_url_info, BnetClient
 from main.views.base import MainNavMixin, last_updated_info
 from django.shortcuts import redirect
-from django.db.models import Q
-from common.cache import cache_control
-from main.models import Player, Team, Mode, Region, League, Version, Race
+from common.cache import cache_control, cache_value
+from main.models import Player, Team, Mode, Region, League, Version, Race, PlayerTeam
+from main.search import search_players, count_players, encode_key, decode_key
 
 
 logger = getLogger('django')
 
 
+def bnet_url(region, realm, bid):
+    return f"https://starcraft2.com/en-gb/profile/{BnetClient.REGION_IDS[region]}/{realm}/{bid}"
+
+
 def get_bnet_url(player):
-    return f"https://starcraft2.com/en-gb/profile/{BnetClient.REGION_IDS[player.region]}/{player.realm}/{player.bid}"
+    return bnet_url(player.region, player.realm, player.bid)
+
+
+@lru_cache(maxsize=None)
+def ladder_team_url(version, mode):
+    """ Return url of ladder for team version and mode (without team). """
+    return reverse('ladder', kwargs={'version': Version.key_by_ids.get(version, Version.DEFAULT),
+                                     'mode': Mode.key_by_ids[mode],
+                                     'reverse': '',
+                                     'sort_key': 'ladder-rank'})
 
 
 class SearchView(MainNavMixin, TemplateView):
 
     PAGE_SIZE = 32
 
+    # Max number of players counted, the count is shown as "1000+".
+    COUNT_LIMIT = 1000
+
     @cache_control("max-age=3600")
     def get(self, request):
         
@@ -36,11 +54,17 @@ class SearchView(MainNavMixin, TemplateView):
         name = request.GET.get('name', '').strip()
         context['name'] = name
 
+        # Offset is only used for numbering of the items, the page is selected by the keys.
         try:
             offset = max(int(request.GET.get('offset', 0)), 0)
         except ValueError:
             offset = 0
-        
+
+        after = decode_key(request.GET.get('after', ''))
+        before = decode_key(request.GET.get('before', ''))
+        if after is None and before is None:
+            offset = 0
+
         if not json_response:
 
             region, realm, bid = get_bnet_profile_url_info(name)
@@ -62,35 +86,23 @@ class SearchView(MainNavMixin, TemplateView):
             context['no_search'] = True
             return self.respond(context, json_response)
 
-        # Try to search for player. (Only db index on start or exact.)
-
-        q = Player.objects.filter(name__istartswith=name).order_by('-season', 'mode', 'name', 'region', 'bid')
-        
-        items = q[offset:offset + self.PAGE_SIZE + 1]
-        
-        if len(items) == 0 or len(items) > self.PAGE_SIZE:
-            count = q.count()
-        else:
-            count = len(items) + offset
-            
-        pages = list(range(max(offset - self.PAGE_SIZE * 6, 0), count, self.PAGE_SIZE))[:12]
+        # Search for player, the count is approximate since it is cached and capped.
 
-        if offset == 0:
-            context['prev'] = None
-        else:
-            context['prev'] = offset - self.PAGE_SIZE
+        items, prev_key, next_key = search_players(name, after=after, before=before, limit=self.PAGE_SIZE)
 
-        if pages and offset == pages[-1]:
-            context['next'] = None
-        else:
-            context['next'] = offset + self.PAGE_SIZE
+        count = cache_value("search_count_%s" % md5(name.upper().encode('utf-8')).hexdigest(), 3600,
+                            count_players, name, self.COUNT_LIMIT)
 
         context['count'] = count
+        context['count_capped'] = count >= self.COUNT_LIMIT
         context['page_size'] = self.PAGE_SIZE
-        context['items'] = items[:self.PAGE_SIZE]
-        context['pages'] = pages
+        context['items'] = items
         context['offset'] = offset
-            
+        context['prev'] = prev_key and encode_key(prev_key)
+        context['prev_offset'] = max(offset - self.PAGE_SIZE, 0)
+        context['next'] = next_key and encode_key(next_key)
+        context['next_offset'] = offset + len(items)
+
         return self.respond(context, json_response)
 
     def respond(self, context, json_response):
@@ -102,7 +114,10 @@ class SearchView(MainNavMixin, TemplateView):
         else:
             data = {
                 'count': context['count'],
+                'count_capped': context['count_capped'],
                 'offset': context['offset'],
+                'prev': context['prev'],
+                'next': context['next'],
                 'items': [{
                     'name': p.name,
                     'tag': p.tag,
@@ -132,7 +147,7 @@ class PlayerView(MainNavMixin, TemplateView):
             raise Http404('Could not find player %d.' % player_id)
 
         teams = Team.objects\
-            .filter(Q(member0=player) | Q(member1=player) | Q(member2=player) | Q(member3=player))\
+            .filter(id__in=PlayerTeam.objects.filter(player=player).values('team_id'))\
             .select_related('member0', 'member1', 'member2', 'member3')\
             .order_by('mode', '-league')
 
@@ -144,13 +159,7 @@ class PlayerView(MainNavMixin, TemplateView):
         
         for team in teams:
             if team.season_id == season_id:
-                team.ladder_url \
-                    = reverse('ladder',
-                              kwargs={'version': Version.key_by_ids.get(team.version, Version.DEFAULT),
-                                      'mode': Mode.key_by_ids[team.mode],
-                                      'reverse': '',
-                                      'sort_key': 'ladder-rank'})\
-                    + "?team=%d" % team.id
+                team.ladder_url = ladder_team_url(team.version, team.mode) + "?team=%d" % team.id
                               
         return self.render_to_response(context)
 
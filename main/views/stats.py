@@ -6,7 +6,7 @@ from django.utils.http import http_date, parse_http_date
 from common.utils import to_unix, utcnow
 from main.views.base import Nav, rankings_view_client, CachingTemplateView, get_season_list,\
     last_updated_info
-from common.cache import cache_value, cache_control
+from common.cache import cache_ranking_value, cache_control
 from main.models import RankingStats, League, Region, Race, Mode, Version
 
 
@@ -76,7 +76,7 @@ class StatsRaw(View):
         if not (mode_id in Mode.stat_v1_ids):
             return HttpResponse(status=404)
         
-        last_updated = to_unix(cache_value("ranking_stats_last_modified", 600, ranking_stats_last_modified))
+        last_updated = to_unix(cache_ranking_value("ranking_stats_last_modified", ranking_stats_last_modified))
         now = to_unix(utcnow())
         
         try:
@@ -87,8 +87,8 @@ class StatsRaw(View):
         if if_modified_since >= last_updated:
             response = HttpResponse("", content_type="application/json", status=304)
         else:
-            response = HttpResponse(cache_value("ranking_stats_%d" % mode_id, 600,
-                                                rankings_view_client, 'ranking_stats', mode_id),
+            response = HttpResponse(cache_ranking_value("ranking_stats_%d" % mode_id,
+                                                        rankings_view_client, 'ranking_stats', mode_id),
                                     content_type="application/json")
             
         response['Cache-Control'] = "max-age=86400"
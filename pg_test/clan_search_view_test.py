@@ -8,7 +8,7 @@ from aid.test.db import Db
 from aid.test.base import DjangoTestCase
 
 from django.test import Client
-from main.models import Region, Player, Cache, Season, Ranking, Race, Mode, League
+from main.models import Region, Player, Cache, Season, Ranking, Race, Mode, League, Team
 
 
 class Test(DjangoTestCase):
@@ -18,16 +18,14 @@ class Test(DjangoTestCase):
         super(Test, self).setUpClass()
         self.db = Db()
         self.db.create_season(end_date=None)
-        self.db.create_player(tag='TA', clan='Alfa')
-        self.db.create_player(tag='TA', clan='Alfa')
-        self.db.create_player(tag='TA', clan='Alfa')
-        self.db.create_player(tag='TB', clan='YBeta')
-        self.db.create_player(tag='TB', clan='YBeta')
-        self.db.create_player(tag='XC', clan='YCure')
+        for tag, clan in [('TA', 'Alfa'), ('TA', 'Alfa'), ('TA', 'Alfa'), ('TB', 'YBeta'), ('TB', 'YBeta'),
+                          ('XC', 'YCure')]:
+            self.db.create_player(tag=tag, clan=clan)
+            self.db.create_team()
 
     def setUp(self):
         super().setUp()
-        self.db.delete_all(keep=[Cache, Season, Ranking, Player])
+        self.db.delete_all(keep=[Cache, Season, Ranking, Player, Team])
         self.c = Client()
 
     def test_view_largest_teams(self):
@@ -52,6 +52,30 @@ class Test(DjangoTestCase):
 
         self.assertEqual({c1.id, c4.id, c5.id, c6.id, c7.id}, {c.id for c in Cache.objects.all()})
 
+    def test_unlinked_caches_are_removed_in_chunks_and_removal_can_be_resumed(self):
+        caches = [self.db.create_cache(ladder=None, ranking=None, status=200, updated=self.datetime(days=-31))
+                  for _ in range(5)]
+        keep = self.db.create_cache(ladder=None, ranking=None, status=200, updated=self.datetime(days=-1))
+
+        dd = DataDeleter(dry_run=False)
+        dd.CHUNK_SIZE = 2
+        dd.CHUNK_PAUSE = 0
+
+        checks = []
+
+        def check_stop():
+            checks.append(1)
+            if len(checks) > 2:
+                raise SystemExit()
+
+        with self.assertRaises(SystemExit):
+            dd.delete_old_cache_data(check_stop=check_stop)
+
+        self.assertEqual({c.id for c in caches[4:]} | {keep.id}, {c.id for c in Cache.objects.all()})
+
+        self.assertEqual(1, dd.delete_old_cache_data())
+        self.assertEqual({keep.id}, {c.id for c in Cache.objects.all()})
+
     def stats_ranking_data_and_cache_data_is_removed_together_with_ranking(self):
 
         rr1 = self.db.create_ranking(created=self.datetime(days=-400, minutes=1), season=self.s1)
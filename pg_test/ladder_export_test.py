@@ -0,0 +1,101 @@
+import aid.test.init_django_postgresql
+
+import json
+import os
+import main.client
+import main.export
+
+from os.path import join, basename
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from aid.test.db import Db
+from aid.test.base import DjangoTestCase
+from django.test import Client
+from main.export import export_ladder, export_filename
+from main.models import Version, Mode, League, Season, Cache, Ladder, Team, Player
+from django.conf import settings
+from lib import sc2
+
+
+class TestClient(main.client.Client):
+    """ Test client that does not request the server but calls the c++ directly. """
+
+    def request_server(self, data, timeout=None):
+        raw = sc2.direct_ladder_handler_request_export(settings.DATABASES['default']['NAME'],
+                                                       main.export.config.EXPORT_DIR, json.dumps(data))
+        return json.loads(raw)
+
+
+# Replace client with test client that calls c++ handler directly.
+main.export.client = TestClient()
+
+
+class Test(DjangoTestCase):
+
+    @classmethod
+    def setUpClass(self):
+        super(Test, self).setUpClass()
+        self.db = Db()
+
+        # Required objects, not actually used in test cases.
+        self.db.create_cache()
+        self.db.create_ladder()
+
+        self.db.create_season()
+        self.t0, self.t1, self.t2 = self.db.create_teams(count=3)
+
+    def setUp(self):
+        super().setUp()
+        self.db.clear_defaults()
+        self.db.delete_all(keep=[Season, Cache, Ladder, Team, Player])
+        self.c = Client()
+        self.dir = TemporaryDirectory()
+        self.patcher = patch('main.export.config', SimpleNamespace(EXPORT_DIR=self.dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_export_writes_whole_ladder_in_mmr_order_with_member_data_and_view_serves_it(self):
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[
+            dict(team_id=self.t0.id, version=Version.LOTV, league=League.GOLD,     mmr=30, tier=0),
+            dict(team_id=self.t1.id, version=Version.LOTV, league=League.PLATINUM, mmr=60, tier=1),
+            dict(team_id=self.t2.id, version=Version.LOTV, league=League.PLATINUM, mmr=60, tier=2),
+        ])
+
+        self.assertEqual(3, export_ladder('csv'))
+        self.assertEqual(3, export_ladder('ndjson'))
+
+        response = self.c.get('/ladder/export/csv/')
+        self.assertEqual(200, response.status_code)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[0].startswith('rank,team_id,region,league,tier,race,mmr'))
+        self.assertTrue(lines[3].startswith('3,%d,eu,gold,1,zerg,30,' % self.t0.id))
+        self.assertIn('"%s"' % self.t0.member0.name, lines[3])
+
+        response = self.c.get('/ladder/export/ndjson/')
+        self.assertEqual(200, response.status_code)
+        teams = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([1, 1, 3], [t['rank'] for t in teams])
+        self.assertEqual(self.t0.member0.name, teams[2]['m0_name'])
+        self.assertEqual('platinum', teams[0]['league'])
+
+    def test_export_ignores_filename_in_request(self):
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[dict(team_id=self.t0.id, version=Version.LOTV)])
+
+        data = TestClient().request_server({'cmd': 'export', 'format': 'csv', 'version': Version.LOTV,
+                                            'mode': Mode.TEAM_1V1, 'filename': join(self.dir.name, 'other.csv')})
+
+        self.assertEqual('ok', data['code'])
+        self.assertEqual(export_filename('csv'), data['filename'])
+        self.assertEqual([basename(export_filename('csv'))], os.listdir(self.dir.name))
+
+    def test_view_returns_404_when_not_exported(self):
+        self.assertEqual(404, self.c.get('/ladder/export/csv/').status_code)
@@ -1,9 +1,12 @@
 import aid.test.init_django_postgresql
 
+from datetime import timedelta
+
 from aid.test.db import Db
 from aid.test.base import DjangoTestCase
 from common.utils import utcnow
-from main.models import Season, Race, Mode, League, Player
+from lib import sc2
+from main.models import Season, Race, Mode, League, Player, Enums, Team, ClanTeam
 
 
 class Test(DjangoTestCase):
@@ -409,3 +412,57 @@ class Test(DjangoTestCase):
         self.assertEqual(League.GOLD, p.league)
         self.assertEqual(Mode.TEAM_1V1, p.mode)
         self.assertEqual(self.s2.id, p.season_id)
+
+    def test_player_preloaded_into_cache_is_updated(self):
+        self.db.create_player(bid=301,
+                              name='arne0',
+                              clan='arne0',
+                              tag='arne0',
+                              season=self.s1,
+                              race=Race.TERRAN,
+                              league=League.GOLD,
+                              mode=Mode.TEAM_1V1,
+                              last_seen=self.now.date().isoformat())
+        self.db.create_player(bid=302, last_seen=(self.now - timedelta(days=30)).date().isoformat())
+
+        self.cpp = sc2.RankingData(self.db.db_name, Enums.INFO)
+        self.cpp.preload((self.now - timedelta(days=7)).date().isoformat())
+
+        self.process_ladder(mode=Mode.TEAM_1V1,
+                            league=League.GOLD,
+                            season=self.s2,
+                            bid=301,
+                            name="arne1",
+                            tag="arne1",
+                            clan="arne1",
+                            race=Race.TERRAN)
+
+        self.assertEqual(2, len(Player.objects.all()))
+
+        p = self.db.get(Player, bid=301)
+        self.assertEqual("arne1", p.name)
+        self.assertEqual("arne1", p.clan)
+        self.assertEqual("arne1", p.tag)
+        self.assertEqual(self.s2.id, p.season_id)
+
+    def test_clan_roster_follows_tag_and_season_of_player_and_1v1_team(self):
+        self.process_ladder(mode=Mode.TEAM_1V1, season=self.s1, bid=301, name="arne", tag="TL", clan="Liquid")
+
+        p = self.db.get(Player, bid=301)
+        t = self.db.get(Team, member0=p, mode=Mode.TEAM_1V1)
+        self.assertEqual([(t.id, self.s1.id, "TL", "Liquid")],
+                         list(ClanTeam.objects.values_list('team_id', 'season_id', 'tag', 'clan')))
+
+        # Tag changed from other mode.
+        self.process_ladder(mode=Mode.RANDOM_2V2, season=self.s2, bid=301, name="arne", tag="EG", clan="Evil")
+        self.assertEqual([(t.id, self.s1.id, "EG", "Evil")],
+                         list(ClanTeam.objects.values_list('team_id', 'season_id', 'tag', 'clan')))
+
+        # Season changed.
+        self.process_ladder(mode=Mode.TEAM_1V1, season=self.s2, bid=301, name="arne", tag="EG", clan="Evil")
+        self.assertEqual([(t.id, self.s2.id, "EG", "Evil")],
+                         list(ClanTeam.objects.values_list('team_id', 'season_id', 'tag', 'clan')))
+
+        # Left clan.
+        self.process_ladder(mode=Mode.TEAM_1V1, season=self.s2, bid=301, name="arne", tag="", clan="")
+        self.assertEqual([], list(ClanTeam.objects.all()))
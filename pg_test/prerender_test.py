@@ -0,0 +1,122 @@
+import aid.test.init_django_postgresql
+
+import gzip
+import json
+import os
+import main.client
+import main.views.ladder
+
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from aid.test.db import Db
+from aid.test.base import DjangoTestCase
+from main.models import Version, Season, Cache, Ladder, Team, Player
+from main.prerender import prerender_ladder, page_filename, ladder_paths
+from django.conf import settings
+from django.core.cache import cache
+from lib import sc2
+
+
+class TestClient(main.client.Client):
+    """ Test client that does not request the server but calls the c++ directly. """
+
+    def request_server(self, data, timeout=None):
+        raw = sc2.direct_ladder_handler_request_ladder(settings.DATABASES['default']['NAME'], json.dumps(data))
+        return json.loads(raw)
+
+
+# Replace client with test client that calls c++ handler directly.
+main.views.ladder.client = TestClient()
+
+
+class Test(DjangoTestCase):
+
+    @classmethod
+    def setUpClass(self):
+        super(Test, self).setUpClass()
+        self.db = Db()
+
+        # Required objects, not actually used in test cases.
+        self.db.create_cache()
+        self.db.create_ladder()
+
+        self.db.create_season()
+        self.teams = self.db.create_teams(count=15)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.db.clear_defaults()
+        self.db.delete_all(keep=[Season, Cache, Ladder, Team, Player])
+        main.views.ladder.PAGE_SIZE = 10
+        self.dir = TemporaryDirectory()
+        self.patcher = patch('main.prerender.config', SimpleNamespace(PRERENDER_DIR=self.dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_existing_pages_are_rendered_and_other_pages_removed(self):
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[dict(team_id=t.id, version=Version.LOTV, mmr=i)
+                                          for i, t in enumerate(self.teams)])
+
+        path = '/ladder/lotv/1v1/mmr/'
+        os.makedirs(os.path.dirname(page_filename(path, 20)))
+        with open(page_filename(path, 20), 'w') as f:
+            f.write('old')
+
+        self.assertEqual(2, prerender_ladder(path, pages=3))
+
+        with open(page_filename(path, 0), 'rb') as f:
+            first = f.read()
+        self.assertIn(self.teams[14].member0.name.encode('utf-8'), first)
+        with open(page_filename(path, 0) + '.gz', 'rb') as f:
+            self.assertEqual(first, gzip.decompress(f.read()))
+
+        with open(page_filename(path, 10), 'rb') as f:
+            self.assertIn(self.teams[0].member0.name.encode('utf-8'), f.read())
+
+        self.assertFalse(os.path.exists(page_filename(path, 20)))
+
+    def test_ladder_is_fetched_once_for_all_pages(self):
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[dict(team_id=t.id, version=Version.LOTV, mmr=i)
+                                          for i, t in enumerate(self.teams)])
+
+        client = main.views.ladder.client
+        with patch.object(client, 'request_server', wraps=client.request_server) as request_server:
+            self.assertEqual(2, prerender_ladder('/ladder/lotv/1v1/mmr/', pages=3))
+
+        self.assertEqual(1, request_server.call_count)
+        self.assertEqual(30, request_server.call_args[0][0]['limit'])
+
+    def test_pages_are_only_rendered_again_when_ladder_changed(self):
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[dict(team_id=t.id, version=Version.LOTV, mmr=i)
+                                          for i, t in enumerate(self.teams)])
+
+        path = '/ladder/lotv/1v1/mmr/'
+        digests = {}
+        self.assertEqual(2, prerender_ladder(path, pages=3, digests=digests))
+        self.assertEqual(0, prerender_ladder(path, pages=3, digests=digests))
+
+        self.db.delete_all(keep=[Season, Cache, Ladder, Team, Player])
+        self.db.create_ranking()
+        self.db.create_ranking_data(data=[dict(team_id=t.id, version=Version.LOTV, mmr=20 - i)
+                                          for i, t in enumerate(self.teams)])
+        self.assertEqual(2, prerender_ladder(path, pages=3, digests=digests))
+
+        with open(page_filename(path, 0), 'rb') as f:
+            self.assertIn(self.teams[0].member0.name.encode('utf-8'), f.read())
+
+    def test_ladder_paths_are_restricted_to_versions(self):
+        paths = ladder_paths(versions=[Version.LOTV])
+
+        self.assertTrue(paths)
+        self.assertTrue(all(path.startswith('/ladder/lotv/') for path in paths))
+        self.assertEqual(len(paths), len([path for path in ladder_paths() if path.startswith('/ladder/lotv/')]))
@@ -2,8 +2,8 @@ import aid.test.init_django_postgresql
 
 from aid.test.base import DjangoTestCase
 from aid.test.data import gen_member
-from common.utils import utcnow
-from main.models import Region, Version
+from common.utils import utcnow, to_unix
+from main.models import Region, Version, Cache
 from main.update import countinously_update, UpdateManager
 
 
@@ -98,6 +98,86 @@ class Test(DjangoTestCase):
         with self.assertRaises(SystemExit):
             self.countinously_update(update_manager=MockUpdateManager(update_until=update_until))
 
+    def test_ranking_is_rolled_over_from_memory_without_leave_leaguers_when_switching_after_update(self):
+        t1 = self.db.create_team()
+        t2 = self.db.create_team()
+
+        l100 = self.db.create_ladder(bid=100, season=self.s16, updated=self.datetime(days=-1))
+        c100 = self.db.create_cache(bid=100, updated=self.datetime(days=-1), data_hash='merged')
+        c101 = self.db.create_cache(bid=101, updated=self.datetime(days=-1), data_hash='merged')
+
+        r = self.db.create_ranking(season=self.s16, created=self.datetime(hours=-20), data_time=self.datetime(days=-1))
+
+        # t2 is older than its source, it left the ladder.
+        self.db.create_ranking_data(data=[dict(team_id=t1.id, points=20, source_id=c100.id, ladder_id=l100.id,
+                                               data_time=to_unix(c100.updated)),
+                                          dict(team_id=t2.id, points=10, source_id=c101.id, ladder_id=l100.id,
+                                               data_time=self.unix_time(days=-2))])
+        self.db.update_ranking_stats()
+
+        rankings = []
+
+        def update_until(ranking=None, until=None, **kwargs):
+            rankings.append(ranking.id)
+            if len(rankings) == 1:
+                # Continued and loaded, make it old to switch on next turn.
+                self.assertEqual(r.id, ranking.id)
+                ranking.created = self.datetime(hours=-49)
+                return
+
+            self.assertNotEqual(r.id, ranking.id)
+            new_c100 = ranking.sources.get(bid=100)
+            self.assertNotEqual(c100.id, new_c100.id)
+            self.assertEqual({100, 101}, {c.bid for c in ranking.sources.all()})
+            self.assertEqual({c100.id, c101.id}, {c.id for c in r.sources.all()})
+            self.assert_team_ranks(ranking.id,
+                                   dict(team_id=t1.id, points=20, source_id=new_c100.id))
+            raise SystemExit()
+
+        with self.assertRaises(SystemExit):
+            self.countinously_update(update_manager=MockUpdateManager(update_until=update_until))
+
+        self.assertEqual(2, len(rankings))
+
+    def test_caches_not_merged_are_added_again_after_rollover(self):
+        p1 = self.db.create_player(bid=301)
+        t1 = self.db.create_team()
+
+        l100 = self.db.create_ladder(bid=100, season=self.s16, updated=self.datetime(days=-1))
+        c100 = self.db.create_cache(bid=100, updated=self.datetime(days=-1), data_hash='merged',
+                                    members=[gen_member(bid=p1.bid, points=20)])
+        # Saved with new data but never merged, the ranking data is from an older fetch.
+        self.db.create_ladder(bid=101, season=self.s16, updated=self.datetime(hours=-1))
+        c101 = self.db.create_cache(bid=101, updated=self.datetime(hours=-1), data_hash=None,
+                                    members=[gen_member(bid=302, points=40)])
+
+        r = self.db.create_ranking(season=self.s16, created=self.datetime(hours=-20), data_time=self.datetime(days=-1))
+        self.db.create_ranking_data(data=[dict(team_id=t1.id, points=20, source_id=c100.id, ladder_id=l100.id,
+                                               data_time=to_unix(c100.updated))])
+        self.db.update_ranking_stats()
+
+        rankings = []
+
+        def update_until(ranking=None, until=None, **kwargs):
+            rankings.append(ranking.id)
+            if len(rankings) == 1:
+                ranking.created = self.datetime(hours=-49)
+                return
+
+            new_c101 = ranking.sources.get(bid=101)
+            self.assert_team_ranks(ranking.id,
+                                   dict(team_id=t1.id, points=20),
+                                   dict(points=40, source_id=new_c101.id),
+                                   sort=False)
+            self.assertIsNotNone(Cache.objects.get(id=new_c101.id).data_hash)
+            self.assertIsNone(Cache.objects.get(id=c101.id).data_hash)
+            raise SystemExit()
+
+        with self.assertRaises(SystemExit):
+            self.countinously_update(update_manager=MockUpdateManager(update_until=update_until))
+
+        self.assertEqual(2, len(rankings))
+
     def test_ranking_is_craeted_fresh_when_switching_ranking_and_season(self):
         p1 = self.db.create_player(name="arne")
         t1 = self.db.create_team()
@@ -7,6 +7,7 @@ from datetime import timedelta
 from aid.test.base import DjangoTestCase, MockBnetTestMixin
 from aid.test.data import gen_member, gen_api_ladder
 from common.utils import utcnow
+from main.battle_net import LadderResponse
 from main.models import Version, Region, Race
 from main.refetch import refetch_past_seasons
 from lib import sc2
@@ -90,6 +91,49 @@ class Test(MockBnetTestMixin, DjangoTestCase):
         self.assert_team_ranks(r.id, dict(points=20))
         self.assertEqual(self.s35.end_time(), r.data_time)
 
+    def test_refetch_past_seasons_fetches_regions_in_parallel_and_merges_all_into_ranking(self):
+        self.db.create_cache(bid=100)
+        self.db.create_ladder(bid=100, region=Region.EU, season=self.s35, updated=self.datetime(days=-30))
+        self.db.create_ladder(bid=200, region=Region.KR, season=self.s35, updated=self.datetime(days=-30))
+
+        r = self.db.create_ranking(season=self.s35, data_time=self.datetime(days=-21))
+        self.db.create_ranking_data(data=[])
+
+        points = {Region.EU: 40, Region.KR: 60}
+        self.bnet.fetch_ladder = Mock(side_effect=lambda region, bid, timeout: LadderResponse(
+            200, gen_api_ladder([gen_member(points=points[region])]), utcnow(), 0))
+
+        self.refetch_past_seasons()
+
+        self.assertEqual(2, self.bnet.fetch_ladder.call_count)
+        self.bnet.fetch_ladder.assert_any_call(Region.EU, 100, timeout=20)
+        self.bnet.fetch_ladder.assert_any_call(Region.KR, 200, timeout=20)
+
+        r.refresh_from_db()
+        self.assertEqual(2, r.sources.count())
+        self.assert_team_ranks(r.id, dict(points=60, region=Region.KR), dict(points=40, region=Region.EU))
+
+    def test_interrupted_refetch_is_repaired_from_saved_caches_before_continuing(self):
+        p1 = self.db.create_player(name="arne")
+        t1 = self.db.create_team()
+
+        # Ladder 100 was refetched and its cache saved after the last save of the ranking data.
+        self.db.create_cache(bid=100, members=[gen_member(bid=p1.bid, points=40, race=Race.ZERG)],
+                             updated=self.datetime(minutes=-10))
+        self.db.create_ladder(bid=100, season=self.s35, updated=self.datetime(minutes=-10))
+        l2 = self.db.create_ladder(bid=101, season=self.s35, updated=self.datetime(days=-30))
+
+        r = self.db.create_ranking(season=self.s35, data_time=self.datetime(days=-21))
+        self.db.create_ranking_data(updated=self.datetime(hours=-1),
+                                    data=[dict(team_id=t1.id, points=20, data_time=self.unix_time(days=-30))])
+
+        self.mock_fetch_ladder(members=[gen_member(points=50)])
+
+        self.refetch_past_seasons()
+
+        self.bnet.fetch_ladder.assert_called_once_with(Region.EU, l2.bid, timeout=20)
+        self.assert_team_ranks(r.id, dict(points=50), dict(points=40, team_id=t1.id))
+
     def test_skip_refetch_of_season_if_recently_closed(self):
         self.db.create_cache(bid=100)
         l = self.db.create_ladder(bid=100, season=self.s36, updated=self.datetime(days=-20))
@@ -0,0 +1,71 @@
+import aid.test.init_django_postgresql
+
+from aid.test.base import DjangoTestCase
+from aid.test.data import gen_member, gen_api_ladder
+from common.utils import utcnow
+from lib import sc2
+from main.fetch import update_ladder_cache, save_ladder_cache
+from main.models import Enums
+from main.repair import stale_cache_ids, repair_ranking_incremental
+
+
+class Test(DjangoTestCase):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        self.db.delete_all()
+        self.now = utcnow()
+        self.db.create_season(id=16)
+        self.ranking = self.db.create_ranking()
+        self.l1 = self.db.create_ladder(bid=101, updated=self.datetime(days=-1))
+        self.l2 = self.db.create_ladder(bid=102, updated=self.datetime(days=-1))
+        self.cpp = sc2.RankingData(self.db.db_name, Enums.INFO)
+
+    def tearDown(self):
+        self.cpp.release()
+        super().tearDown()
+
+    def load(self):
+        self.cpp.release()
+        self.cpp = sc2.RankingData(self.db.db_name, Enums.INFO)
+        self.cpp.load(self.ranking.id)
+
+    def test_complete_ranking_has_no_stale_caches(self):
+        update_ladder_cache(self.cpp, self.ranking, self.l1, 200, gen_api_ladder([gen_member(points=10)]),
+                            self.datetime(minutes=-2))
+        update_ladder_cache(self.cpp, self.ranking, self.l2, 200, gen_api_ladder([gen_member(points=20)]),
+                            self.datetime(minutes=-1))
+        self.save_to_ranking()
+
+        self.load()
+
+        self.assertEqual([], stale_cache_ids(self.cpp, self.ranking))
+        self.assertEqual(0, repair_ranking_incremental(self.cpp, self.ranking))
+
+    def test_caches_saved_but_not_merged_are_replayed_in_order(self):
+        m1 = gen_member(points=10)
+        m2 = gen_member(points=20)
+        update_ladder_cache(self.cpp, self.ranking, self.l1, 200, gen_api_ladder([m1]), self.datetime(minutes=-3))
+        update_ladder_cache(self.cpp, self.ranking, self.l2, 200, gen_api_ladder([m2]), self.datetime(minutes=-3))
+        self.save_to_ranking()
+
+        # Simulate a crash after the caches were saved but before the ranking was saved.
+        m1['points'] = 11
+        lc1 = save_ladder_cache(self.ranking, self.l1, 200, gen_api_ladder([m1]), self.datetime(minutes=-2))
+        m3 = gen_member(points=30)
+        lc2 = save_ladder_cache(self.ranking, self.l2, 200, gen_api_ladder([m2, m3]), self.datetime(minutes=-1))
+
+        self.load()
+
+        self.assertEqual([lc1.id, lc2.id], stale_cache_ids(self.cpp, self.ranking))
+        self.assertEqual(2, repair_ranking_incremental(self.cpp, self.ranking))
+        self.save_to_ranking()
+
+        self.assert_team_ranks(self.ranking.id,
+                               dict(points=30),
+                               dict(points=20),
+                               dict(points=11))
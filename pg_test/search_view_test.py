@@ -5,8 +5,10 @@ from aid.test.db import Db
 
 from aid.test.base import DjangoTestCase
 
+from django.core.cache import cache
 from django.test import Client
 from main.models import Region, Cache, Season, Ranking, Race, Mode, League
+from main.search import encode_key, player_key
 
 
 class Test(DjangoTestCase):
@@ -22,6 +24,7 @@ class Test(DjangoTestCase):
     def setUp(self):
         super().setUp()
         self.db.delete_all(keep=[Cache, Season, Ranking])
+        cache.clear()
         self.c = Client()
 
     def test_search_by_name(self):
@@ -112,16 +115,30 @@ class Test(DjangoTestCase):
 
         self.assertEqual(200, response.status_code)
         self.assertEqual(32, len(response.context['items']))
+        self.assertEqual(40, response.context['count'])
         self.assertIsNone(response.context['prev'])
-        self.assertEqual(32, response.context['next'])
+        self.assertIsNotNone(response.context['next'])
+        self.assertEqual(32, response.context['next_offset'])
+        first_page = response.context['items']
 
-        response = self.c.get('/search/', {'name': 'sune', 'offset': response.context['next']})
+        response = self.c.get('/search/', {'name': 'sune', 'after': response.context['next'],
+                                           'offset': response.context['next_offset']})
 
         self.assertEqual(200, response.status_code)
         self.assertEqual(8, len(response.context['items']))
-        self.assertEqual(0, response.context['prev'])
+        self.assertEqual(32, response.context['offset'])
+        self.assertIsNotNone(response.context['prev'])
+        self.assertEqual(0, response.context['prev_offset'])
         self.assertIsNone(response.context['next'])
 
+        response = self.c.get('/search/', {'name': 'sune', 'before': response.context['prev'],
+                                           'offset': response.context['prev_offset']})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(first_page, response.context['items'])
+        self.assertIsNone(response.context['prev'])
+        self.assertIsNotNone(response.context['next'])
+
     def test_json_api_search_by_name(self):
         p = self.db.create_player(bid=300, name='sune', race=Race.ZERG, league=League.GOLD, mode=Mode.TEAM_1V1)
 
@@ -223,15 +240,16 @@ class Test(DjangoTestCase):
 
         self.assertEqual(-1, data['count'])
 
-    def test_json_api_search_by_prefix_and_offset(self):
+    def test_json_api_search_by_prefix_and_key(self):
         p1 = self.db.create_player(bid=300, name='sune',
                                    race=Race.ZERG, league=League.GOLD, mode=Mode.TEAM_1V1)
         p2 = self.db.create_player(bid=301, name='sunebune',
                                    race=Race.TERRAN, league=League.PLATINUM, mode=Mode.ARCHON)
-        p3 = self.db.create_player(bid=302, name='sunerune',
+        p3 = self.db.create_player(bid=302, name='sunearune',
                                    race=Race.RANDOM, league=League.PLATINUM, mode=Mode.TEAM_1V1)
 
-        response = self.c.get('/search/', {'name': 'sune', 'json': '', 'offset': '2'})
+        response = self.c.get('/search/', {'name': 'sune', 'json': '', 'after': encode_key(player_key(p3)),
+                                           'offset': '2'})
 
         self.assertEqual(200, response.status_code)
 
@@ -239,6 +257,8 @@ class Test(DjangoTestCase):
 
         self.assertEqual(3, data['count'])
         self.assertEqual(2, data['offset'])
+        self.assertEqual(encode_key(player_key(p2)), data['prev'])
+        self.assertIsNone(data['next'])
         self.assertEqual([
             {
                 'name': 'sunebune',
@@ -253,36 +273,26 @@ class Test(DjangoTestCase):
             },
         ], data['items'])
 
-    def test_json_api_search_by_prefix_and_offset_out_of_range(self):
+    def test_json_api_search_with_bad_key_or_offset_returns_first_page(self):
         p = self.db.create_player(bid=300, name='sune', race=Race.ZERG, league=League.GOLD, mode=Mode.TEAM_1V1)
 
-        response = self.c.get('/search/', {'name': 'sune', 'json': '', 'offset': '200'})
-
-        self.assertEqual(200, response.status_code)
-
-        data = json.loads(response.content.decode('utf-8'))
+        for params in [{'offset': '200'}, {'offset': '-1'}, {'after': 'garbage', 'offset': '12'}]:
+            response = self.c.get('/search/', dict(name='sune', json='', **params))
 
-        self.assertEqual(1, data['count'])
-        self.assertEqual(200, data['offset'])
-        self.assertEqual([], data['items'])
+            self.assertEqual(200, response.status_code)
 
-        response = self.c.get('/search/', {'name': 'sune', 'json': '', 'offset': '-1'})
+            data = json.loads(response.content.decode('utf-8'))
 
-        self.assertEqual(200, response.status_code)
-
-        data = json.loads(response.content.decode('utf-8'))
-
-        self.assertEqual(1, data['count'])
-        self.assertEqual(0, data['offset'])
-        self.assertEqual([{
-            'name': 'sune',
-            'tag': p.tag,
-            'clan': p.clan,
-            'race': 'zerg',
-            'mode': '1v1',
-            'bnet_url': 'https://starcraft2.com/en-gb/profile/2/1/300',
-            'region': 'eu',
-            'league': 'gold',
-            'season': self.db.season.id,
-        }], data['items'])
-        
+            self.assertEqual(1, data['count'])
+            self.assertEqual(0, data['offset'])
+            self.assertEqual([{
+                'name': 'sune',
+                'tag': p.tag,
+                'clan': p.clan,
+                'race': 'zerg',
+                'mode': '1v1',
+                'bnet_url': 'https://starcraft2.com/en-gb/profile/2/1/300',
+                'region': 'eu',
+                'league': 'gold',
+                'season': self.db.season.id,
+            }], data['items'])
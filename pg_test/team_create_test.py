@@ -4,7 +4,7 @@ from aid.test.data import gen_member
 from aid.test.db import Db
 from aid.test.base import DjangoTestCase
 from common.utils import utcnow
-from main.models import Season, League, Mode, Player, Team, Race
+from main.models import Season, League, Mode, Player, Team, Race, PlayerTeam
 
 
 class Test(DjangoTestCase):
@@ -44,6 +44,9 @@ class Test(DjangoTestCase):
         self.assertEqual(Race.TERRAN,  t1.race2)
         self.assertEqual(Race.TERRAN,  t1.race3)
 
+        self.assertEqual(sorted([(p1.id, t1.id), (p2.id, t1.id), (p3.id, t1.id), (p4.id, t1.id)]),
+                         sorted(PlayerTeam.objects.values_list('player_id', 'team_id')))
+
     def test_process_two_4v4_ladders_with_the_same_team_but_different_order_just_creates_one_team(self):
         self.process_ladder(mode=Mode.TEAM_4V4,
                             members=[gen_member(bid=301, race=Race.ZERG),
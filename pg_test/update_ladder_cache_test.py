@@ -0,0 +1,75 @@
+import aid.test.init_django_postgresql
+
+from aid.test.base import DjangoTestCase
+from aid.test.data import gen_member, gen_api_ladder
+from common.utils import utcnow
+from lib import sc2
+from main.battle_net import NOT_MODIFIED, ApiLadder
+from main.fetch import update_ladder_cache, save_ladder_cache, MissingCache
+from main.models import Enums, Cache
+
+
+class Test(DjangoTestCase):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        self.db.delete_all()
+        self.now = utcnow()
+        self.db.create_season(id=16)
+        self.ranking = self.db.create_ranking()
+        self.ladder = self.db.create_ladder(bid=100, updated=self.datetime(days=-1))
+        self.cpp = sc2.RankingData(self.db.db_name, Enums.INFO)
+
+    def update(self, api_ladder, status=200, fetch_time=None):
+        return update_ladder_cache(self.cpp, self.ranking, self.ladder, status, api_ladder, fetch_time or utcnow())
+
+    def test_unchanged_ladder_only_updates_ladder_updated(self):
+        members = [gen_member(points=20)]
+
+        self.assertIsNotNone(self.update(gen_api_ladder(members)))
+        cache = Cache.objects.get(ranking=self.ranking, bid=100)
+        self.assertIsNotNone(cache.data_hash)
+
+        fetch_time = self.datetime(minutes=1)
+        self.assertIsNone(self.update(gen_api_ladder(members), fetch_time=fetch_time))
+
+        self.ladder.refresh_from_db()
+        self.assertEqual(fetch_time, self.ladder.updated)
+        self.assertEqual(cache.updated, Cache.objects.get(id=cache.id).updated)
+
+    def test_saved_but_not_merged_ladder_is_not_skipped_as_unchanged(self):
+        members = [gen_member(points=20)]
+
+        self.assertIsNotNone(save_ladder_cache(self.ranking, self.ladder, 200, gen_api_ladder(members), utcnow()))
+        self.assertIsNone(Cache.objects.get(ranking=self.ranking, bid=100).data_hash)
+
+        self.assertIsNotNone(self.update(gen_api_ladder(members), fetch_time=self.datetime(minutes=1)))
+
+    def test_not_modified_ladder_is_handled_as_unchanged(self):
+        self.update(gen_api_ladder([gen_member(points=20)]))
+
+        self.assertIsNone(self.update(ApiLadder({}), status=NOT_MODIFIED, fetch_time=self.datetime(minutes=1)))
+
+    def test_not_modified_ladder_without_cache_raises_missing_cache(self):
+        with self.assertRaises(MissingCache):
+            self.update(ApiLadder({}), status=NOT_MODIFIED)
+
+    def test_changed_ladder_is_added_to_ranking(self):
+        member = gen_member(points=20)
+        self.update(gen_api_ladder([member]))
+
+        member['points'] = 40
+        self.assertIsNotNone(self.update(gen_api_ladder([member]), fetch_time=self.datetime(minutes=1)))
+        self.save_to_ranking()
+
+        self.assert_team_ranks(self.ranking.id, dict(points=40))
+
+    def test_unchanged_ladder_is_added_to_ranking_when_last_merge_is_old(self):
+        members = [gen_member(points=20)]
+        self.update(gen_api_ladder(members), fetch_time=self.datetime(days=-2))
+
+        self.assertIsNotNone(self.update(gen_api_ladder(members)))
@@ -9,7 +9,7 @@ from main.views.team import TeamView, TeamRankingsData, TeamId
 from main.views.search import SearchView, PlayerView
 from main.views.stats import StatsRaw, StatsView
 from main.views.main import MainView, sitemap_view
-from main.views.ladder import LadderView
+from main.views.ladder import LadderView, ladder_export_view
 from main.views.base import CachingTemplateView, CachingRedirectView
 from main.models import Mode
 
@@ -32,6 +32,8 @@ urlpatterns = \
             LadderView.as_view(template_name='ladder.html'),
             name='ladder'),
 
+        url(r'^ladder/export/(?P<format>csv|ndjson)/$', ladder_export_view, name='ladder-export'),
+
         url(r'^clan/$', ClanOverviewView.as_view(template_name='clan-overview.html'), name='clan-overview'),
 
         url(r'^clan/(?P<tag>[\w-]+)/(?P<reverse>-?)(?P<sort_key>[\w-]+)/$',
@@ -1,6 +1,8 @@
 #include <sys/time.h>
 #include <stdlib.h>
+#include <algorithm>
 #include <libpq-fe.h>
+#include <arpa/inet.h>
 
 #include <boost/iostreams/device/file.hpp>
 #include <boost/iostreams/filter/gzip.hpp>
@@ -177,6 +179,12 @@ db::res_isnull(uint32_t row, uint32_t col)
    return PQgetisnull(_res, row, col);
 }
 
+id_t
+db::res_binary_id(uint32_t row, uint32_t col)
+{
+   return ntohl(*reinterpret_cast<uint32_t*>(PQgetvalue(_res, row, col)));
+}
+
 char*
 db::res_value(uint32_t row, uint32_t col)
 {
@@ -416,8 +424,21 @@ db::get_or_insert_teams(team_set_t& store, team_set_t& teams, uint32_t team_size
       exec(sql);
 
       count = teams.size();
+
+      stringstream team_ids;
+      for (uint32_t i = 0; i < res_size(); ++i) {
+         team_ids << (i ? "," : "") << res_int(i, 0);
+      }
       
       read_team_result(store, teams);
+
+      // Members of a team never change, so player_team only needs to be updated for new teams.
+      
+      exec("INSERT INTO player_team (player_id, team_id)"
+           " SELECT m.player_id, t.id FROM team t,"
+           " LATERAL (VALUES (t.member0_id), (t.member1_id), (t.member2_id), (t.member3_id)) m (player_id)"
+           " WHERE m.player_id IS NOT NULL AND t.id = ANY('{" + team_ids.str() + "}'::int[])"
+           " ON CONFLICT DO NOTHING;");
    }
 
    return count;
@@ -468,6 +489,40 @@ db::update_teams(const team_set_t& teams)
         " ;");
 }
 
+void
+db::update_clan_teams(const vector<id_t>& team_ids, const vector<id_t>& player_ids)
+{
+   if (team_ids.empty() and player_ids.empty()) {
+      return;
+   }
+   
+   stringstream where;
+   where << "t.mode = " << TEAM_1V1 << " AND t.season_id IS NOT NULL AND (t.id = ANY('{";
+   char delimiter = ' ';
+   for (auto id : team_ids) {
+      where << delimiter << id;
+      delimiter = ',';
+   }
+   // Only conditions on team so the team primary key and member0 indexes can be used.
+   where << "}'::int[]) OR t.member0_id = ANY('{";
+   delimiter = ' ';
+   for (auto id : player_ids) {
+      where << delimiter << id;
+      delimiter = ',';
+   }
+   where << "}'::int[]))";
+
+   exec("INSERT INTO clan_team (team_id, season_id, tag, clan)"
+        " SELECT t.id, t.season_id, p.tag, p.clan FROM team t JOIN player p ON p.id = t.member0_id"
+        " WHERE p.tag <> '' AND " + where.str() +
+        " ON CONFLICT (team_id) DO UPDATE SET season_id = EXCLUDED.season_id, tag = EXCLUDED.tag, clan = EXCLUDED.clan"
+        " WHERE (clan_team.season_id, clan_team.tag, clan_team.clan)"
+        "   IS DISTINCT FROM (EXCLUDED.season_id, EXCLUDED.tag, EXCLUDED.clan);");
+
+   exec("DELETE FROM clan_team c USING team t, player p"
+        " WHERE c.team_id = t.id AND p.id = t.member0_id AND p.tag = '' AND " + where.str() + ";");
+}
+
 rankings_t
 db::get_available_rankings(uint32_t from_season)
 {
@@ -647,6 +702,46 @@ db::save_team_ranks(id_t id, float now, team_ranks_t& team_ranks)
             team_ranks.size(), id, data.size(), float(timer.end()) / 1e6);
 }
 
+void
+db::load_team_members(const vector<id_t>& team_ids, team_members_t& team_members)
+{
+   team_members.clear();
+   team_members.reserve(team_ids.size());
+   timer_us timer;
+
+   for (uint32_t start = 0; start < team_ids.size(); start += 10000) {
+      stringstream sql;
+      sql << "SELECT t.id";
+      for (uint32_t m = 0; m < 4; ++m) {
+         sql << fmt(", p%d.id, p%d.realm, p%d.bid, p%d.name, p%d.tag", m, m, m, m, m);
+      }
+      sql << " FROM team t";
+      for (uint32_t m = 0; m < 4; ++m) {
+         sql << fmt(" LEFT JOIN player p%d ON p%d.id = t.member%d_id", m, m, m);
+      }
+      sql << " WHERE t.id = ANY('{";
+      char delimiter = ' ';
+      for (uint32_t i = start; i < min(start + 10000, uint32_t(team_ids.size())); ++i) {
+         sql << delimiter << team_ids[i];
+         delimiter = ',';
+      }
+      sql << "}'::int[]);";
+      exec(sql);
+
+      for (uint32_t i = 0; i < res_size(); ++i) {
+         team_member_list_t& members = team_members[res_int(i, 0)];
+         for (uint32_t m = 0; m < 4 and not res_isnull(i, 1 + m * 5); ++m) {
+            uint32_t c = 1 + m * 5;
+            members.push_back(team_member_t{id_t(res_int(i, c)), enum_t(res_int(i, c + 1)), bid_t(res_int(i, c + 2)),
+                                       res_str(i, c + 3), res_str(i, c + 4)});
+         }
+      }
+      clear_res();
+   }
+
+   LOG_INFO("loaded members of %d teams in %fs", team_members.size(), float(timer.end()) / 1e6);
+}
+
 void
 db::update_or_create_ranking_stats(ranking_stats_t& ranking_stats, id_t id)
 {
@@ -732,23 +827,81 @@ db::load_all_ranking_stats(ranking_stats_list_t& ranking_stats_list, uint32_t fi
 }
 
 void
-db::load_seen_team_ids(unordered_set<id_t>& team_ids, string threshold_date)
+db::load_seen_team_ids(id_set_t& team_ids, string threshold_date)
 {
    team_ids.clear();
 
    pg_escape e_date(_conn, threshold_date);
 
+   // Get result in binary format, saves parsing of many ints.
    stringstream sql;
    sql << "SELECT id FROM team WHERE last_seen >= " << e_date;
-   exec(sql);
+   exec(sql.str(), {}, {}, {});
 
    uint32_t size = res_size();
+   id_t max_id = 0;
    for (uint32_t i = 0; i < size; ++i) {
-      team_ids.insert(res_int(i, 0));
+      max_id = max(max_id, res_binary_id(i, 0));
+   }
+   team_ids.reserve(max_id);
+   for (uint32_t i = 0; i < size; ++i) {
+      team_ids.insert(res_binary_id(i, 0));
    }
    LOG_INFO("loaded %d team_ids that was seen since %s (inclusive)", team_ids.size(), threshold_date.c_str());
 }
 
+uint32_t
+db::fetch_cursor(const string& cursor, function<void()> read_batch)
+{
+   uint32_t count = 0;
+   string fetch = fmt("FETCH 10000 FROM %s;", cursor.c_str());
+   while (true) {
+      exec(fetch);
+      uint32_t size = res_size();
+      if (size == 0) {
+         break;
+      }
+      read_batch();
+      count += size;
+   }
+   exec(fmt("CLOSE %s;", cursor.c_str()));
+   return count;
+}
+
+uint32_t
+db::load_seen_players(player_set_t& store, string threshold_date)
+{
+   pg_escape e_date(_conn, threshold_date);
+
+   stringstream sql;
+   sql << "DECLARE seen_player NO SCROLL CURSOR FOR"
+       << " SELECT id, region, bid, realm, name, tag, clan, season_id, race, league, mode, last_seen"
+       << " FROM player WHERE last_seen >= " << e_date << ";";
+   exec(sql);
+
+   player_set_t unused;
+   uint32_t count = fetch_cursor("seen_player", [&]() { read_player_result(store, unused); });
+   LOG_INFO("loaded %d players that was seen since %s (inclusive)", count, threshold_date.c_str());
+   return count;
+}
+
+uint32_t
+db::load_seen_teams(team_set_t& store, string threshold_date)
+{
+   pg_escape e_date(_conn, threshold_date);
+
+   stringstream sql;
+   sql << "DECLARE seen_team NO SCROLL CURSOR FOR"
+       << " SELECT id, region, mode, season_id, version, league"
+       << "  , member0_id, member1_id, member2_id, member3_id, race0, race1, race2, race3, last_seen"
+       << " FROM team WHERE last_seen >= " << e_date << ";";
+   exec(sql);
+
+   team_set_t unused;
+   uint32_t count = fetch_cursor("seen_team", [&]() { read_team_result(store, unused); });
+   LOG_INFO("loaded %d teams that was seen since %s (inclusive)", count, threshold_date.c_str());
+   return count;
+}
 
 void
 db::reconnect()
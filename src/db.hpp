@@ -6,6 +6,7 @@
 #include <set>
 #include <array>
 #include <unordered_set>
+#include <functional>
 
 #include "types.hpp"
 
@@ -31,12 +32,16 @@ struct db
    void update_players(const player_set_t& players);
 
    // For each team in teams get existing team of <id0, id1, id2, id3, mode> or create one. Insert the team with id
-   // into store. The teams set is consumed.
+   // into store. The teams set is consumed. Created teams are also added to player_team.
    uint32_t  get_or_insert_teams(team_set_t& store, team_set_t& teams, uint32_t team_size);
 
    // Update teams in teams in database.
    void update_teams(const team_set_t& teams);
 
+   // Update clan_team for the 1v1 teams in team_ids and the 1v1 teams of the players in player_ids: insert or update
+   // teams of players with tag, delete teams of players without.
+   void update_clan_teams(const std::vector<id_t>& team_ids, const std::vector<id_t>& player_ids);
+
    // Save team ranks and set updated time. NOTE Only use ranking.id, not ranking_data.id or ranking_stats.id.
    void save_team_ranks(id_t id, float now, team_ranks_t& team_ranks);
    
@@ -61,6 +66,10 @@ struct db
    // Use data_time_low_limit (unix time in seconds) to only get entries with data_time >= data_time_low_limit_s.
    void load_team_ranks(id_t id, team_ranks_t& team_ranks, double data_time_low_limit_s=0);
 
+   // Load members of the teams in team_ids into team_members (cleared first), teams not in the db are left out. The
+   // teams are loaded in batches to keep the queries small.
+   void load_team_members(const std::vector<id_t>& team_ids, team_members_t& team_members);
+
    // Update or create ranking stats with id. NOTE Only use ranking.id, not ranking_data.id or ranking_stats.id.
    void update_or_create_ranking_stats(ranking_stats_t& ranking_stats, id_t id);
 
@@ -71,7 +80,14 @@ struct db
    void load_all_ranking_stats(ranking_stats_list_t& ranking_stats_list, uint32_t filter_season);
 
    // Load all team ids with last seen more recent (including) than threshold_date.
-   void load_seen_team_ids(std::unordered_set<id_t>& team_ids, std::string threshold_date);
+   void load_seen_team_ids(id_set_t& team_ids, std::string threshold_date);
+
+   // Load all players with last seen more recent (including) than threshold_date into store, the rows are streamed
+   // through a cursor in batches. Should be called in a transaction block. Returns number of loaded players.
+   uint32_t load_seen_players(player_set_t& store, std::string threshold_date);
+
+   // Load all teams with last seen more recent (including) than threshold_date into store, see load_seen_players.
+   uint32_t load_seen_teams(team_set_t& store, std::string threshold_date);
 
    // Reconnect to the db.
    void reconnect();
@@ -109,6 +125,9 @@ struct db
    // Is null for field in result.
    bool res_isnull(uint32_t row, uint32_t col);
 
+   // Get id (int4) from result fetched in binary format.
+   id_t res_binary_id(uint32_t row, uint32_t col);
+
    // Get string from result.
    std::string res_str(uint32_t row, uint32_t col);
 
@@ -135,6 +154,10 @@ struct db
 
    // Helper for get_or_insert_teams.
    void read_team_result(team_set_t& store, team_set_t& teams);
+
+   // Fetch all rows of a declared cursor in batches, read_batch is called with each batch as result. Returns number of
+   // rows.
+   uint32_t fetch_cursor(const std::string& cursor, std::function<void()> read_batch);
    
    std::string _db_name;
    PGconn* _conn;
@@ -1,11 +1,13 @@
 #include <boost/thread.hpp>    
 #include <algorithm>
-#include <unordered_set>
 #include <tuple>
+#include <fstream>
+#include <cstdio>
 
 #include "compare.hpp"
 #include "ladder_handler.hpp"
 #include "exception.hpp"
+#include "timer.hpp"
 
 using namespace std;
 
@@ -14,26 +16,140 @@ ladder_handler::refresh_ranking(bool force)
 {
    uint64_t now = now_us();
    double data_time_low_limit = (now / 1e6) - _keep_api_data_days * 24 * 3600;
-   
-   boost::lock_guard<boost::mutex> lock(_mutex);
-   // Check for new data every 1 minutes.
-   if (_last_checked == 0 or now > _last_checked + 1e6 * 60 * 1 or force) {
+
+   // Check for new data every 1 minutes, must be called with _mutex held.
+   auto due = [&]() { return _last_checked == 0 or now > _last_checked + 1e6 * 60 * 1 or force; };
+
+   // Only one refresh at a time. Requests that are not forced does not wait for a running refresh if there is a
+   // ranking loaded already, they use that one.
+   bool wait;
+   {
+      boost::lock_guard<boost::mutex> lock(_mutex);
+      if (not due()) {
+         return;
+      }
+      wait = force or _ranking.id == 0;
+   }
+
+   boost::unique_lock<boost::mutex> refresh_lock(_refresh_mutex, boost::defer_lock);
+   if (wait) {
+      refresh_lock.lock();
+   }
+   else if (not refresh_lock.try_lock()) {
+      return;
+   }
+
+   {
+      boost::lock_guard<boost::mutex> lock(_mutex);
+      // Check again, a refresh may have been done while waiting.
+      if (not due()) {
+         return;
+      }
       _last_checked = now;
-      db db(_db_name);
-      ranking_t ranking = db.get_latest_ranking();
-      
-      // Reload if new data.
-      if (ranking.id != _ranking.id or ranking.updated > _ranking.updated) {
-         LOG_INFO("loading ranking %d", ranking.id);
-         db.load_team_ranks(ranking.id, _team_ranks, data_time_low_limit);
-         // Make sure new data is sorted on version and mode since request will filter on version and mode before
-         // sorting (or sorting will take too long time).
-         sort(_team_ranks.begin(), _team_ranks.end(), compare_version_mode_world_rank);
-         LOG_INFO("ranking loaded and sorted");
-         _ranking = ranking;
+   }
+
+   // Load without holding _mutex so requests are served from the old ranking meanwhile, _ranking is only changed
+   // while holding _refresh_mutex.
+   db db(_db_name);
+   ranking_t ranking = db.get_latest_ranking();
+
+   // Reload if new data.
+   if (ranking.id != _ranking.id or ranking.updated > _ranking.updated) {
+      LOG_INFO("loading ranking %d", ranking.id);
+      team_ranks_t team_ranks;
+      db.load_team_ranks(ranking.id, team_ranks, data_time_low_limit);
+      // Make sure new data is sorted on version and mode since request will filter on version and mode before
+      // sorting (or sorting will take too long time).
+      sort(team_ranks.begin(), team_ranks.end(), compare_version_mode_world_rank);
+
+      // Team membership never changes and names and tags are updated from the ladder data of the team, so members
+      // are only loaded for teams that are new or have new data since the last load, the rest are kept.
+      team_data_times_t team_data_times = get_team_data_times(team_ranks);
+      vector<id_t> load_team_ids;
+      vector<id_t> removed_team_ids;
+      diff_team_data_times(_team_data_times, team_data_times, load_team_ids, removed_team_ids);
+      team_members_t team_members;
+      db.load_team_members(load_team_ids, team_members);
+      _team_data_times.swap(team_data_times);
+
+      boost::lock_guard<boost::mutex> lock(_mutex);
+      _team_ranks.swap(team_ranks);
+      for (id_t team_id : removed_team_ids) {
+         _team_members.erase(team_id);
+      }
+      for (auto& members : team_members) {
+         _team_members[members.first].swap(members.second);
+      }
+      index_clan_team_ranks();
+      _ranking = ranking;
+      LOG_INFO("ranking loaded and sorted");
+   }
+   else {
+      LOG_INFO("no new ranking available");
+   }
+}
+
+void
+ladder_handler::index_clan_team_ranks()
+{
+   _clan_team_ranks.clear();
+   _clan_team_index.clear();
+
+   for (auto& tr : _team_ranks) {
+      if (tr.version == LOTV and tr.mode == TEAM_1V1) {
+         _clan_team_ranks.push_back(tr);
+      }
+   }
+
+   sort(_clan_team_ranks.begin(), _clan_team_ranks.end(), compare_team_id_version_race);
+
+   _clan_team_index.reserve(_clan_team_ranks.size());
+   for (uint32_t i = 0; i < _clan_team_ranks.size(); ++i) {
+      _clan_team_index.emplace(_clan_team_ranks[i].team_id, i);
+   }
+}
+
+ladder_handler::team_data_times_t
+ladder_handler::get_team_data_times(const team_ranks_t& team_ranks)
+{
+   team_data_times_t team_data_times;
+   team_data_times.reserve(team_ranks.size());
+   for (auto& tr : team_ranks) {
+      team_data_times.emplace_back(tr.team_id, tr.data_time);
+   }
+
+   // Keep the latest data time of every team.
+   sort(team_data_times.begin(), team_data_times.end(),
+        [](const pair<id_t, double>& a, const pair<id_t, double>& b) {
+           return a.first < b.first or (a.first == b.first and a.second > b.second); });
+   team_data_times.erase(unique(team_data_times.begin(), team_data_times.end(),
+                                [](const pair<id_t, double>& a, const pair<id_t, double>& b) {
+                                   return a.first == b.first; }),
+                         team_data_times.end());
+   return team_data_times;
+}
+
+void
+ladder_handler::diff_team_data_times(const team_data_times_t& old_data_times, const team_data_times_t& data_times,
+                                     vector<id_t>& load_team_ids, vector<id_t>& removed_team_ids)
+{
+   auto o = old_data_times.begin();
+   auto n = data_times.begin();
+   while (o != old_data_times.end() or n != data_times.end()) {
+      if (n == data_times.end() or (o != old_data_times.end() and o->first < n->first)) {
+         removed_team_ids.push_back(o->first);
+         ++o;
+      }
+      else if (o == old_data_times.end() or n->first < o->first) {
+         load_team_ids.push_back(n->first);
+         ++n;
       }
       else {
-         LOG_INFO("no new ranking available");
+         if (n->second != o->second) {
+            load_team_ids.push_back(n->first);
+         }
+         ++o;
+         ++n;
       }
    }
 }
@@ -60,9 +176,44 @@ find_span(team_ranks_t& team_ranks, enum_t version, enum_t mode)
    return make_tuple(start, end);
 }
 
+// Return team json for team rank, member data is added from team_members, teams missing there (removed from the db) are
+// returned without it.
+Json::Value team_json(const team_members_t& team_members, const team_rank_t& tr, uint32_t rank)
+{
+   Json::Value team;
+   team["rank"] = rank;
+   team["team_id"] = tr.team_id;
+   team["region"] = tr.region;
+   team["league"] = tr.league;
+   team["tier"] = tr.tier;
+   team["mmr"] = tr.mmr;
+   team["points"] = tr.points;
+   team["wins"] = tr.wins;
+   team["losses"] = tr.losses;
+   team["win_rate"] = (tr.wins or tr.losses) ? float(100 * tr.wins) / (tr.wins + tr.losses) : 0;
+   team["data_time"] = uint32_t(tr.data_time);
+   team["m0_race"] = tr.race0;
+   team["m1_race"] = tr.race1;
+   team["m2_race"] = tr.race2;
+   team["m3_race"] = tr.race3;
+   auto members = team_members.find(tr.team_id);
+   if (members != team_members.end()) {
+      for (uint32_t m = 0; m < members->second.size(); ++m) {
+         const team_member_t& member = members->second[m];
+         team[fmt("m%d_id", m)] = member.id;
+         team[fmt("m%d_realm", m)] = member.realm;
+         team[fmt("m%d_bid", m)] = member.bid;
+         team[fmt("m%d_name", m)] = member.name;
+         team[fmt("m%d_tag", m)] = member.tag;
+      }
+   }
+   return team;
+}
+
 // Return teams json array, offset is offset for start and is used to calculate rank, rank is used for start rank since
 // that is dependend on data before start.
-Json::Value build_teams_array(const cmp_tr& cmp_op,
+Json::Value build_teams_array(const team_members_t& team_members,
+                              const cmp_tr& cmp_op,
                               const team_ranks_t::const_iterator& start,
                               const team_ranks_t::const_iterator& end,
                               uint32_t rank,
@@ -77,27 +228,38 @@ Json::Value build_teams_array(const cmp_tr& cmp_op,
          rank = i + offset;
          last = *curr;
       }
-      Json::Value team;
-      team["rank"] = rank;
-      team["team_id"] = curr->team_id;
-      team["region"] = curr->region;
-      team["league"] = curr->league;
-      team["tier"] = curr->tier;
-      team["mmr"] = curr->mmr;
-      team["points"] = curr->points;
-      team["wins"] = curr->wins;
-      team["losses"] = curr->losses;
-      team["win_rate"] = (curr->wins or curr->losses) ? float(100 * curr->wins) / (curr->wins + curr->losses) : 0;
-      team["data_time"] = uint32_t(curr->data_time);
-      team["m0_race"] = curr->race0;
-      team["m1_race"] = curr->race1;
-      team["m2_race"] = curr->race2;
-      team["m3_race"] = curr->race3;
-      teams.append(team);
+      teams.append(team_json(team_members, *curr, rank));
    }
    return teams;
 }
 
+// Return key for enum value from keys object (id as string -> key), or the id as string if not there.
+string enum_key(const Json::Value& keys, enum_t value)
+{
+   string id = to_string(int(value));
+   return keys.isMember(id) ? keys[id].asString() : id;
+}
+
+// Return value quoted for csv.
+string csv_quote(const string& value)
+{
+   string res = "\"";
+   for (char c : value) {
+      if (c == '"') {
+         res += '"';
+      }
+      res += c;
+   }
+   return res + "\"";
+}
+
+// Return the file name of an export, only version, mode and format are part of it. The same name is used by
+// main/export.py.
+string export_filename(const string& export_dir, enum_t version, enum_t mode, const string& format)
+{
+   return fmt("%s/ladder-%d-%d.%s", export_dir.c_str(), int(version), int(mode), format.c_str());
+}
+
 
 // Based on filter in request, sort and narrow span based off that.
 cmp_tr sort_and_filter_span(team_ranks_t::iterator& start, team_ranks_t::iterator& end, const Json::Value& request)
@@ -137,35 +299,30 @@ ladder_handler::clan(const Json::Value& request)
 
    boost::lock_guard<boost::mutex> lock(_mutex);
 
-   // Read team ids from request.
+   // Read team ids from request and pick out their team ranks using the index, teams without team rank in the ladder
+   // are ignored.
    
-   std::unordered_set<id_t> team_ids;
-   auto& val = request["team_ids"];
-   for (uint32_t i = 0; i < val.size(); ++i) {
-      team_ids.insert(val[i].asUInt());
-   }
-
-   // Find mode, version span then pick out ids, then apply filters.
    Json::Value response;
    response["code"] = "ok";
 
-   team_ranks_t::iterator start;
-   team_ranks_t::iterator end;
-   tie(start, end) = find_span(_team_ranks, LOTV, TEAM_1V1);
-
-   // Get ladder members and work with them.
-
    team_ranks_t team_ranks;
-   for (team_ranks_t::iterator tr = start; tr < end; ++tr) {
-      if (team_ids.find(tr->team_id) != team_ids.end()) {
-         team_ranks.push_back(*tr);
+   auto& val = request["team_ids"];
+   team_ranks.reserve(val.size());
+   for (uint32_t i = 0; i < val.size(); ++i) {
+      id_t team_id = val[i].asUInt();
+      auto index = _clan_team_index.find(team_id);
+      if (index == _clan_team_index.end()) {
+         continue;
+      }
+      for (uint32_t j = index->second; j < _clan_team_ranks.size() and _clan_team_ranks[j].team_id == team_id; ++j) {
+         team_ranks.push_back(_clan_team_ranks[j]);
       }
    }
 
    // Find start and end based in filter.
 
-   start = team_ranks.begin();
-   end = team_ranks.end();
+   team_ranks_t::iterator start = team_ranks.begin();
+   team_ranks_t::iterator end = team_ranks.end();
    cmp_tr cmp_strict = sort_and_filter_span(start, end, request);
 
    if (end <= start) {
@@ -176,7 +333,7 @@ ladder_handler::clan(const Json::Value& request)
 
    // Sort it and build response.
    
-   response["teams"] = build_teams_array(cmp_strict, start, end, 0, 0);
+   response["teams"] = build_teams_array(_team_members, cmp_strict, start, end, 0, 0);
    return response;
 }
 
@@ -260,9 +417,144 @@ ladder_handler::ladder(const Json::Value& request)
 
    team_ranks_t::iterator curr = start + offset;
 
-   response["teams"] = build_teams_array(cmp_strict, curr, min(end, curr + limit), rank, offset);
+   response["teams"] = build_teams_array(_team_members, cmp_strict, curr, min(end, curr + limit), rank, offset);
    response["offset"] = offset;
    
    return response;
 }
 
+
+Json::Value
+ladder_handler::export_ladder(const Json::Value& request)
+{
+   refresh_ranking();
+   
+   // Format and file, the file name is decided here (never taken from the request) and the file is written to a
+   // temporary file first and then renamed to be replaced atomically.
+   
+   string format = request["format"].asString();
+
+   Json::Value response;
+
+   if (_export_dir.empty()) {
+      response["code"] = "error";
+      response["message"] = "export is not enabled, no export dir configured";
+      return response;
+   }
+   
+   if (format != "csv" and format != "ndjson") {
+      response["code"] = "error";
+      response["message"] = fmt("unknown export format, '%s'", format.c_str());
+      return response;
+   }
+
+   // Keys to use for enums in export, objects of id -> key, ids are used if not set.
+   
+   const Json::Value& region_keys = request["keys"]["region"];
+   const Json::Value& league_keys = request["keys"]["league"];
+   const Json::Value& race_keys = request["keys"]["race"];
+   
+   // Sort and filter as ladder.
+
+   enum_t version = request.get("version", LOTV).asInt();
+   enum_t mode =    request.get("mode", TEAM_1V1).asInt();
+
+   // Copy the span and the members of its teams while holding the ranking so all teams are from the same ranking,
+   // sort and write the copy without holding it to not block other requests.
+
+   team_ranks_t team_ranks;
+   team_members_t team_members;
+   {
+      boost::lock_guard<boost::mutex> lock(_mutex);
+
+      team_ranks_t::iterator start;
+      team_ranks_t::iterator end;
+      tie(start, end) = find_span(_team_ranks, version, mode);
+      team_ranks.assign(start, end);
+
+      team_members.reserve(team_ranks.size());
+      for (const team_rank_t& tr : team_ranks) {
+         auto members = _team_members.find(tr.team_id);
+         if (members != _team_members.end()) {
+            team_members.emplace(tr.team_id, members->second);
+         }
+      }
+   }
+   
+   team_ranks_t::iterator start = team_ranks.begin();
+   team_ranks_t::iterator end = team_ranks.end();
+   cmp_tr cmp_strict = sort_and_filter_span(start, end, request);
+
+   string filename = export_filename(_export_dir, version, mode, format);
+
+   // Write the whole span, ranks and tiers are 1 indexed just as presented on the site.
+   
+   timer_us timer;
+   string tmp_filename = filename + ".tmp";
+   ofstream os(tmp_filename, ios::out | ios::trunc);
+   
+   if (format == "csv") {
+      os << "rank,team_id,region,league,tier,race,mmr,points,wins,losses,"
+         << "player_name,player_clan,player_id,player_realm,data_fetch_timestamp\n";
+   }
+
+   Json::FastWriter writer;
+   uint32_t rank = 0;
+   team_ranks_t::const_iterator curr = start;
+   team_rank_t last = start < end ? *start : team_rank_t();
+   for (uint32_t i = 0; curr < end; ++i, ++curr) {
+      if (cmp_strict(last, *curr) or cmp_strict(*curr, last)) {
+         rank = i;
+         last = *curr;
+      }
+
+      if (format == "ndjson") {
+         Json::Value team = team_json(team_members, *curr, rank + 1);
+         team["tier"] = curr->tier + 1;
+         team["region"] = enum_key(region_keys, curr->region);
+         team["league"] = enum_key(league_keys, curr->league);
+         team["m0_race"] = enum_key(race_keys, curr->race0);
+         team["m1_race"] = enum_key(race_keys, curr->race1);
+         team["m2_race"] = enum_key(race_keys, curr->race2);
+         team["m3_race"] = enum_key(race_keys, curr->race3);
+         os << writer.write(team);
+         continue;
+      }
+      
+      os << rank + 1 << ',' << curr->team_id << ','
+         << enum_key(region_keys, curr->region) << ',' << enum_key(league_keys, curr->league) << ','
+         << curr->tier + 1 << ',' << enum_key(race_keys, curr->race0) << ',';
+      if (curr->mmr < 0) {
+         os << '-';
+      }
+      else {
+         os << curr->mmr;
+      }
+      os << ',' << curr->points << ',' << curr->wins << ',' << curr->losses << ',';
+      
+      auto members = team_members.find(curr->team_id);
+      if (members != team_members.end() and not members->second.empty()) {
+         const team_member_t& member = members->second[0];
+         os << csv_quote(member.name) << ',' << csv_quote(member.tag) << ',' << member.bid << ','
+            << int(member.realm) << ',';
+      }
+      else {
+         os << ",,,,";
+      }
+      os << uint32_t(curr->data_time) << '\n';
+   }
+
+   os.close();
+   if (os.fail() or rename(tmp_filename.c_str(), filename.c_str()) != 0) {
+      response["code"] = "error";
+      response["message"] = fmt("failed to write export to '%s'", filename.c_str());
+      return response;
+   }
+   
+   LOG_INFO("exported %d teams to %s in %fs", end - start, filename.c_str(), float(timer.end()) / 1e6);
+   
+   response["code"] = "ok";
+   response["count"] = uint32_t(end - start);
+   response["filename"] = filename;
+   return response;
+}
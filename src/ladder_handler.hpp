@@ -2,6 +2,7 @@
 
 #include <boost/thread/mutex.hpp>    
 #include <jsoncpp/json/json.h>
+#include <unordered_map>
 
 #include "db.hpp"
 #include "log.hpp"
@@ -11,8 +12,10 @@
 // user wants.
 struct ladder_handler
 {
-   ladder_handler(const std::string& db_name, uint32_t keep_api_data_days) :
-      _db_name(db_name), _keep_api_data_days(keep_api_data_days), _last_checked(), _ranking(0, 0, 0, 0, 0) {}
+   // Exports are written to export_dir, export is disabled if it is empty.
+   ladder_handler(const std::string& db_name, uint32_t keep_api_data_days, const std::string& export_dir="") :
+      _db_name(db_name), _keep_api_data_days(keep_api_data_days), _export_dir(export_dir), _last_checked(),
+      _ranking(0, 0, 0, 0, 0) {}
 
    // Get a ladder slice of the ladder offseted by team_id or offset in the request. Return the teams in that
    // slice. Sorting and filtering possible.
@@ -21,6 +24,11 @@ struct ladder_handler
    // Get rankings for a clan (set of team ids in the request). Sorting and filtering possible.
    Json::Value clan(const Json::Value& request);
 
+   // Write the whole ladder sorted and filtered as in ladder to a file in the export dir named by version, mode and
+   // format (csv or ndjson). The teams are copied while holding the ranking so all teams are from the same ranking,
+   // the file is written after releasing it.
+   Json::Value export_ladder(const Json::Value& request);
+
    // Reload ranking will reload the ranking for db.
    Json::Value refresh(const Json::Value& request);
    
@@ -31,10 +39,40 @@ private:
    // Get ranking from db if new ranking is available.
    void refresh_ranking(bool force=false);
 
+   // Team ids with the latest data time of the team, sorted on team id.
+   using team_data_times_t = std::vector<std::pair<id_t, double>>;
+
+   // Get the team data times of the teams in team_ranks.
+   static team_data_times_t get_team_data_times(const team_ranks_t& team_ranks);
+
+   // Compare the data times of the loaded teams with the data times of a new ranking, add teams that are new or have
+   // new data to load_team_ids and teams no longer in the ranking to removed_team_ids.
+   static void diff_team_data_times(const team_data_times_t& old_data_times, const team_data_times_t& data_times,
+                                    std::vector<id_t>& load_team_ids, std::vector<id_t>& removed_team_ids);
+
+   // Rebuild the clan index from _team_ranks, must be called with _mutex held.
+   void index_clan_team_ranks();
+
    std::string _db_name;
    uint32_t _keep_api_data_days;
+   std::string _export_dir;
    uint64_t _last_checked;
    ranking_t _ranking;
    mutable boost::mutex _mutex;
+
+   // Held during refresh_ranking, the ranking is loaded without holding _mutex.
+   boost::mutex _refresh_mutex;
    team_ranks_t _team_ranks;
+
+   // Members of the teams in _team_ranks, loaded with the ranking to include names and tags in the responses.
+   team_members_t _team_members;
+
+   // Data times of the teams in _team_members when their members were loaded, only used by refresh_ranking.
+   team_data_times_t _team_data_times;
+
+   // Copy of the LotV 1v1 team ranks sorted on team_id (the span in _team_ranks is resorted by ladder requests) and
+   // an index from team_id to the position of the first team rank of the team in it. Used by clan requests to pick out
+   // the clan members without scanning the ladder.
+   team_ranks_t _clan_team_ranks;
+   std::unordered_map<id_t, uint32_t> _clan_team_index;
 };
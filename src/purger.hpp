@@ -1,42 +1,119 @@
 #pragma once
 
+#include <algorithm>
+#include <atomic>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <boost/python/list.hpp>
+#include <boost/python/extract.hpp>
+
 #include "log.hpp"
 #include "types.hpp"
 #include "db.hpp"
+#include "util.hpp"
 
 // Filter team_ranks from ranking data, keep a cache of all team ids in object.
 struct purger {
 
    purger(const std::string& db_name) :
+      _db_name(db_name),
       _db(db_name)
    {}
 
-   purger(const ranking_data& other) = delete;
+   purger(const purger& other) = delete;
 
    void purge_removed_teams_from_ranking(id_t ranking_id, float now, std::string threshold_date) {
+      load_team_ids(threshold_date);
+      release_gil nogil;
+      purge_ranking(_db, ranking_id, now);
+   }
+
+   // Purge rankings in parallel with threads workers, each with its own db connection and holding one ranking at the
+   // time. Returns the number of rankings that had removed teams and was saved.
+   uint32_t purge_removed_teams_from_rankings(boost::python::list ranking_ids, float now, std::string threshold_date,
+                                              uint32_t threads) {
+      std::vector<id_t> ids;
+      for (uint32_t i = 0; i < len(ranking_ids); ++i) {
+         ids.push_back(boost::python::extract<id_t>(ranking_ids[i]));
+      }
+      load_team_ids(threshold_date);
+
+      release_gil nogil;
+
+      std::atomic<uint32_t> next(0);
+      std::atomic<uint32_t> saved(0);
+      std::exception_ptr error;
+      std::mutex error_mutex;
+
+      std::vector<std::thread> workers;
+      for (uint32_t t = 0; t < std::max(1u, std::min<uint32_t>(threads, ids.size())); ++t) {
+         workers.emplace_back([&]() {
+               try {
+                  db worker_db(_db_name);
+                  for (uint32_t i = next++; i < ids.size(); i = next++) {
+                     if (purge_ranking(worker_db, ids[i], now)) {
+                        ++saved;
+                     }
+                  }
+               }
+               catch (...) {
+                  std::lock_guard<std::mutex> lock(error_mutex);
+                  if (not error) {
+                     error = std::current_exception();
+                  }
+                  next = ids.size();
+               }
+            });
+      }
+      for (auto& worker : workers) {
+         worker.join();
+      }
+
+      if (error) {
+         std::rethrow_exception(error);
+      }
+
+      return saved;
+   }
+
+   virtual ~purger() {}
+
+private:
+
+   void load_team_ids(const std::string& threshold_date) {
       if (_team_ids.size() == 0) {
          LOG_INFO("loading team ids");
          _db.load_seen_team_ids(_team_ids, threshold_date);
       }
-      _db.load_team_ranks(ranking_id, _team_ranks);
-      team_ranks_t filtered_team_ranks;
-      std::copy_if(_team_ranks.begin(), 
-                   _team_ranks.end(),
-                   std::back_inserter(filtered_team_ranks),
-                   [&](const team_rank_t& tr){return _team_ids.find(tr.team_id) != _team_ids.end();}
-         );
-      _db.save_team_ranks(ranking_id, now, filtered_team_ranks);
    }
-   
-   virtual ~purger() {}
 
-private:
+   // Remove team ranks of teams not seen from ranking, the ranking is not saved if nothing was removed. Returns true
+   // if saved.
+   bool purge_ranking(db& db, id_t ranking_id, float now) {
+      team_ranks_t team_ranks;
+      db.load_team_ranks(ranking_id, team_ranks);
+
+      auto seen = [&](const team_rank_t& tr) { return _team_ids.contains(tr.team_id); };
+
+      if (std::all_of(team_ranks.begin(), team_ranks.end(), seen)) {
+         LOG_INFO("no teams to purge from ranking %d", ranking_id);
+         return false;
+      }
+
+      size_t size = team_ranks.size();
+      team_ranks.erase(std::remove_if(team_ranks.begin(), team_ranks.end(),
+                                      [&](const team_rank_t& tr) { return not seen(tr); }),
+                       team_ranks.end());
+      db.save_team_ranks(ranking_id, now, team_ranks);
+      LOG_INFO("purged %d teams from ranking %d", size - team_ranks.size(), ranking_id);
+      return true;
+   }
+
+   std::string _db_name;
 
-   // The ranking data.
-   team_ranks_t _team_ranks;
+   // Ids of all teams seen, loaded once and then only read.
+   id_set_t _team_ids;
 
-   // Player cache.
-   std::unordered_set<id_t> _team_ids;
-   
    db _db;
 };
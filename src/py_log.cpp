@@ -1,5 +1,6 @@
 
 #include "log.hpp"
+#include "util.hpp"
 
 #include <cstdarg>
 #include <stdint.h>
@@ -26,6 +27,9 @@ void log(const uint32_t& level, const char* file, int line, const char* format,
 
    // va_args
 
+   // Logging may be done while the GIL is released.
+   ensure_gil gil;
+
    object log_method;
 
    switch (level) {
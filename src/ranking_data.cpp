@@ -3,6 +3,8 @@
 #include <boost/python/stl_iterator.hpp>
 #include <boost/python/extract.hpp>
 #include <algorithm>
+#include <unordered_map>
+#include <jsoncpp/json/json.h>
 
 #include "log.hpp"
 #include "ranking_data.hpp"
@@ -20,6 +22,23 @@ inline enum_t get_sort_key(id_t season_id)
    return season_id >= MMR_SEASON ? MMR : LEAGUE_POINTS;
 }
 
+race_ids_t extract_race_ids(const boost::python::dict enums_info)
+{
+   race_ids_t race_ids;
+   boost::python::list races = boost::python::dict(enums_info["race_key_by_ids"]).items();
+   for (uint32_t i = 0; i < len(races); ++i) {
+      race_ids[extract<string>(races[i][1])] = extract<enum_t>(races[i][0]);
+   }
+   return race_ids;
+}
+
+ranking_data::ranking_data(const std::string& db_name, const boost::python::dict enums_info) :
+   _db(db_name),
+   _snapshot_db(db_name),
+   _enums_info(enums_info),
+   _race_ids(extract_race_ids(enums_info))
+{}
+
 void ranking_data::load(id_t id)
 {
    boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
@@ -29,7 +48,15 @@ void ranking_data::load(id_t id)
 
 void ranking_data::save_data(id_t id, id_t season_id, float now)
 {
-   boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+   vector<enum_t> versions = extract_enum(_enums_info, "version_ranking_ids");
+   vector<enum_t> modes = extract_enum(_enums_info, "mode_ranking_ids");
+   vector<enum_t> regions = extract_enum(_enums_info, "region_ranking_ids");
+   vector<enum_t> leagues = extract_enum(_enums_info, "league_ranking_ids");
+
+   release_gil nogil;
+
+   // Work on a snapshot so merging can continue while ranking and saving, the lock is only held while copying.
+   team_ranks_t team_ranks = snapshot_team_ranks();
 
    // Fix order here later, mostly used for team page.
    
@@ -38,7 +65,7 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
    enum_t sort_key = get_sort_key(season_id);
 
    cmp_tr cmp_inner(NOT_REVERSED, NOT_SET, NOT_SET, NOT_SET, sort_key, STRICT);
-   stable_sort(_team_ranks.begin(), _team_ranks.end(), cmp_tr_version_mode(cmp_inner));
+   stable_sort(team_ranks.begin(), team_ranks.end(), cmp_tr_version_mode(cmp_inner));
 
    
    // Calcualte ranks, possible to do this smarter, but who cares, saving this in database
@@ -50,11 +77,6 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
    uint32_t pos;
    uint32_t rank;
 
-   vector<enum_t> versions = extract_enum(_enums_info, "version_ranking_ids");
-   vector<enum_t> modes = extract_enum(_enums_info, "mode_ranking_ids");
-   vector<enum_t> regions = extract_enum(_enums_info, "region_ranking_ids");
-   vector<enum_t> leagues = extract_enum(_enums_info, "league_ranking_ids");
-
    // Loop over game versions.
    for (vector<enum_t>::iterator version_i = versions.begin(); version_i != versions.end(); ++version_i) {
       enum_t version = *version_i;
@@ -78,7 +100,7 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
             
                // Count league size.
                league_count = 0;
-               for (auto tr = _team_ranks.begin(); tr != _team_ranks.end(); ++tr) {
+               for (auto tr = team_ranks.begin(); tr != team_ranks.end(); ++tr) {
                   if (tr->mode == mode and tr->version == version
                       and tr->region == region and tr->league == league) {
                      ++league_count;
@@ -86,13 +108,13 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
                }
                
                // Set league ranks.
-               auto last_tr = _team_ranks.end();
+               auto last_tr = team_ranks.end();
                cmp_tr cmp(NOT_REVERSED, region, league, NOT_SET, sort_key, STRICT);
                pos = 1;
                rank = 1;
-               for (auto tr = _team_ranks.begin(); tr != _team_ranks.end(); ++tr) {
+               for (auto tr = team_ranks.begin(); tr != team_ranks.end(); ++tr) {
                   if (tr->mode == mode and tr->version == version and cmp.use(*tr)) {
-                     if (last_tr == _team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
+                     if (last_tr == team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
                         rank = pos;
                         last_tr = tr;
                      }
@@ -105,13 +127,13 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
             }
                
             // Set region ranks.
-            auto last_tr = _team_ranks.end();
+            auto last_tr = team_ranks.end();
             cmp_tr cmp(NOT_REVERSED, region, NOT_SET, NOT_SET, sort_key, STRICT);
             pos = 1;
             rank = 1;
-            for (auto tr = _team_ranks.begin(); tr != _team_ranks.end(); ++tr) {
+            for (auto tr = team_ranks.begin(); tr != team_ranks.end(); ++tr) {
                if (tr->mode == mode and tr->version == version and cmp.use(*tr)) {
-                  if (last_tr == _team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
+                  if (last_tr == team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
                      rank = pos;
                      last_tr = tr;
                   }
@@ -124,13 +146,13 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
          }
          
          // Set world ranks.
-         auto last_tr = _team_ranks.end();
+         auto last_tr = team_ranks.end();
          cmp_tr cmp(NOT_REVERSED, NOT_SET, NOT_SET, NOT_SET, sort_key, STRICT);
          pos = 1;
          rank = 1;
-         for (auto tr = _team_ranks.begin(); tr != _team_ranks.end(); ++tr) {
+         for (auto tr = team_ranks.begin(); tr != team_ranks.end(); ++tr) {
             if (tr->mode == mode and tr->version == version and cmp.use(*tr)) {
-               if (last_tr == _team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
+               if (last_tr == team_ranks.end() or cmp(*last_tr, *tr) or cmp(*tr, *last_tr)) {
                   rank = pos;
                   last_tr = tr;
                }
@@ -144,7 +166,7 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
 
    // Set best rank for 1v1 where different ranks per race is possible.
    set<pair<id_t, enum_t> > team_id_versions;
-   for (auto& tr : _team_ranks) {
+   for (auto& tr : team_ranks) {
       if (tr.mode == TEAM_1V1) {
          auto team_id_version = make_pair(tr.team_id, tr.version);
          if (team_id_versions.find(team_id_version) == team_id_versions.end()) {
@@ -159,22 +181,14 @@ void ranking_data::save_data(id_t id, id_t season_id, float now)
    
    // Write new team_ranks to database.
    
-   stable_sort(_team_ranks.begin(), _team_ranks.end(), compare_team_id_version_race);
+   stable_sort(team_ranks.begin(), team_ranks.end(), compare_team_id_version_race);
 
-   db::transaction_block tb(_db);   
-   _db.save_team_ranks(id, now, _team_ranks);
+   db::transaction_block tb(_snapshot_db);
+   _snapshot_db.save_team_ranks(id, now, team_ranks);
 }
 
 void ranking_data::save_stats(id_t id, float now)
 {
-   boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
-   
-   stable_sort(_team_ranks.begin(), _team_ranks.end(), compare_for_ranking_stats_v1);
-
-   ranking_stats_t stats;
-   stats.ranking_id = id;
-   rs_datas_t& datas = stats.datas;
-
    // It is very important that all those enums are sorted as ints because the sorted team_ranks will have to be
    // processed in order or the code won't work, enum info stat ids arrays are sorted because of this.
    object enums_stat = _enums_info["stat"][RANKING_STATS_VERSION_1];
@@ -183,6 +197,16 @@ void ranking_data::save_stats(id_t id, float now)
    vector<enum_t> regions = extract_enum(enums_stat, "region_ids");
    vector<enum_t> leagues = extract_enum(enums_stat, "league_ids");
    vector<enum_t> races = extract_enum(enums_stat, "race_ids");
+
+   release_gil nogil;
+
+   team_ranks_t team_ranks = snapshot_team_ranks();
+   
+   stable_sort(team_ranks.begin(), team_ranks.end(), compare_for_ranking_stats_v1);
+
+   ranking_stats_t stats;
+   stats.ranking_id = id;
+   rs_datas_t& datas = stats.datas;
    
    uint32_t index = 0;
 
@@ -192,16 +216,16 @@ void ranking_data::save_stats(id_t id, float now)
             for (uint32_t league_i = 0; league_i < leagues.size(); ++league_i) {
                for (uint32_t race_i = 0; race_i < races.size(); ++race_i) {
                   rs_data_t data;
-                  while (index < _team_ranks.size()
-                         and _team_ranks[index].mode == modes[mode_i]
-                         and _team_ranks[index].version == versions[version_i]
-                         and _team_ranks[index].region == regions[region_i]
-                         and _team_ranks[index].league == leagues[league_i]
-                         and _team_ranks[index].race0 == races[race_i]) {
+                  while (index < team_ranks.size()
+                         and team_ranks[index].mode == modes[mode_i]
+                         and team_ranks[index].version == versions[version_i]
+                         and team_ranks[index].region == regions[region_i]
+                         and team_ranks[index].league == leagues[league_i]
+                         and team_ranks[index].race0 == races[race_i]) {
                      data.count += 1;
-                     data.wins += _team_ranks[index].wins;
-                     data.losses += _team_ranks[index].losses;
-                     data.points += _team_ranks[index].points;
+                     data.wins += team_ranks[index].wins;
+                     data.losses += team_ranks[index].losses;
+                     data.points += team_ranks[index].points;
                      ++index;
                   }
                   datas.push_back(data);
@@ -213,35 +237,109 @@ void ranking_data::save_stats(id_t id, float now)
    
    stats.version = RANKING_STATS_VERSION_1;
 
+   db::transaction_block tb(_snapshot_db);
+   _snapshot_db.update_or_create_ranking_stats(stats, id);
+}
+
+boost::python::dict ranking_data::source_data_times()
+{
+   unordered_map<id_t, double> data_times;
    {
-      db::transaction_block tb(_db);
-      _db.update_or_create_ranking_stats(stats, id);
+      release_gil nogil;
+      boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+      for (auto& tr : _team_ranks) {
+         auto i = data_times.find(tr.source_id);
+         if (i == data_times.end()) {
+            data_times[tr.source_id] = tr.data_time;
+         }
+         else {
+            i->second = max(i->second, tr.data_time);
+         }
+      }
    }
 
-   // Sort it back for more inserts.
-   stable_sort(_team_ranks.begin(), _team_ranks.end(), compare_team_id_version_race);
+   boost::python::dict res;
+   for (auto& i : data_times) {
+      res[i.first] = i.second;
+   }
+   return res;
+}
+
+void ranking_data::preload(std::string threshold_date)
+{
+   release_gil nogil;
+   boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+   db::transaction_block tb(_db);
+   _db.load_seen_players(_player_cache, threshold_date);
+   _db.load_seen_teams(_team_cache, threshold_date);
+   LOG_INFO("preloaded caches, sizes %d players %d teams", _player_cache.size(), _team_cache.size());
+}
+
+team_ranks_t ranking_data::snapshot_team_ranks()
+{
+   boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+   return _team_ranks;
 }
 
 boost::python::list ranking_data::min_max_data_time()
 {
    boost::python::list res;
-   if (not _team_ranks.size()) {
+   double min_data_time = 1e32;
+   double max_data_time = 0;
+   size_t size;
+   {
+      release_gil nogil;
+      boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+      size = _team_ranks.size();
+      for (auto& team_rank : _team_ranks) {
+         min_data_time = min(team_rank.data_time, min_data_time);
+         max_data_time = max(team_rank.data_time, max_data_time);
+      }
+   }
+   
+   if (not size) {
       res.append(0);
       res.append(0);
       return res;
    }
    
-   double min_data_time = 1e32;
-   double max_data_time = 0;
-   for (auto& team_rank : _team_ranks) {
-      min_data_time = min(team_rank.data_time, min_data_time);
-      max_data_time = max(team_rank.data_time, max_data_time);
-   }
    res.append(min_data_time);
    res.append(max_data_time);
    return res;
 }
 
+uint32_t ranking_data::rollover(const boost::python::dict sources)
+{
+   unordered_map<id_t, pair<id_t, double> > source_map;
+   boost::python::list items = sources.items();
+   for (uint32_t i = 0; i < len(items); ++i) {
+      id_t old_id = extract<id_t>(items[i][0]);
+      id_t new_id = extract<id_t>(items[i][1][0]);
+      double updated = extract<double>(items[i][1][1]);
+      source_map[old_id] = make_pair(new_id, updated);
+   }
+
+   release_gil nogil;
+   boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
+
+   // Allow for some rounding in the unix times.
+   const double margin = 1e-3;
+   
+   size_t size = _team_ranks.size();
+   auto keep = _team_ranks.begin();
+   for (auto& tr : _team_ranks) {
+      auto source = source_map.find(tr.source_id);
+      if (source == source_map.end() or tr.data_time + margin < source->second.second) {
+         continue;
+      }
+      tr.source_id = source->second.first;
+      *keep++ = tr;
+   }
+   _team_ranks.erase(keep, _team_ranks.end());
+   
+   return size - _team_ranks.size();
+}
+
 // Update old player with new player info, return true if anything was updated.
 bool update_player(player_t& old_player, const player_t& new_player)
 {
@@ -373,19 +471,19 @@ bool update_team(team_t& old_team, const team_t& new_team)
 }
 
 
-boost::python::dict
-ranking_data::update_with_ladder(id_t ladder_id,
-                                 id_t source_id,
-                                 enum_t region,
-                                 enum_t mode,
-                                 enum_t league,
-                                 enum_t tier,
-                                 enum_t version,
-                                 id_t season_id,
-                                 double data_time,
-                                 std::string data_date,
-                                 uint32_t team_size,
-                                 boost::python::list members)
+update_stats_t
+ranking_data::update_with_members(id_t ladder_id,
+                                  id_t source_id,
+                                  enum_t region,
+                                  enum_t mode,
+                                  enum_t league,
+                                  enum_t tier,
+                                  enum_t version,
+                                  id_t season_id,
+                                  double data_time,
+                                  std::string data_date,
+                                  uint32_t team_size,
+                                  const members_t& members)
 {
    boost::lock_guard<boost::mutex> lock(_team_ranks_mutex);
 
@@ -407,20 +505,20 @@ ranking_data::update_with_ladder(id_t ladder_id,
 
       players_t players;
       player_set_t unknown_players;
-      for (uint32_t i = 0; i < len(members); ++i) {
-         object member = members[i];
+      for (uint32_t i = 0; i < members.size(); ++i) {
+         const member_t& member = members[i];
          player_t p;
          p.id = 0;
          p.region = region;
-         p.bid = extract<bid_t>(member["bid"]);
-         p.realm = extract<bid_t>(member["realm"]);
-         p.name = extract<string>(member["name"]);
-         p.tag = extract<string>(member["tag"]);
-         p.clan = extract<string>(member["clan"]);
+         p.bid = member.bid;
+         p.realm = member.realm;
+         p.name = member.name;
+         p.tag = member.tag;
+         p.clan = member.clan;
          p.season_id = season_id;
          p.mode = mode;
          p.league = league;
-         p.race = extract<enum_t>(member["race"]);
+         p.race = member.race;
          p.last_seen = data_date;
          
          auto pc = _player_cache.find(p);
@@ -455,7 +553,7 @@ ranking_data::update_with_ladder(id_t ladder_id,
       enum_t member_races[] = {-1, -1, -1, -1};
       teams_t teams;
       team_set_t unknown_teams;
-      for (uint32_t i = 0; i < len(members); ++i) {
+      for (uint32_t i = 0; i < members.size(); ++i) {
          
          member_ids[i % team_size] = players[i].id;
          member_races[i % team_size] = players[i].race;
@@ -493,6 +591,9 @@ ranking_data::update_with_ladder(id_t ladder_id,
 
       // Get/insert teams in db and make sure all ids are set.
 
+      // Teams not in cache needs to be in clan_team (if tagged), they may be new or not yet synced.
+      vector<id_t> clan_team_ids;
+
       if (unknown_teams.size()) {
          inserted_team_count = _db.get_or_insert_teams(_team_cache, unknown_teams, team_size);
 
@@ -500,6 +601,9 @@ ranking_data::update_with_ladder(id_t ladder_id,
             if (not team.id) {
                auto tc = _team_cache.find(team);
                team.id = tc->id;
+               if (mode == TEAM_1V1) {
+                  clan_team_ids.push_back(team.id);
+               }
             }
          }
       }
@@ -512,14 +616,14 @@ ranking_data::update_with_ladder(id_t ladder_id,
       team_map_t team_map;
       player_map_t player_map;
 
-      for (uint32_t i = 0; i < len(members); ++i) {
+      for (uint32_t i = 0; i < members.size(); ++i) {
 
          player_map.insert(make_pair(players[i].id, players[i]));
          
          if (i % team_size == team_size - 1) {
             // Last member in the team, handle team.
             
-            object member = members[i];
+            const member_t& member = members[i];
             auto& team = teams[i / team_size];
 
             // Insert first team occurance will be the highest ranked.
@@ -535,11 +639,11 @@ ranking_data::update_with_ladder(id_t ladder_id,
             team_rank.ladder_id = ladder_id;
             team_rank.source_id = source_id;
             team_rank.data_time = data_time;
-            team_rank.mmr = extract<int16_t>(member["mmr"]);
-            team_rank.points = extract<float>(member["points"]);
-            team_rank.wins = extract<uint32_t>(member["wins"]);
-            team_rank.losses = extract<uint32_t>(member["losses"]);
-            team_rank.join_time = extract<uint32_t>(member["join_time"]);
+            team_rank.mmr = member.mmr;
+            team_rank.points = member.points;
+            team_rank.wins = member.wins;
+            team_rank.losses = member.losses;
+            team_rank.join_time = member.join_time;
             team_rank.race0 = team.r0;
             team_rank.race1 = team.r1;
             team_rank.race2 = team.r2;
@@ -617,6 +721,7 @@ ranking_data::update_with_ladder(id_t ladder_id,
 
       player_set_t updated_players;
       team_set_t updated_teams;
+      vector<id_t> clan_player_ids;  // Players with changed tag or clan.
 
       for (auto& tr : ladder) {
          if (tr.team_id) {
@@ -637,10 +742,15 @@ ranking_data::update_with_ladder(id_t ladder_id,
             for (auto id : player_ids) {
                auto& player = player_map[id];
                player_t cached = *_player_cache.find(player);
+               string tag = cached.tag;
+               string clan = cached.clan;
                if (update_player(cached, player)) {
                   _player_cache.erase(cached);
                   _player_cache.insert(cached);
                   updated_players.insert(cached);
+                  if (cached.tag != tag or cached.clan != clan) {
+                     clan_player_ids.push_back(cached.id);
+                  }
                }
             }
          }
@@ -658,15 +768,221 @@ ranking_data::update_with_ladder(id_t ladder_id,
           updated_team_count = updated_teams.size();
           _db.update_teams(updated_teams);
        }
+
+       // Update clan rosters, tag or season may have changed.
+
+       if (mode == TEAM_1V1) {
+          for (auto& team : updated_teams) {
+             clan_team_ids.push_back(team.id);
+          }
+       }
+       _db.update_clan_teams(clan_team_ids, clan_player_ids);
    }
 
-   boost::python::dict stats;
-   stats["updated_player_count"] = updated_player_count;
-   stats["inserted_player_count"] = inserted_player_count;
-   stats["updated_team_count"] = updated_team_count;
-   stats["inserted_team_count"] = inserted_team_count;
-   stats["player_cache_size"] = _player_cache.size();
-   stats["team_cache_size"] = _team_cache.size();
+   update_stats_t stats;
+   stats.updated_player_count = updated_player_count;
+   stats.inserted_player_count = inserted_player_count;
+   stats.updated_team_count = updated_team_count;
+   stats.inserted_team_count = inserted_team_count;
+   stats.player_cache_size = _player_cache.size();
+   stats.team_cache_size = _team_cache.size();
    return stats;
 }
 
+boost::python::dict to_dict(const update_stats_t& stats)
+{
+   boost::python::dict res;
+   res["updated_player_count"] = stats.updated_player_count;
+   res["inserted_player_count"] = stats.inserted_player_count;
+   res["updated_team_count"] = stats.updated_team_count;
+   res["inserted_team_count"] = stats.inserted_team_count;
+   res["player_cache_size"] = stats.player_cache_size;
+   res["team_cache_size"] = stats.team_cache_size;
+   return res;
+}
+
+boost::python::dict
+ranking_data::update_with_ladder(id_t ladder_id,
+                                 id_t source_id,
+                                 enum_t region,
+                                 enum_t mode,
+                                 enum_t league,
+                                 enum_t tier,
+                                 enum_t version,
+                                 id_t season_id,
+                                 double data_time,
+                                 std::string data_date,
+                                 uint32_t team_size,
+                                 boost::python::list members)
+{
+   members_t ms;
+   for (uint32_t i = 0; i < len(members); ++i) {
+      object member = members[i];
+      member_t m;
+      m.bid = extract<bid_t>(member["bid"]);
+      m.realm = extract<bid_t>(member["realm"]);
+      m.name = extract<string>(member["name"]);
+      m.tag = extract<string>(member["tag"]);
+      m.clan = extract<string>(member["clan"]);
+      m.race = extract<enum_t>(member["race"]);
+      m.mmr = extract<int16_t>(member["mmr"]);
+      m.points = extract<float>(member["points"]);
+      m.wins = extract<uint32_t>(member["wins"]);
+      m.losses = extract<uint32_t>(member["losses"]);
+      m.join_time = extract<uint32_t>(member["join_time"]);
+      ms.push_back(m);
+   }
+
+   update_stats_t stats;
+   {
+      release_gil nogil;
+      stats = update_with_members(ladder_id, source_id, region, mode, league, tier, version, season_id, data_time,
+                                  data_date, team_size, ms);
+   }
+   return to_dict(stats);
+}
+
+boost::python::dict
+ranking_data::update_with_ladder_json(id_t ladder_id,
+                                      id_t source_id,
+                                      enum_t region,
+                                      enum_t mode,
+                                      enum_t league,
+                                      enum_t tier,
+                                      enum_t version,
+                                      id_t season_id,
+                                      double data_time,
+                                      std::string data_date,
+                                      uint32_t team_size,
+                                      std::string data)
+{
+   update_stats_t stats;
+   parse_stats_t parse_stats;
+   {
+      release_gil nogil;
+      members_t members = parse_ladder_members(data, team_size, _race_ids, parse_stats);
+      stats = update_with_members(ladder_id, source_id, region, mode, league, tier, version, season_id, data_time,
+                                  data_date, team_size, members);
+   }
+   if (parse_stats.empty_members_count or parse_stats.empty_member_count or parse_stats.bad_mmr_count
+       or parse_stats.missing_char_count) {
+      LOG_INFO("ladder %d had %d teams with empty members, %d empty members, %d members with bad mmr"
+               " and %d members missing character",
+               ladder_id, parse_stats.empty_members_count, parse_stats.empty_member_count, parse_stats.bad_mmr_count,
+               parse_stats.missing_char_count);
+   }
+   return to_dict(stats);
+}
+
+// Return at most max_chars first utf-8 characters of s.
+string utf8_prefix(const string& s, uint32_t max_chars)
+{
+   uint32_t chars = 0;
+   for (size_t i = 0; i < s.size(); ++i) {
+      if ((s[i] & 0xC0) != 0x80) {
+         if (chars == max_chars) {
+            return s.substr(0, i);
+         }
+         ++chars;
+      }
+   }
+   return s;
+}
+
+members_t
+parse_ladder_members(const string& data, uint32_t team_size, const race_ids_t& race_ids, parse_stats_t& parse_stats)
+{
+   Json::Value root;
+   Json::Reader reader;
+   if (not reader.parse(data, root, false)) {
+      THROW(base_exception, fmt("failed to parse ladder json, %s", reader.getFormattedErrorMessages().c_str()));
+   }
+
+   auto race_id = [&race_ids](string key) {
+      transform(key.begin(), key.end(), key.begin(), ::tolower);
+      auto i = race_ids.find(key);
+      if (i == race_ids.end()) {
+         THROW(base_exception, fmt("unknown race '%s' in ladder json", key.c_str()));
+      }
+      return i->second;
+   };
+   
+   members_t members;
+   
+   if (root.isMember("league")) {
+      // Game data api version.
+      for (const auto& t : root["team"]) {
+         if (t["member"].empty()) {
+            // Some ladders contain empty members.
+            ++parse_stats.empty_members_count;
+         }
+         for (const auto& m : t["member"]) {
+            if (m.empty()) {
+               // Some ladders contain empty member.
+               ++parse_stats.empty_member_count;
+               continue;
+            }
+
+            if (m["character_link"].empty()) {
+               ++parse_stats.missing_char_count;
+            }
+
+            // Character_link is unusable for identifying a player since it does not have realm and names can change,
+            // have to use legacy link.
+            const auto& legacy = m["legacy_link"];
+            const auto& clan = m["clan_link"];
+
+            // Is first race always latest played?
+            const auto& played_race_count = m["played_race_count"];
+            string race = "unknown";
+            if (played_race_count.size()) {
+               race = played_race_count[0]["race"].get("en_US", "unknown").asString();
+            }
+
+            string name = legacy.get("name", "").asString();
+            
+            member_t member;
+            member.bid = legacy["id"].asUInt();
+            member.realm = legacy["realm"].asInt();
+            member.name = utf8_prefix(name.substr(0, name.find('#')), 12);
+            member.tag = clan.get("clan_tag", "").asString();
+            member.clan = clan.get("clan_name", "").asString();
+            member.race = race_id(race);
+            int32_t mmr = t.get("rating", NO_MMR).asInt();
+            member.mmr = mmr > 30000 ? NO_MMR : mmr;  // Mitigate Blizzard api bug.
+            if (member.mmr == NO_MMR) {
+               ++parse_stats.bad_mmr_count;
+            }
+            member.points = t.get("points", 0).asFloat();
+            member.wins = t.get("wins", 0).asUInt();
+            member.losses = t.get("losses", 0).asUInt();
+            member.join_time = t.get("join_time_stamp", 0).asUInt();
+            members.push_back(member);
+         }
+      }
+   }
+   else {
+      // Legacy api version.
+      const auto& ladder_members = root["ladderMembers"];
+      for (uint32_t i = 0; i < ladder_members.size(); ++i) {
+         const auto& m = ladder_members[i];
+         const auto& c = m["character"];
+         member_t member;
+         member.bid = c["id"].asUInt();
+         member.realm = c["realm"].asInt();
+         member.name = utf8_prefix(c["displayName"].asString(), 12);
+         member.tag = c["clanTag"].asString();
+         member.clan = c["clanName"].asString();
+         member.race = race_id(m.get(fmt("favoriteRaceP%d", i % team_size + 1), "unknown").asString());
+         member.mmr = NO_MMR;
+         member.points = m["points"].asFloat();
+         member.wins = m["wins"].asUInt();
+         member.losses = m["losses"].asUInt();
+         member.join_time = m["joinTimestamp"].asUInt();
+         members.push_back(member);
+      }
+   }
+   
+   return members;
+}
+
@@ -10,28 +10,84 @@
 #include "db.hpp"
 #include "timer.hpp"
 
+// A ladder member, one per player in the ladder, members of a team are next to each other.
+struct member_t {
+   bid_t bid;
+   enum_t realm;
+   std::string name;
+   std::string tag;
+   std::string clan;
+   enum_t race;
+   int16_t mmr;
+   float points;
+   uint32_t wins;
+   uint32_t losses;
+   uint32_t join_time;
+};
+
+typedef std::vector<member_t> members_t;
+
+typedef std::map<std::string, enum_t> race_ids_t;
+
+// Get race id by lower case race key from enums info.
+race_ids_t extract_race_ids(const boost::python::dict enums_info);
+
+// Counts of bad data skipped or fixed while parsing ladder members, logged when python can be used again.
+struct parse_stats_t {
+   parse_stats_t() : empty_members_count(0), empty_member_count(0), bad_mmr_count(0), missing_char_count(0) {}
+   uint32_t empty_members_count;  // Teams without members.
+   uint32_t empty_member_count;   // Empty members, skipped.
+   uint32_t bad_mmr_count;        // Members without usable mmr.
+   uint32_t missing_char_count;   // Members without character link.
+};
+
+// Parse members from ladder api json data (game data or legacy format), does not use python.
+members_t parse_ladder_members(const std::string& data, uint32_t team_size, const race_ids_t& race_ids,
+                               parse_stats_t& parse_stats);
+
+// Stats from updating the ranking with a ladder.
+struct update_stats_t {
+   uint32_t updated_player_count;
+   uint32_t inserted_player_count;
+   uint32_t updated_team_count;
+   uint32_t inserted_team_count;
+   uint32_t player_cache_size;
+   uint32_t team_cache_size;
+};
+
 // Keep a full ranking data in memory to be able to continously update it with new ladders.
 struct ranking_data {
 
-   ranking_data(const std::string& db_name, const boost::python::dict enums_info) :
-      _db(db_name),
-      _enums_info(enums_info)
-   {}
+   ranking_data(const std::string& db_name, const boost::python::dict enums_info);
 
    ranking_data(const ranking_data& other) = delete;
    
    // Load ranking (data) to use as base for updating, if not loading, an empty team rank will be used.
    void load(id_t id);
 
-   // Save to the ranking data of the ranking and set now as updated time.
+   // Save to the ranking data of the ranking and set now as updated time. Ranks are calculated on a copy of the team
+   // ranks and saved using a separate connection without holding the GIL, updates can run concurrently.
    void save_data(id_t id, id_t season_id, float now);
 
-   // Save to the ranking stats of the ranking and set now as updated time.
+   // Save to the ranking stats of the ranking and set now as updated time, works on a copy like save_data.
    void save_stats(id_t id, float now);
 
+   // Return dict of source id -> latest data_time of team ranks from that source, used to find caches that are missing
+   // in the ranking.
+   boost::python::dict source_data_times();
+
+   // Warm up the player and team caches with players and teams seen since threshold_date (inclusive, iso format),
+   // makes updates fast from the start instead of looking up every player and team in the db.
+   void preload(std::string threshold_date);
+
    // Return the <min, max> data_time for the rankings.
    boost::python::list min_max_data_time();
 
+   // Roll over the team ranks to a new ranking. Sources is a dict of old source id -> (new source id, source updated
+   // unix time). Team ranks with data older than their source (teams that left the ladder) or with a source not in
+   // sources are removed, the rest gets the new source id. Returns the number of removed team ranks.
+   uint32_t rollover(const boost::python::dict sources);
+
    // Update ranking in memory with a ladder, new/updates teams/users will be saved directly to the database.
    boost::python::dict update_with_ladder(id_t ladder_id,
                                           id_t source_id,
@@ -46,6 +102,21 @@ struct ranking_data {
                                           uint32_t team_size,
                                           boost::python::list members);
 
+   // Same as update_with_ladder but with the ladder as api json data (game data or legacy format) instead of a list
+   // of members, the data is parsed and the ranking updated without holding the GIL.
+   boost::python::dict update_with_ladder_json(id_t ladder_id,
+                                               id_t source_id,
+                                               enum_t region,
+                                               enum_t mode,
+                                               enum_t league,
+                                               enum_t tier,
+                                               enum_t version,
+                                               id_t season_id,
+                                               double data_time,
+                                               std::string date_date,
+                                               uint32_t team_size,
+                                               std::string data);
+
    // Clear team ranks, but keep caches and db connection.
    void clear_team_ranks()
    {
@@ -57,12 +128,14 @@ struct ranking_data {
    void reconnect_db()
    {
       _db.reconnect();
+      _snapshot_db.reconnect();
    }
    
    // Release resources.
    void release()
    {
       _db.disconnect();
+      _snapshot_db.disconnect();
       _team_ranks.clear();
       _player_cache.clear();
       _team_cache.clear();
@@ -72,6 +145,23 @@ struct ranking_data {
 
 private:
 
+   // Copy of the team ranks taken while holding _team_ranks_mutex.
+   team_ranks_t snapshot_team_ranks();
+
+   // Update ranking with a ladder, does not use python, will lock _team_ranks_mutex.
+   update_stats_t update_with_members(id_t ladder_id,
+                                      id_t source_id,
+                                      enum_t region,
+                                      enum_t mode,
+                                      enum_t league,
+                                      enum_t tier,
+                                      enum_t version,
+                                      id_t season_id,
+                                      double data_time,
+                                      std::string date_date,
+                                      uint32_t team_size,
+                                      const members_t& members);
+   
    // The ranking data.
    team_ranks_t _team_ranks;
 
@@ -86,6 +176,12 @@ private:
    team_set_t _team_cache;
    
    db _db;
+
+   // Separate connection for saving snapshots, so that saving does not block merging.
+   db _snapshot_db;
    
    const boost::python::dict _enums_info;
+
+   // Race id by lower case race key, used when parsing json.
+   race_ids_t _race_ids;
 };
@@ -33,6 +33,7 @@ BOOST_PYTHON_MODULE(sc2)
 
    class_<purger, boost::noncopyable>("Purger", init<std::string>())
       .def("purge_removed_teams_from_ranking", &purger::purge_removed_teams_from_ranking)
+      .def("purge_removed_teams_from_rankings", &purger::purge_removed_teams_from_rankings)
       ;
    
    class_<ranking_data, boost::noncopyable>("RankingData", init<std::string, dict>())
@@ -40,7 +41,11 @@ BOOST_PYTHON_MODULE(sc2)
       .def("save_data", &ranking_data::save_data)
       .def("save_stats", &ranking_data::save_stats)
       .def("update_with_ladder", &ranking_data::update_with_ladder)
+      .def("update_with_ladder_json", &ranking_data::update_with_ladder_json)
       .def("min_max_data_time", &ranking_data::min_max_data_time)
+      .def("rollover", &ranking_data::rollover)
+      .def("preload", &ranking_data::preload)
+      .def("source_data_times", &ranking_data::source_data_times)
       .def("clear_team_ranks", &ranking_data::clear_team_ranks)
       .def("reconnect_db", &ranking_data::reconnect_db)
       .def("release", &ranking_data::release)
@@ -59,8 +64,12 @@ BOOST_PYTHON_MODULE(sc2)
    // Do not use the server but simulate a request to the ladder handler.   
    def("direct_ladder_handler_request_ladder", test_aid::direct_ladder_handler_request_ladder);
    def("direct_ladder_handler_request_clan", test_aid::direct_ladder_handler_request_clan);
+   def("direct_ladder_handler_request_export", test_aid::direct_ladder_handler_request_export);
 
    // Get ranking data as a python object, sorted in version, mode, world rank - order.
    def("get_team_ranks", test_aid::get_team_ranks);
+
+   // Parse ladder json as done in RankingData.update_with_ladder_json.
+   def("parse_ladder_members", test_aid::parse_ladder_members);
    
 }
@@ -69,6 +69,7 @@ int main(int argc, char *argv[])
       desc.add_options()
          ("db,d", po::value<string>()->default_value(DEFAULT_DB), "Database name to use.")
          ("keep-api-data-days,k", po::value<uint32_t>(), "Filter data older than this number of days, read from environment variable KEEP_API_DATA_DAYS if unset or default 14.")
+         ("export-dir,e", po::value<string>(), "Directory to write ladder exports to, read from environment variable EXPORT_DIR if unset, export is disabled if neither is set.")
          ("log,l", po::value<string>(), "Output log to file.")
          ("help,h", "Print help.")
          ;
@@ -98,6 +99,16 @@ int main(int argc, char *argv[])
       }
       LOG_INFO("keep_api_data_days is %d", keep_api_data_days);
 
+      string export_dir;
+      const char* export_dir_env = getenv("EXPORT_DIR");
+      if (export_dir_env != nullptr) {
+         export_dir = export_dir_env;
+      }
+      if (vm.count("export-dir")) {
+         export_dir = vm["export-dir"].as<string>();
+      }
+      LOG_INFO("export_dir is '%s'", export_dir.c_str());
+
       string db(vm["db"].as<string>());
       LOG_INFO("db is %s", db.c_str());
 
@@ -105,7 +116,7 @@ int main(int argc, char *argv[])
       boost::thread signal_handler_thread(signal_handler);
       
       tcp_handler tcp_handler(4747);
-      ladder_handler ladder_handler(db, keep_api_data_days);
+      ladder_handler ladder_handler(db, keep_api_data_days, export_dir);
 
       glo::status_server status_server("/server", 22200);
       
@@ -133,6 +144,9 @@ int main(int argc, char *argv[])
          else if (command == "clan") {
             response_data = ladder_handler.clan(request_data);
          }
+         else if (command == "export") {
+            response_data = ladder_handler.export_ladder(request_data);
+         }
          else if (command == "refresh") {
             response_data = ladder_handler.refresh(request_data);
          }
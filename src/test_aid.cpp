@@ -8,6 +8,7 @@
 #include "log.hpp"
 #include "ladder_handler.hpp"
 #include "compare.hpp"
+#include "ranking_data.hpp"
 
 using namespace boost::python;
 using namespace std;
@@ -97,6 +98,19 @@ test_aid::direct_ladder_handler_request_clan(const string& db_name, const string
    return writer.write(ladder_handler.clan(value));
 }
 
+string
+test_aid::direct_ladder_handler_request_export(const string& db_name, const string& export_dir, const string& request)
+{
+   ladder_handler ladder_handler(db_name, 14, export_dir);
+
+   Json::Reader reader;
+   Json::FastWriter writer;
+   Json::Value value;
+   reader.parse(request, value);
+   
+   return writer.write(ladder_handler.export_ladder(value));
+}
+
 boost::python::list
 test_aid::get_team_ranks(const std::string& db_name, id_t ranking_id, bool sort)
 {
@@ -144,3 +158,26 @@ test_aid::get_team_ranks(const std::string& db_name, id_t ranking_id, bool sort)
    return ranks;
 }
 
+
+boost::python::list
+test_aid::parse_ladder_members(const string& data, uint32_t team_size, const boost::python::dict& enums_info)
+{
+   boost::python::list res;
+   parse_stats_t parse_stats;
+   for (auto& m : ::parse_ladder_members(data, team_size, extract_race_ids(enums_info), parse_stats)) {
+      dict member;
+      member["bid"] = m.bid;
+      member["realm"] = m.realm;
+      member["name"] = m.name;
+      member["tag"] = m.tag;
+      member["clan"] = m.clan;
+      member["race"] = m.race;
+      member["mmr"] = m.mmr;
+      member["points"] = m.points;
+      member["wins"] = m.wins;
+      member["losses"] = m.losses;
+      member["join_time"] = m.join_time;
+      res.append(member);
+   }
+   return res;
+}
@@ -3,6 +3,7 @@
 #include <types.hpp>
 #include <iostream>
 #include <boost/python/list.hpp>
+#include <boost/python/dict.hpp>
 
 
 namespace test_aid
@@ -19,6 +20,13 @@ namespace test_aid
    std::string direct_ladder_handler_request_ladder(const std::string& db_name, const std::string& request);
    
    std::string direct_ladder_handler_request_clan(const std::string& db_name, const std::string& request);
+   
+   std::string direct_ladder_handler_request_export(const std::string& db_name, const std::string& export_dir,
+                                                    const std::string& request);
 
    boost::python::list get_team_ranks(const std::string& db_name, id_t team_rank_id, bool sort);
+
+   // Parse ladder json the same way as ranking_data::update_with_ladder_json, return members as python dicts.
+   boost::python::list parse_ladder_members(const std::string& data, uint32_t team_size,
+                                            const boost::python::dict& enums_info);
 };
@@ -3,6 +3,7 @@
 #include <stdint.h>
 #include <set>
 #include <map>
+#include <unordered_map>
 #include <vector>
 #include <iostream>
 #include <algorithm>
@@ -314,6 +315,21 @@ using teams_t =    std::vector<team_t>;
 using team_set_t = std::set<team_t, team_set_cmp>;
 using team_map_t = std::map<id_t, team_t>;
 
+//
+// Team members, the player data needed to display a team without looking it up in the db.
+//
+
+struct team_member_t {
+   id_t id;
+   enum_t realm;
+   bid_t bid;
+   std::string name;
+   std::string tag;
+};
+
+using team_member_list_t = std::vector<team_member_t>;
+using team_members_t = std::unordered_map<id_t, team_member_list_t>;  // By team id, in member0, member1.. order.
+
 //
 // Ranking.
 //
@@ -372,3 +388,46 @@ struct ranking_stats_t
 };
 
 using ranking_stats_list_t = std::vector<ranking_stats_t>;
+
+//
+// Id set.
+//
+
+// Compact set of ids, one bit per id from 0 to the largest id. Good for dense ids like team ids where a hash set would
+// use many times more memory.
+struct id_set_t
+{
+   id_set_t() : _count(0) {}
+
+   // Make room for ids up to max_id without reallocating.
+   void reserve(id_t max_id) {
+      if (max_id / 64 + 1 > _bits.size()) {
+         _bits.resize(max_id / 64 + 1, 0);
+      }
+   }
+
+   void insert(id_t id) {
+      reserve(id);
+      uint64_t& word = _bits[id / 64];
+      uint64_t bit = uint64_t(1) << (id % 64);
+      if (not (word & bit)) {
+         word |= bit;
+         ++_count;
+      }
+   }
+
+   bool contains(id_t id) const {
+      return id / 64 < _bits.size() and (_bits[id / 64] & (uint64_t(1) << (id % 64)));
+   }
+
+   size_t size() const { return _count; }
+
+   void clear() {
+      _bits.clear();
+      _count = 0;
+   }
+
+private:
+   std::vector<uint64_t> _bits;
+   size_t _count;
+};
@@ -11,3 +11,31 @@ uint64_t now_us();
 
 // Extract a cpp vector from an enum list with key key.
 std::vector<enum_t> extract_enum(const boost::python::object enums_info, const std::string& key);
+
+// Release the python GIL while in scope, no python objects may be touched while released.
+struct release_gil {
+
+   release_gil() : _state(PyEval_SaveThread()) {}
+
+   release_gil(const release_gil& other) = delete;
+
+   ~release_gil() { PyEval_RestoreThread(_state); }
+
+private:
+
+   PyThreadState* _state;
+};
+
+// Make sure the python GIL is held while in scope, works both if held or released.
+struct ensure_gil {
+
+   ensure_gil() : _state(PyGILState_Ensure()) {}
+
+   ensure_gil(const ensure_gil& other) = delete;
+
+   ~ensure_gil() { PyGILState_Release(_state); }
+
+private:
+
+   PyGILState_STATE _state;
+};
@@ -12,7 +12,7 @@ class Main(Command):
 
     def __init__(self):
         super().__init__("Delete rankings marked for deletion and unused cache data.",
-                         pid_file=True, stoppable=False)
+                         pid_file=True, stoppable=True)
         self.add_argument('--dry-run', dest="dry_run", action='store_true', default=False,
                           help="Print deletes do NOT PERFORM them.")
 
@@ -21,7 +21,7 @@ class Main(Command):
 
         data_deleter = DataDeleter(dry_run=args.dry_run)
         data_deleter.delete_old_rankings()
-        data_deleter.delete_old_cache_data(keep_days=3)
+        data_deleter.delete_old_cache_data(keep_days=3, check_stop=self.check_stop)
 
         return 0
 
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+# noinspection PyUnresolvedReferences
+import init_django
+
+from main.export import EXPORT_FORMATS, export_ladder, export_filename
+from tasks.base import Command
+
+
+class Main(Command):
+
+    def __init__(self):
+        super().__init__("Export the full LotV 1v1 ladder (with player data) using the ladder server.",
+                         pid_file=True, stoppable=True)
+
+        self.add_argument('--format', '-f', dest="formats", action='append', choices=sorted(EXPORT_FORMATS),
+                          help="Format to export, can be used multiple times, default is all formats.")
+
+    def run(self, args, logger):
+        for format in args.formats or sorted(EXPORT_FORMATS):
+            self.check_stop()
+            count = export_ladder(format)
+            logger.info("exported %d teams to %s", count, export_filename(format))
+
+        return 0
+
+
+if __name__ == '__main__':
+    Main()()
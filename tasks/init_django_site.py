@@ -0,0 +1,12 @@
+from django.conf import settings
+from django import setup
+from rocky import syspath
+
+# Like init_django but with site settings, for tasks that render site pages.
+
+syspath.add('..', __file__)
+syspath.add('../site', __file__)
+
+from common.settings import site_tasks_settings
+settings.configure(**site_tasks_settings())
+setup()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# noinspection PyUnresolvedReferences
+import init_django_site
+
+from time import sleep
+
+from common.cache import ranking_generation
+from main.prerender import prerender_ladders, PRERENDER_PAGES
+from tasks.base import Command
+
+
+class Main(Command):
+
+    def __init__(self):
+        super().__init__("Continously render the first pages of the ladders of the current version in the sitemap to"
+                         " static files, the ladders are fetched again every time a ranking is saved and the pages of"
+                         " changed ladders are rendered again.",
+                         pid_file=True, stoppable=True, pid_file_max_age=None)
+        self.add_argument('--pages', '-p', dest="pages", type=int, default=PRERENDER_PAGES,
+                          help="Number of pages to render for every ladder.")
+        self.add_argument('--once', dest="once", action='store_true', default=False,
+                          help="Render once and exit.")
+
+    def run(self, args, logger):
+        generation = None
+        digests = {}
+        while not self.check_stop(throw=False):
+            if generation != ranking_generation():
+                # Get generation before rendering to render again if a ranking is saved while rendering.
+                generation = ranking_generation()
+                prerender_ladders(args.pages, check_stop=self.check_stop, digests=digests)
+
+                if args.once:
+                    break
+
+            sleep(5)
+
+        return 0
+
+
+if __name__ == '__main__':
+    Main()()
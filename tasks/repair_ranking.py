@@ -7,8 +7,8 @@ from django.db import connection
 from tasks.base import Command
 from common.utils import to_unix, utcnow
 from lib import sc2
-from main.battle_net import ApiLadder
-from main.models import Ranking, get_db_name, Enums, Ladder, Mode, Cache
+from main.models import Ranking, get_db_name, Enums, Ladder
+from main.repair import replay_caches, repair_ranking_incremental
 
 
 class Main(Command):
@@ -20,6 +20,9 @@ class Main(Command):
                          pid_file=True, stoppable=True)
         self.add_argument('--ranking', '-r', dest="ranking_id", type=int, default=None,
                           help="Ranking id to repair.")
+        self.add_argument('--incremental', '-i', dest="incremental", action='store_true', default=False,
+                          help="Only replay caches that are missing or stale in the ranking data instead of building"
+                               " it from scratch.")
 
     def run(self, args, logger):
         logger.info("NOTE: fetching needs to be turned off if repairing latest rank")
@@ -29,59 +32,31 @@ class Main(Command):
         if ranking.status not in [Ranking.CREATED, Ranking.COMPLETE_WITH_DATA]:
             raise Exception("ranking with status %s can not be repaired" % ranking.status)
 
-        # If last in season use all available ladders, not only those connected to ranking.
-        last_in_season = Ranking.objects.filter(season=ranking.season).order_by('-id').first()
-        if last_in_season == ranking:
-            cursor = connection.cursor()
-            cursor.execute("SELECT id FROM ("
-                           "  SELECT DISTINCT ON (c.bid, c.region) c.id, c.updated FROM cache c JOIN ladder l"
-                           "    ON c.bid = l.bid AND c.region = l.region"
-                           "    WHERE l.strangeness = %s AND l.season_id = %s"
-                           "    ORDER BY c.bid, c.region, c.updated DESC) s"
-                           " ORDER by updated",
-                           [Ladder.GOOD, ranking.season_id])
-            cache_ids = [row[0] for row in cursor.fetchall()]
-            cursor.execute("UPDATE cache SET ranking_id = NULL WHERE ranking_id = %s", [ranking.id])
-        else:
-            cache_ids = [c['id'] for c in ranking.sources.values('id').order_by('updated')]
-
         cpp = sc2.RankingData(get_db_name(), Enums.INFO)
 
-        count = len(cache_ids)
-        for i, id_ in enumerate(cache_ids, start=1):
-            cache = Cache.objects.get(id=id_)
-            self.check_stop()
-            try:
-                ladder = Ladder.objects.get(season=ranking.season, region=cache.region, bid=cache.bid)
-            except Ladder.DoesNotExist:
-                raise Exception("ladder region %s, bid %s missing in ladder table" %
-                                (cache.region, cache.bid))
-
-            if cache.ranking is None and cache.ladder is None:
-                cache.ranking = ranking
-                cache.save()
-            elif cache.ranking != ranking:
-                logger.info("cache %s was not included in ranking copying" % cache.id)
-                cache.id = None
-                cache.ladder = None
-                cache.ranking = ranking
-                cache.save()
-
-            logger.info("adding cache %s, ladder %s, %d/%d" % (cache.id, ladder.id, i, count))
-
-            team_size = Mode.team_size(ladder.mode)
-            cpp.update_with_ladder(ladder.id,
-                                   cache.id,
-                                   ladder.region,
-                                   ladder.mode,
-                                   ladder.league,
-                                   ladder.tier,
-                                   ladder.version,
-                                   ladder.season_id,
-                                   to_unix(cache.updated),
-                                   cache.updated.date().isoformat(),
-                                   team_size,
-                                   ApiLadder(cache.data).members_for_ranking(team_size))
+        if args.incremental and ranking.status == Ranking.COMPLETE_WITH_DATA:
+            cpp.load(ranking.id)
+            if not repair_ranking_incremental(cpp, ranking, self.check_stop):
+                logger.info("ranking %d is complete, nothing to repair" % ranking.id)
+                return 0
+        else:
+            # If last in season use all available ladders, not only those connected to ranking.
+            last_in_season = Ranking.objects.filter(season=ranking.season).order_by('-id').first()
+            if last_in_season == ranking:
+                cursor = connection.cursor()
+                cursor.execute("SELECT id FROM ("
+                               "  SELECT DISTINCT ON (c.bid, c.region) c.id, c.updated FROM cache c JOIN ladder l"
+                               "    ON c.bid = l.bid AND c.region = l.region"
+                               "    WHERE l.strangeness = %s AND l.season_id = %s"
+                               "    ORDER BY c.bid, c.region, c.updated DESC) s"
+                               " ORDER by updated",
+                               [Ladder.GOOD, ranking.season_id])
+                cache_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute("UPDATE cache SET ranking_id = NULL WHERE ranking_id = %s", [ranking.id])
+            else:
+                cache_ids = [c['id'] for c in ranking.sources.values('id').order_by('updated')]
+
+            replay_caches(cpp, ranking, cache_ids, self.check_stop)
 
         ranking.set_data_time(ranking.season, cpp)
         ranking.save()
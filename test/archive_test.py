@@ -3,6 +3,7 @@ import os
 import json
 import shutil
 import tempfile
+from unittest.mock import patch
 
 from django.db import IntegrityError
 
@@ -10,7 +11,7 @@ import aid.test.init_django_sqlite
 
 from aid.test.base import DjangoTestCase
 from common.utils import utcnow
-from main.archive import DataArchiver
+from main.archive import DataArchiver, ArchiveReader, ArchiveWriter, index_filename
 from main.models import Season, Region, Cache, Ranking
 
 
@@ -186,7 +187,69 @@ class Test(DjangoTestCase):
         self.archiver.load_unused_cache_archive(filename)
         c = self.db.get(Cache, id=c.id)
         self.assertEqual(None, c.data)
-        
-    
 
-    
+    def test_archive_ranking_is_written_in_multiple_members_with_index(self):
+        r = self.db.create_ranking(
+            data_time=self.datetime(days=-101),
+            status=Ranking.COMPLETE_WITH_DATA,
+        )
+
+        caches = [self.db.create_cache(bid=bid, data={'bid': bid}, ranking=r) for bid in range(1, 8)]
+
+        with patch.object(ArchiveWriter, 'CHUNK_ROWS', 3):
+            self.archiver.archive_rankings()
+
+        filename = "%s/archive-ranking-%d.gz" % (self.tmp_dir, r.id)
+
+        with gzip.open(filename, mode='rb') as file:
+            rows = [json.loads(line.decode('utf-8')) for line in file]
+        self.assertEqual(r.id, rows[0]['ranking_id'])
+        self.assertEqual([c.id for c in caches], [row['id'] for row in rows[1:]])
+        self.assertEqual([{'bid': c.bid} for c in caches], [row['data'] for row in rows[1:]])
+
+        with gzip.open(index_filename(filename), mode='rb') as file:
+            index = json.loads(file.read().decode('utf-8'))
+        self.assertEqual(r.id, index['header']['ranking_id'])
+        self.assertEqual(4, len(index['members']))  # Header and 3 + 3 + 1 caches.
+        self.assertEqual([c.id for c in caches], [id for id, region, bid, type, member in index['caches']])
+
+        # Every member can be decompressed by itself.
+        with open(filename, 'rb') as file:
+            for id, region, bid, type, member in index['caches']:
+                offset, size = index['members'][member]
+                file.seek(offset)
+                lines = gzip.decompress(file.read(size)).decode('utf-8').splitlines()
+                self.assertIn(id, [json.loads(line)['id'] for line in lines])
+
+    def test_archive_reader_gets_single_caches_by_id_and_region_bid(self):
+        r = self.db.create_ranking(
+            data_time=self.datetime(days=-101),
+            status=Ranking.COMPLETE_WITH_DATA,
+        )
+
+        eu = [self.db.create_cache(region=Region.EU, bid=bid, data={'bid': bid}, ranking=r) for bid in range(1, 6)]
+        am = [self.db.create_cache(region=Region.AM, bid=bid, data={'bid': bid}, ranking=r) for bid in range(1, 4)]
+
+        with patch.object(ArchiveWriter, 'CHUNK_ROWS', 2):
+            self.archiver.archive_rankings()
+
+        filename = "%s/archive-ranking-%d.gz" % (self.tmp_dir, r.id)
+        reader = ArchiveReader(filename)
+        self.assertTrue(reader.has_index())
+        self.assertEqual(r.id, reader.header['ranking_id'])
+
+        c = reader.get(eu[3].id)
+        self.assertEqual(eu[3].id, c['id'])
+        self.assertEqual(4, c['bid'])
+        self.assertEqual({'bid': 4}, json.loads(c['data']))
+        self.assertIsNone(reader.get(max(c.id for c in am) + 1))
+
+        self.assertEqual([am[1].id], [c['id'] for c in reader.find(Region.AM, 2)])
+        self.assertEqual({c.id for c in am}, {c['id'] for c in reader.find(Region.AM)})
+
+        # Same result without index.
+        os.remove(index_filename(filename))
+        reader = ArchiveReader(filename)
+        self.assertFalse(reader.has_index())
+        self.assertEqual(eu[3].id, reader.get(eu[3].id)['id'])
+        self.assertEqual({c.id for c in am}, {c['id'] for c in reader.find(Region.AM)})
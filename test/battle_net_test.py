@@ -1,3 +1,4 @@
+import json
 from copy import deepcopy
 
 import aid.test.init_django_sqlite
@@ -7,8 +8,9 @@ from urllib.error import URLError
 from unittest.mock import Mock
 from aid.test.base import DjangoTestCase, MockBnetTestMixin
 from common.utils import utcnow, from_unix
-from main.battle_net import LocalStatus, ApiLadder, NO_MMR
-from main.models import Region, Race
+from main.battle_net import LocalStatus, ApiLadder, NO_MMR, NOT_MODIFIED
+from lib import sc2
+from main.models import Region, Race, Enums
 from test.api_data import API_LADDER_4V4, API_LADDER_1V1, LEGACY_API_LADDER_4V4, LEGACY_API_LADDER_1V1
 
 
@@ -54,8 +56,25 @@ class Test(MockBnetTestMixin, DjangoTestCase):
         self.assertEqual(LocalStatus.UNPARSABLE_JSON, status)
         self.assertEqual({'unparsable': "!!¤#%&¤/&"}, data)
 
+    def test_fetch_ladder_with_etag_handles_not_modified(self):
+        self.mock_raw_get(status=304)
+
+        res = self.bnet.fetch_ladder(self.region, 100, etag='"abc"')
+
+        self.assertEqual(NOT_MODIFIED, res.status)
+        self.assertEqual({'If-None-Match': '"abc"'}, self.bnet.raw_get.call_args[0][2])
+
 
 class TestApi(DjangoTestCase):
+
+    def test_ladder_text_is_compact_and_old_indented_text_is_readable(self):
+        text = ApiLadder(API_LADDER_1V1).to_text()
+
+        self.assertNotIn('\n', text)
+        self.assertNotIn(': ', text)
+        self.assertEqual(API_LADDER_1V1, json.loads(text))
+        self.assertEqual(ApiLadder(text).members_for_ranking(1),
+                         ApiLadder(json.dumps(API_LADDER_1V1, indent=4)).members_for_ranking(1))
     
     def test_parsing_of_1v1_ladder_works(self):
         al = ApiLadder(API_LADDER_1V1)
@@ -306,5 +325,27 @@ class TestApi(DjangoTestCase):
         self.assertEqual('123456789012', al.members_for_ranking(1)[0]['name'])
 
 
+class TestCppParsing(DjangoTestCase):
+
+    def assert_same_as_python(self, data, team_size):
+        self.assertEqual(ApiLadder(data).members_for_ranking(team_size),
+                         sc2.parse_ladder_members(json.dumps(data), team_size, Enums.INFO))
+
+    def test_game_data_ladders_are_parsed_the_same_as_python(self):
+        self.assert_same_as_python(API_LADDER_1V1, 1)
+        self.assert_same_as_python(API_LADDER_4V4, 4)
+
+    def test_legacy_ladders_are_parsed_the_same_as_python(self):
+        self.assert_same_as_python(LEGACY_API_LADDER_1V1, 1)
+        self.assert_same_as_python(LEGACY_API_LADDER_4V4, 4)
 
+    def test_names_are_truncated_on_characters_and_empty_members_are_skipped(self):
+        ladder = deepcopy(API_LADDER_1V1)
+        ladder['team'][0]['member'][0]['legacy_link']['name'] = 'ÅÄÖåäöÅÄÖåäöÅÄÖ#1234'
+        ladder['team'][0]['member'].append({})
+        self.assert_same_as_python(ladder, 1)
 
+    def test_mmr_bug_is_mitigated(self):
+        ladder = deepcopy(API_LADDER_1V1)
+        ladder['team'][0]['rating'] = 40000
+        self.assert_same_as_python(ladder, 1)
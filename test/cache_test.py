@@ -0,0 +1,152 @@
+import aid.test.init_django_sqlite
+
+import tempfile
+from threading import Thread, Event
+from unittest.mock import patch, Mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from aid.test.base import DjangoTestCase
+from common.cache import cache_value, cache_ranking_value, ranking_generation, bump_ranking_generation, _add_lock, \
+    _delete_lock, FILE_BASED_BACKEND, LOCK_TIMEOUT, RANKING_VALUE_TIMEOUT, GENERATION_TIMEOUT
+from main.models import RankingGeneration, Season
+
+
+class Test(DjangoTestCase):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.db.create_season()
+
+    def setUp(self):
+        super().setUp()
+        self.db.delete_all(keep=[Season])
+        cache.clear()
+        RankingGeneration.objects.all().delete()
+        self.now = 1000.0
+        self.patchers = [patch('common.cache.time', lambda: self.now),
+                         patch('common.cache.monotonic', lambda: self.now),
+                         patch('common.cache._generation', (0.0, None))]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super().tearDown()
+
+    def test_value_is_created_once_until_expired(self):
+        creator = Mock(side_effect=[1, 2])
+
+        self.assertEqual(1, cache_value('key', 10, creator))
+        self.now += 5
+        self.assertEqual(1, cache_value('key', 10, creator))
+        self.now += 6
+        self.assertEqual(2, cache_value('key', 10, creator))
+        self.assertEqual(2, creator.call_count)
+
+    def test_none_is_cached(self):
+        creator = Mock(return_value=None)
+
+        self.assertIsNone(cache_value('key', 10, creator, 1, a=2))
+        self.assertIsNone(cache_value('key', 10, creator, 1, a=2))
+        creator.assert_called_once_with(1, a=2)
+
+    def test_stale_value_is_returned_while_other_process_creates_new_value(self):
+        cache_value('key', 10, lambda: 1)
+        self.now += 11
+
+        cache.add('key__lock__', 1)
+        creator = Mock(return_value=2)
+
+        self.assertEqual(1, cache_value('key', 10, creator))
+        creator.assert_not_called()
+
+    def test_missing_value_is_waited_for_while_other_process_creates_it(self):
+        cache.add('key__lock__', 1)
+        creating = Event()
+
+        def create():
+            creating.wait()
+            cache.set('key', (self.now + 10, 1))
+            cache.delete('key__lock__')
+
+        thread = Thread(target=create)
+        thread.start()
+        creator = Mock(return_value=2)
+
+        with patch('common.cache.sleep', lambda seconds: creating.set()):
+            self.assertEqual(1, cache_value('key', 10, creator))
+
+        thread.join()
+        creator.assert_not_called()
+
+    def test_lock_is_released_when_creation_fails(self):
+        with self.assertRaises(ValueError):
+            cache_value('key', 10, Mock(side_effect=ValueError()))
+
+        self.assertEqual(3, cache_value('key', 10, lambda: 3))
+
+    def test_file_based_cache_lock_is_exclusive_and_removed_when_expired(self):
+        with tempfile.TemporaryDirectory() as location, \
+             override_settings(CACHES={'default': {'BACKEND': FILE_BASED_BACKEND, 'LOCATION': location}}):
+            self.assertTrue(_add_lock('key__lock__'))
+            self.assertFalse(_add_lock('key__lock__'))
+
+            self.now += LOCK_TIMEOUT + 1
+            self.assertFalse(_add_lock('key__lock__'))
+            self.assertTrue(_add_lock('key__lock__'))
+
+            _delete_lock('key__lock__')
+            self.assertTrue(_add_lock('key__lock__'))
+
+    def test_stale_value_is_returned_while_other_process_holds_file_based_cache_lock(self):
+        with tempfile.TemporaryDirectory() as location, \
+             override_settings(CACHES={'default': {'BACKEND': FILE_BASED_BACKEND, 'LOCATION': location}}):
+            cache_value('key', 10, lambda: 1)
+            self.now += 11
+
+            _add_lock('key__lock__')
+            creator = Mock(return_value=2)
+
+            self.assertEqual(1, cache_value('key', 10, creator))
+            creator.assert_not_called()
+
+    def test_ranking_value_is_created_again_when_generation_is_bumped_but_not_before(self):
+        creator = Mock(side_effect=[1, 2])
+
+        self.assertEqual(1, cache_ranking_value('key', creator))
+        self.now += 10
+        self.assertEqual(1, cache_ranking_value('key', creator))
+
+        generation = ranking_generation()
+        self.assertNotEqual(generation, bump_ranking_generation())
+
+        self.assertEqual(2, cache_ranking_value('key', creator))
+        self.assertEqual(2, creator.call_count)
+
+    def test_ranking_value_expires_after_ranking_value_timeout(self):
+        creator = Mock(side_effect=[1, 2])
+
+        self.assertEqual(1, cache_ranking_value('key', creator))
+        self.now += RANKING_VALUE_TIMEOUT + 1
+        self.assertEqual(2, cache_ranking_value('key', creator))
+
+    def test_ranking_generation_is_kept_when_cache_is_cleared(self):
+        generation = bump_ranking_generation()
+
+        cache.clear()
+        self.now += GENERATION_TIMEOUT
+
+        self.assertEqual(generation, ranking_generation())
+
+    def test_ranking_generation_bumped_by_other_process_is_seen_after_generation_timeout(self):
+        generation = ranking_generation()
+
+        RankingGeneration.objects.create(generation=generation + 1)
+
+        self.assertEqual(generation, ranking_generation())
+        self.now += GENERATION_TIMEOUT
+        self.assertEqual(generation + 1, ranking_generation())
@@ -0,0 +1,103 @@
+import aid.test.init_django_sqlite
+
+from aid.test.base import DjangoTestCase
+from main.battle_net import LocalStatus
+from main.models import Region
+from main.rate_limit import RateLimiter, parse_retry_after
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Test(DjangoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = Clock()
+        self.limiter = RateLimiter([Region.EU, Region.AM], clock=self.clock, sleep=self.clock.sleep)
+
+    def test_region_rate_is_respected(self):
+        rate = self.limiter.rate(Region.EU)
+        for i in range(int(rate)):
+            self.assertEqual(0, self.limiter.try_acquire(Region.EU))
+        self.assertAlmostEqual(1 / rate, self.limiter.try_acquire(Region.EU))
+
+        self.limiter.acquire(Region.EU)
+        self.assertAlmostEqual(1000 + 1 / rate, self.clock.now)
+
+    def test_global_rate_limits_all_regions(self):
+        bucket = self.limiter.regions[Region.EU].bucket
+        bucket.rate = bucket.burst = bucket.tokens = 100
+
+        acquired = 0
+        while self.limiter.try_acquire(Region.EU) == 0:
+            acquired += 1
+
+        self.assertEqual(RateLimiter.GLOBAL_RATE, acquired)
+        self.assertLess(0, self.limiter.try_acquire(Region.AM))
+
+    def test_throttling_decreases_rate_and_holds_region_until_retry_after(self):
+        rate = self.limiter.rate(Region.EU)
+
+        self.limiter.report(Region.EU, 503, retry_after=30)
+
+        self.assertAlmostEqual(rate * RateLimiter.THROTTLE_DECREASE, self.limiter.rate(Region.EU))
+        self.assertAlmostEqual(30, self.limiter.try_acquire(Region.EU))
+        self.assertEqual(0, self.limiter.try_acquire(Region.AM))
+
+        self.clock.sleep(30)
+        self.assertEqual(0, self.limiter.try_acquire(Region.EU))
+
+    def test_too_many_requests_holds_all_regions(self):
+        self.limiter.report(Region.EU, 429, retry_after=5)
+
+        self.assertAlmostEqual(5, self.limiter.try_acquire(Region.AM))
+
+    def test_successful_fetches_increases_rate_up_to_max(self):
+        rate = self.limiter.rate(Region.EU)
+
+        self.limiter.report(Region.EU, 200)
+        self.assertLess(rate, self.limiter.rate(Region.EU))
+
+        for i in range(10000):
+            self.limiter.report(Region.EU, 200)
+        self.assertEqual(RateLimiter.MAX_RATE, self.limiter.rate(Region.EU))
+
+    def test_stats_are_exported(self):
+        self.limiter.set_queue_depth(Region.EU, 17)
+        self.limiter.report(Region.EU, 200)
+        self.limiter.report(Region.EU, 503)
+        self.limiter.report(Region.EU, 500)
+        self.limiter.report(Region.EU, 600)
+
+        stats = self.limiter.stats()[Region.EU]
+        self.assertEqual(17, stats['queue_depth'])
+        self.assertEqual(4, stats['fetch_count'])
+        self.assertEqual(1, stats['throttle_count'])
+        self.assertEqual(1, stats['error_count'])
+        self.assertEqual(1, stats['local_error_count'])
+
+    def test_server_errors_decreases_rate_but_local_errors_does_not(self):
+        rate = self.limiter.rate(Region.EU)
+
+        for status in (LocalStatus.SOCKET_TIMEOUT, LocalStatus.CONNECTION_REFUSED, LocalStatus.UNPARSABLE_JSON):
+            self.limiter.report(Region.EU, status)
+        self.assertEqual(rate, self.limiter.rate(Region.EU))
+
+        self.limiter.report(Region.EU, 502)
+        self.assertAlmostEqual(rate * RateLimiter.ERROR_DECREASE, self.limiter.rate(Region.EU))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120, parse_retry_after("120"))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
@@ -0,0 +1,99 @@
+import aid.test.init_django_sqlite
+
+from aid.test.base import DjangoTestCase
+from aid.test.data import gen_api_ladder
+from common.utils import from_unix
+from main.models import Ladder, League, Mode, Region
+from main.schedule import LadderScheduler
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test(DjangoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = Clock()
+        self.scheduler = LadderScheduler(clock=self.clock)
+
+    def ladder(self, id, updated_ago=0, league=League.GOLD, mode=Mode.TEAM_1V1, member_count=100):
+        return Ladder(id=id, region=Region.EU, bid=id, league=league, mode=mode, member_count=member_count,
+                      updated=from_unix(self.clock.now - updated_ago))
+
+    def pop_all(self):
+        ladders = []
+        while True:
+            ladder = self.scheduler.pop()
+            if ladder is None:
+                return ladders
+            ladders.append(ladder.id)
+
+    def test_ladders_are_not_handed_out_before_they_are_due(self):
+        self.scheduler.update([self.ladder(1, updated_ago=10, league=League.GRANDMASTER),
+                               self.ladder(2, updated_ago=10)])
+
+        self.assertEqual([], self.pop_all())
+
+        self.clock.now += LadderScheduler.GM_INTERVAL
+        self.assertEqual([1], self.pop_all())
+
+    def test_most_overdue_ladder_is_handed_out_first(self):
+        self.scheduler.update([self.ladder(1, updated_ago=4000),
+                               self.ladder(2, updated_ago=3000, league=League.GRANDMASTER),
+                               self.ladder(3, updated_ago=700, league=League.PLATINUM),
+                               self.ladder(4, updated_ago=4000, member_count=0)])
+
+        self.assertEqual([2, 1, 3], self.pop_all())
+
+    def test_fetched_ladder_is_rescheduled_and_quiet_ladders_are_refreshed_less_often(self):
+        l1 = self.ladder(1, updated_ago=4000)
+        l2 = self.ladder(2, updated_ago=4000)
+        self.scheduler.update([l1, l2])
+        self.assertEqual([1, 2], self.pop_all())
+
+        api_ladder = gen_api_ladder(wins=10, losses=10)
+        self.scheduler.fetched(l1, 200, api_ladder)
+        self.scheduler.fetched(l2, 200, api_ladder)
+        self.assertEqual([], self.pop_all())
+
+        self.clock.now += LadderScheduler.REST_INTERVAL
+        self.assertEqual([1, 2], self.pop_all())
+
+        self.scheduler.fetched(l1, 200, api_ladder)
+        self.scheduler.fetched(l2, 200, gen_api_ladder(wins=100, losses=100))
+
+        self.clock.now += LadderScheduler.REST_INTERVAL
+        self.assertEqual([2], self.pop_all())
+
+        self.clock.now += LadderScheduler.REST_INTERVAL
+        self.assertEqual([1], self.pop_all())
+
+    def test_update_keeps_state_and_removes_missing_ladders(self):
+        self.scheduler.update([self.ladder(1, updated_ago=4000), self.ladder(2, updated_ago=4000)])
+        self.assertEqual(1, self.scheduler.pop().id)
+
+        self.scheduler.update([self.ladder(1, updated_ago=4000), self.ladder(3, updated_ago=4000)])
+
+        self.assertEqual([3], self.pop_all())
+        self.assertEqual(2, len(self.scheduler))
+
+    def test_forgotten_etag_is_not_used_and_ladder_is_due_now(self):
+        l1 = self.ladder(1, updated_ago=4000)
+        self.scheduler.update([l1])
+        self.assertEqual([1], self.pop_all())
+
+        self.scheduler.fetched(l1, 200, gen_api_ladder(), etag='"abc"')
+        self.assertEqual('"abc"', self.scheduler.etag(l1))
+        self.assertEqual([], self.pop_all())
+
+        self.scheduler.forget_etag(l1)
+
+        self.assertIsNone(self.scheduler.etag(l1))
+        self.assertEqual([1], self.pop_all())
@@ -0,0 +1,73 @@
+import aid.test.init_django_sqlite
+
+from aid.test.base import DjangoTestCase
+from main.models import Mode, Region, Player
+from main.search import search_players, count_players, encode_key, decode_key
+
+
+class Test(DjangoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db.delete_all()
+        self.s16 = self.db.create_season(id=16)
+        self.s17 = self.db.create_season(id=17)
+
+    def test_paging_by_key_returns_all_players_in_order(self):
+        for i, (season, mode, name, region) in enumerate([(self.s16, Mode.TEAM_1V1, 'sune', Region.EU),
+                                                          (self.s17, Mode.TEAM_1V1, 'sune', Region.EU),
+                                                          (self.s17, Mode.ARCHON, 'sune', Region.EU),
+                                                          (self.s17, Mode.TEAM_1V1, 'suneb', Region.EU),
+                                                          (self.s17, Mode.TEAM_1V1, 'sune', Region.KR),
+                                                          (self.s17, Mode.TEAM_1V1, 'SUNE', Region.AM),
+                                                          (self.s17, Mode.TEAM_1V1, 'sune', Region.EU)]):
+            self.db.create_player(bid=300 + i, season=season, mode=mode, name=name, region=region)
+        self.db.create_player(name='kuno')
+
+        expected = sorted(Player.objects.filter(name__istartswith='sune'),
+                          key=lambda p: (-p.season_id, p.name.upper(), p.mode, p.name, p.region, p.bid, p.id))
+        self.assertEqual(7, len(expected))
+
+        found = []
+        pages = []
+        key = None
+        for _ in range(4):
+            players, prev_key, key = search_players('SuNe', after=key, limit=2)
+            found += players
+            pages.append(players)
+            if key is None:
+                break
+            key = decode_key(encode_key(key))
+
+        self.assertIsNone(key)
+        self.assertEqual(expected, found)
+
+        # Page backwards from last page.
+
+        for page in reversed(pages[:-1]):
+            players, prev_key, next_key = search_players('SuNe', before=prev_key, limit=2)
+            self.assertEqual(page, players)
+
+        self.assertIsNone(prev_key)
+
+    def test_single_page_has_no_prev_or_next_key(self):
+        p = self.db.create_player(name='sune')
+
+        self.assertEqual(([p], None, None), search_players('sune', limit=1))
+        self.assertEqual(([], None, None), search_players('kuno', limit=1))
+
+    def test_invalid_keys_are_decoded_to_none(self):
+        self.assertIsNone(decode_key(''))
+        self.assertIsNone(decode_key('not-a-key'))
+        self.assertIsNone(decode_key(encode_key([1, 2, 3])))
+        self.assertIsNone(decode_key(encode_key([17, 11, 12, 0, 300, 1])))
+        self.assertEqual([17, 11, 'sune', 0, 300, 1], decode_key(encode_key([17, 11, 'sune', 0, 300, 1])))
+
+    def test_count_is_capped_at_limit(self):
+        for i, season in enumerate([self.s16, self.s17, self.s17]):
+            self.db.create_player(bid=300 + i, season=season, name='sune%d' % i)
+        self.db.create_player(name='kuno')
+
+        self.assertEqual(3, count_players('SuNe', 10))
+        self.assertEqual(2, count_players('SuNe', 2))
+        self.assertEqual(0, count_players('bune', 10))
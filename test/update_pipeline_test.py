@@ -0,0 +1,65 @@
+import aid.test.init_django_sqlite
+
+from queue import Queue
+from threading import Event
+from time import sleep
+
+from aid.test.base import DjangoTestCase
+from main.update import PipelineStage
+
+
+class Test(DjangoTestCase):
+
+    def test_stage_processes_items_and_forwards_results_that_are_not_none(self):
+        in_queue = Queue()
+        out_queue = Queue()
+        stage = PipelineStage('test', lambda i: None if i % 2 else i * 10, in_queue, out_queue)
+        stage.start()
+        try:
+            for i in range(6):
+                in_queue.put(i)
+            in_queue.join()
+        finally:
+            stage.stop()
+            stage.join()
+
+        self.assertEqual(6, stage.count)
+        self.assertTrue(stage.idle())
+        self.assertEqual([0, 20, 40], [out_queue.get_nowait() for _ in range(out_queue.qsize())])
+        self.assertIsNone(stage.error)
+
+    def test_full_out_queue_blocks_stage_until_consumed(self):
+        in_queue = Queue()
+        out_queue = Queue(maxsize=1)
+        stage = PipelineStage('test', lambda i: i, in_queue, out_queue)
+        stage.start()
+        try:
+            for i in range(3):
+                in_queue.put(i)
+            sleep(0.3)
+            self.assertTrue(out_queue.full())
+            self.assertFalse(stage.idle())
+            self.assertEqual([0, 1, 2], [out_queue.get(timeout=2) for _ in range(3)])
+            in_queue.join()
+        finally:
+            stage.stop()
+            stage.join()
+
+        self.assertEqual(3, stage.count)
+
+    def test_error_stops_stage_and_is_kept(self):
+        in_queue = Queue()
+        processed = Event()
+
+        def process(item):
+            processed.set()
+            raise ValueError("bad item")
+
+        stage = PipelineStage('test', process, in_queue)
+        stage.start()
+        in_queue.put(1)
+        stage.join(timeout=2)
+
+        self.assertTrue(processed.is_set())
+        self.assertFalse(stage.is_alive())
+        self.assertIsInstance(stage.error, ValueError)